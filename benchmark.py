@@ -0,0 +1,1145 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+"""
+性能基准测试脚本
+
+使用方法:
+    python benchmark.py decode --video path/to/video.mp4 --frame_skip 2
+
+子命令:
+    decode  对比逐帧seek读取与顺序流式解码的吞吐量
+    batch   对比逐帧推理与多帧批量推理 (process_frames) 的吞吐量
+    regen   从保存的MHR参数重建网格 (MeshRegenerator) 的吞吐量与误差
+    seqcodec  对已有的 process_video.py 输出测试 .mhrseq 各种顶点编码的压缩比与误差
+    cpu     纯CPU推理吞吐量 (线程数, fp32 与 bf16 对比)，可在无GPU的机器上运行
+    crop    对比逐人 cv2.warpAffine 与设备端批量裁剪 (BatchCropper) 的一致性和耗时
+    hands   对比左右手合并前向、跳过无效手部与分两次前向的一致性和耗时
+    decoder 中间层只计算关键点 (interm_keypoints_only) 前后的解码器耗时与一致性
+    keypoints  稀疏关键点回归器与稠密 keypoint_mapping 矩阵乘的耗时与误差 (只加载MHR头)
+    compile 姿态分支 torch.compile (人数分桶) 前后的稳态逐帧延迟
+    precision  fp32 / bf16 / fp16 推理在样例图片上的精度与延迟报告
+    kvcache 关键点提示重跑解码器时复用图像token K/V缓存前后的耗时与一致性
+    session 交互式提示会话 (open_session / refine) 的关键点修正延迟
+    earlyexit  身体解码器提前退出在各阈值下的平均层数、耗时与精度变化
+    export  export_model.py 导出的 TorchScript / ONNX 身体推理图与 eager 模式的启动时间和CPU吞吐量
+"""
+
+import argparse
+import os
+import time
+
+import pyrootutils
+
+root = pyrootutils.setup_root(
+    search_from=__file__,
+    indicator=[".git", "pyproject.toml", ".sl"],
+    pythonpath=True,
+    dotenv=True,
+)
+
+
+def _timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def _sync():
+    import torch
+
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+
+
+def _build_estimator(args, device=None, **model_kwargs):
+    """加载模型与可选模块，构建估计器"""
+    import torch
+    from sam_3d_body import load_sam_3d_body, SAM3DBodyEstimator
+
+    if device is None:
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+    device = torch.device(device)
+    mhr_path = args.mhr_path or os.environ.get("SAM3D_MHR_PATH", "")
+    model, model_cfg = load_sam_3d_body(
+        args.checkpoint_path, device=device, mhr_path=mhr_path, **model_kwargs
+    )
+
+    human_detector = None
+    if args.detector_name:
+        from tools.build_detector import HumanDetector
+
+        human_detector = HumanDetector(
+            name=args.detector_name, device=device, path=args.detector_path
+        )
+
+    return SAM3DBodyEstimator(
+        sam_3d_body_model=model,
+        model_cfg=model_cfg,
+        human_detector=human_detector,
+    )
+
+
+def _load_video_frames(video_path, num_frames, frame_skip=0):
+    from tools.video_io import VideoFrameReader
+
+    with VideoFrameReader(video_path) as reader:
+        frame_indices = reader.frame_range(0, -1, frame_skip)[:num_frames]
+        return [frame for _, frame in reader.read_frames(frame_indices)]
+
+
+def benchmark_decode(args):
+    """对比逐帧seek与顺序解码的帧读取吞吐量"""
+    from tools.video_io import read_frames_with_seek, VideoFrameReader
+
+    with VideoFrameReader(args.video) as reader:
+        frames_to_process = reader.frame_range(
+            args.start_frame, args.end_frame, args.frame_skip
+        )
+        print(
+            f"视频: {reader.width}x{reader.height}, {reader.total_frames}帧, "
+            f"读取 {len(frames_to_process)} 帧 (跳帧: {args.frame_skip})"
+        )
+
+    def consume(frames):
+        return sum(1 for _ in frames)
+
+    num_seek, t_seek = _timed(
+        consume, read_frames_with_seek(args.video, frames_to_process)
+    )
+    with VideoFrameReader(args.video) as reader:
+        num_seq, t_seq = _timed(consume, reader.read_frames(frames_to_process))
+
+    print(f"逐帧seek:   {num_seek} 帧, {t_seek:.2f}s, {num_seek / t_seek:.1f} 帧/秒")
+    print(f"顺序解码:   {num_seq} 帧, {t_seq:.2f}s, {num_seq / t_seq:.1f} 帧/秒")
+    print(f"加速比: {t_seek / t_seq:.2f}x")
+
+
+def benchmark_batch(args):
+    """对比逐帧推理与多帧批量推理的吞吐量"""
+    from tools.video_io import iter_batches
+
+    estimator = _build_estimator(args)
+    frames = _load_video_frames(args.video, args.num_frames, args.frame_skip)
+    print(f"读取 {len(frames)} 帧")
+
+    # 预热
+    estimator.process_one_image(frames[0])
+
+    _sync()
+    start = time.perf_counter()
+    for frame in frames:
+        estimator.process_one_image(frame)
+    _sync()
+    t_single = time.perf_counter() - start
+    print(f"逐帧推理:        {len(frames) / t_single:.2f} 帧/秒")
+
+    for batch_size in args.batch_sizes:
+        estimator.process_frames(frames[:batch_size])
+        _sync()
+        start = time.perf_counter()
+        for frame_batch in iter_batches(frames, batch_size):
+            estimator.process_frames(frame_batch)
+        _sync()
+        t_batch = time.perf_counter() - start
+        print(
+            f"批量推理 (B={batch_size:2d}): {len(frames) / t_batch:.2f} 帧/秒, "
+            f"加速比 {t_single / t_batch:.2f}x"
+        )
+
+
+def benchmark_regen(args):
+    """从MHR参数批量重建网格，与模型直接输出对比误差和吞吐量"""
+    import copy
+
+    import numpy as np
+    from sam_3d_body import MeshRegenerator
+    from sam_3d_body.mesh_regenerator import MESH_KEYS, strip_mesh
+
+    estimator = _build_estimator(args)
+    frames = _load_video_frames(args.video, args.num_frames, args.frame_skip)
+    outputs = estimator.process_frames(frames)
+    height, width = frames[0].shape[:2]
+    num_people = sum(len(out) for out in outputs)
+    print(f"读取 {len(frames)} 帧, 共 {num_people} 人")
+
+    regenerator = MeshRegenerator.from_model(estimator.model)
+    stripped = [strip_mesh(out) for out in outputs]
+    _sync()
+    start = time.perf_counter()
+    repeats = max(args.repeats, 1)
+    for _ in range(repeats):
+        regenerated = regenerator.fill_outputs(
+            copy.deepcopy(stripped), image_size=(width, height)
+        )
+    _sync()
+    t_regen = (time.perf_counter() - start) / repeats
+    print(f"重建耗时: {t_regen:.3f}s, {num_people / t_regen:.1f} 人/秒")
+
+    for key in MESH_KEYS:
+        diff = max(
+            float(np.abs(orig[key] - regen[key]).max())
+            for orig_frame, regen_frame in zip(outputs, regenerated)
+            for orig, regen in zip(orig_frame, regen_frame)
+        )
+        print(f"{key:<20s} 最大误差: {diff:.2e}")
+
+
+def benchmark_seqcodec(args):
+    """对比 JSON / raw / delta (+zstd) 序列编码的体积、误差与随机读取速度"""
+    import json
+    import random
+    import tempfile
+    from pathlib import Path
+
+    import numpy as np
+    from convert_mhrseq import convert_folder, list_frames
+    from tools.mhr_io import load_sequence
+
+    mhr_folder = Path(args.mhr_folder)
+    frames, _ = list_frames(mhr_folder)
+    json_size = sum(path.stat().st_size for _, path in frames)
+    print(f"{len(frames)} 帧, JSON总大小: {json_size / 1e6:.1f}MB")
+
+    # 原始顶点 (float64 JSON文本解析)
+    reference = {}
+    for frame_idx, path in frames:
+        with open(path, "r") as f:
+            people = json.load(f)["people"]
+        reference[frame_idx] = [np.asarray(p["mesh"]["vertices"]) for p in people]
+
+    configs = [("raw", dict(vertex_encoding="raw"))]
+    for interval in args.keyframe_intervals:
+        configs.append(
+            (
+                f"delta K={interval}",
+                dict(
+                    vertex_encoding="delta",
+                    keyframe_interval=interval,
+                    max_error=args.max_vertex_error,
+                ),
+            )
+        )
+        if args.zstd:
+            configs.append(
+                (
+                    f"delta K={interval} +zstd",
+                    dict(
+                        vertex_encoding="delta",
+                        keyframe_interval=interval,
+                        max_error=args.max_vertex_error,
+                        compression="zstd",
+                    ),
+                )
+            )
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for name, kwargs in configs:
+            seq_path = Path(tmpdir) / "sequence.mhrseq"
+            convert_folder(mhr_folder, seq_path, args.dtype, **kwargs)
+            seq = load_sequence(seq_path)
+
+            max_error = 0.0
+            for i, frame_idx in enumerate(seq.frame_indices):
+                decoded = seq.frame_arrays(i).get("vertices")
+                for ref, dec in zip(reference[frame_idx], decoded):
+                    max_error = max(max_error, float(np.abs(ref - dec).max()))
+
+            order = list(range(len(seq)))
+            random.shuffle(order)
+            start = time.perf_counter()
+            for i in order:
+                seq.frame_arrays(i)
+            t_read = (time.perf_counter() - start) / max(len(order), 1)
+
+            size = seq_path.stat().st_size
+            print(
+                f"{name:<20s} {size / 1e6:8.2f}MB  压缩比 {json_size / size:7.1f}x  "
+                f"最大顶点误差 {max_error * 1000:.3f}mm  随机读取 {t_read * 1000:.2f}ms/帧"
+            )
+            del seq
+
+
+def benchmark_cpu(args):
+    """CPU推理吞吐量: 不同线程数下的 fp32，以及可选的 bf16 骨干网络"""
+    import numpy as np
+    from sam_3d_body.utils.cpu import configure_cpu_inference, cpu_supports_bf16
+    from tools.video_io import iter_batches
+
+    estimator = _build_estimator(args, device="cpu")
+    model = estimator.model
+    frames = _load_video_frames(args.video, args.num_frames, args.frame_skip)
+    print(f"读取 {len(frames)} 帧, 批大小: {args.batch_size}")
+
+    def run():
+        outputs = []
+        for frame_batch in iter_batches(frames, args.batch_size):
+            outputs.extend(estimator.process_frames(frame_batch))
+        return outputs
+
+    reference = None
+    for num_threads in args.threads:
+        num_threads = configure_cpu_inference(model, num_threads=num_threads)
+        model.backbone_autocast_dtype = None
+        estimator.process_frames(frames[: args.batch_size])  # 预热
+        outputs, elapsed = _timed(run)
+        reference = reference or outputs
+        print(f"fp32 线程数 {num_threads:3d}: {len(frames) / elapsed:.2f} 帧/秒")
+
+    if not args.bf16:
+        return
+    if not cpu_supports_bf16():
+        print("当前CPU不支持 bf16 (AVX512-BF16/AMX)，跳过")
+        return
+    configure_cpu_inference(model, num_threads=args.threads[-1], bf16=True)
+    estimator.process_frames(frames[: args.batch_size])  # 预热
+    outputs, elapsed = _timed(run)
+    diff = max(
+        (
+            float(np.abs(ref["pred_vertices"] - out["pred_vertices"]).max())
+            for ref_frame, out_frame in zip(reference, outputs)
+            for ref, out in zip(ref_frame, out_frame)
+        ),
+        default=0.0,
+    )
+    print(
+        f"bf16 线程数 {args.threads[-1]:3d}: {len(frames) / elapsed:.2f} 帧/秒, "
+        f"与fp32的最大顶点误差 {diff * 1000:.2f}mm"
+    )
+
+
+def benchmark_crop(args):
+    """设备端批量裁剪与 cv2 逐人裁剪的一致性检查和耗时对比"""
+    import numpy as np
+    import torch
+    from sam_3d_body.data.transforms import (
+        Compose,
+        GetBBoxCenterScale,
+        TopdownAffine,
+        VisionTransformWrapper,
+    )
+    from sam_3d_body.data.utils.batch_crop import BatchCropper
+    from sam_3d_body.data.utils.prepare_batch import prepare_batch_multi
+    from torchvision.transforms import ToTensor
+
+    device = torch.device(
+        args.device or ("cuda" if torch.cuda.is_available() else "cpu")
+    )
+    frames = _load_video_frames(args.video, args.num_frames, args.frame_skip)
+    height, width = frames[0].shape[:2]
+    print(
+        f"读取 {len(frames)} 帧 ({width}x{height}), 每帧 {args.num_people} 人, "
+        f"设备: {device}"
+    )
+
+    # 随机生成落在图像内 (允许部分越界) 的检测框
+    rng = np.random.default_rng(0)
+    boxes_list = []
+    for _ in frames:
+        size = rng.uniform(0.1, 0.6, (args.num_people, 2)) * [width, height]
+        x1y1 = rng.uniform(-0.1, 0.9, (args.num_people, 2)) * [width, height]
+        boxes_list.append(np.hstack([x1y1, x1y1 + size]).astype(np.float32))
+
+    input_size = tuple(args.input_size)
+    for name, padding in [("body", 1.25), ("hand", 0.9)]:
+        transform = Compose(
+            [
+                GetBBoxCenterScale(padding=padding),
+                TopdownAffine(input_size=input_size, use_udp=False),
+                VisionTransformWrapper(ToTensor()),
+            ]
+        )
+        cropper = BatchCropper(input_size, padding=padding)
+        for flip in [False, True] if name == "hand" else [False]:
+            imgs = [f[:, ::-1] for f in frames] if flip else frames
+
+            def run_cv2():
+                batches = []
+                for i in range(0, len(imgs), args.batch_size):
+                    batch = prepare_batch_multi(
+                        imgs[i : i + args.batch_size],
+                        transform,
+                        boxes_list[i : i + args.batch_size],
+                    )
+                    batches.append(
+                        {k: v.to(device) for k, v in batch.items() if torch.is_tensor(v)}
+                    )
+                _sync()
+                return batches
+
+            def run_device():
+                batches = []
+                for i in range(0, len(frames), args.batch_size):
+                    uploaded = BatchCropper.upload(frames[i : i + args.batch_size], device)
+                    batches.append(
+                        cropper.crop(
+                            uploaded, boxes_list[i : i + args.batch_size], flip=flip
+                        )
+                    )
+                _sync()
+                return batches
+
+            run_cv2(), run_device()  # 预热
+            ref, t_cv2 = _timed(run_cv2)
+            out, t_device = _timed(run_device)
+            label = f"{name}{' (flip)' if flip else ''}"
+            print(
+                f"{label:<12s} cv2: {t_cv2 / len(frames) * 1000:7.2f}ms/帧  "
+                f"设备端: {t_device / len(frames) * 1000:7.2f}ms/帧  "
+                f"加速比 {t_cv2 / t_device:.2f}x"
+            )
+            for key in ["affine_trans", "bbox_center", "bbox_scale", "img"]:
+                diff = max(float((r[key] - o[key]).abs().max()) for r, o in zip(ref, out))
+                scale = 255.0 if key == "img" else 1.0
+                print(f"    {key:<14s} 最大误差: {diff * scale:.2e}")
+
+
+def _compare_outputs(reference, outputs, keys):
+    """两组 process_frames 输出中各字段的最大差异"""
+    import numpy as np
+
+    return {
+        key: max(
+            (
+                float(np.abs(np.asarray(ref[key]) - np.asarray(out[key])).max())
+                for ref_frame, out_frame in zip(reference, outputs)
+                for ref, out in zip(ref_frame, out_frame)
+            ),
+            default=0.0,
+        )
+        for key in keys
+    }
+
+
+def benchmark_hands(args):
+    """左右手合并前向 (fuse_hands) / 手部细化策略 (hand_refine) 与分别前向的一致性和耗时"""
+    from tools.video_io import iter_batches
+
+    estimator = _build_estimator(args)
+    frames = _load_video_frames(args.video, args.num_frames, args.frame_skip)
+    print(f"读取 {len(frames)} 帧, 批大小: {args.batch_size}")
+
+    def run():
+        outputs = []
+        for frame_batch in iter_batches(frames, args.batch_size):
+            outputs.extend(estimator.process_frames(frame_batch))
+        _sync()
+        return outputs
+
+    configs = [
+        ("分别前向", False, "always"),
+        ("合并前向", True, "always"),
+        ("合并前向+跳过", True, "auto"),
+    ]
+    results = {}
+    for label, fuse_hands, hand_refine in configs:
+        estimator.fuse_hands = fuse_hands
+        estimator.hand_refine = hand_refine
+        estimator.process_frames(frames[: args.batch_size])  # 预热
+        estimator.hand_stats = {"hand_crops": 0, "skipped": 0}
+        results[label], elapsed = _timed(run)
+        print(
+            f"{label}: {len(frames) / elapsed:.2f} 帧/秒, "
+            f"跳过手部裁剪 {estimator.hand_stats['skipped']}"
+            f"/{estimator.hand_stats['hand_crops']}"
+        )
+
+    for label, _, _ in configs[1:]:
+        diffs = _compare_outputs(
+            results[configs[0][0]],
+            results[label],
+            ["pred_vertices", "pred_keypoints_2d", "hand_pose_params", "scale_params"],
+        )
+        for key, diff in diffs.items():
+            print(f"{label} {key:<20s} 最大误差: {diff:.2e}")
+
+
+def _time_calls(obj, names, timings):
+    """包装 obj 的方法，把每次调用的耗时 (同步后) 累加到 timings[name]"""
+
+    def wrap(name, fn):
+        def timed(*args, **kwargs):
+            _sync()
+            start = time.perf_counter()
+            result = fn(*args, **kwargs)
+            _sync()
+            timings[name].append(time.perf_counter() - start)
+            return result
+
+        return timed
+
+    for name in names:
+        timings[name] = []
+        setattr(obj, name, wrap(name, getattr(obj, name)))
+
+
+def benchmark_decoder(args):
+    """中间层解码输出只计算关键点 (不输出顶点) 前后的解码器耗时"""
+    from tools.video_io import iter_batches
+
+    estimator = _build_estimator(args)
+    model = estimator.model
+    frames = _load_video_frames(args.video, args.num_frames, args.frame_skip)
+    print(f"读取 {len(frames)} 帧, 批大小: {args.batch_size}")
+
+    timings = {}
+    _time_calls(model, ["forward_decoder", "forward_decoder_hand"], timings)
+
+    results = {}
+    for keypoints_only in [False, True]:
+        model.interm_keypoints_only = keypoints_only
+        estimator.process_frames(frames[: args.batch_size])  # 预热
+        for times in timings.values():
+            times.clear()
+        outputs = []
+        for frame_batch in iter_batches(frames, args.batch_size):
+            outputs.extend(estimator.process_frames(frame_batch))
+        results[keypoints_only] = outputs
+        label = "只计算关键点" if keypoints_only else "完整MHR"
+        for name, times in timings.items():
+            if times:
+                print(
+                    f"{label} {name:<22s} {len(times):4d} 次, "
+                    f"平均 {sum(times) / len(times) * 1000:7.2f}ms"
+                )
+
+    diffs = _compare_outputs(
+        results[False],
+        results[True],
+        ["pred_vertices", "pred_keypoints_2d", "body_pose_params", "hand_pose_params"],
+    )
+    for key, diff in diffs.items():
+        print(f"{key:<20s} 最大误差: {diff:.2e}")
+
+
+def benchmark_keypoints(args):
+    """稀疏关键点回归器 (keypoint_regressor) 与稠密 308 x N 矩阵乘的对比"""
+    import torch
+    from sam_3d_body.build_models import load_mhr_head
+
+    mhr_path = args.mhr_path or os.environ.get("SAM3D_MHR_PATH", "")
+    devices = args.devices or (["cpu", "cuda"] if torch.cuda.is_available() else ["cpu"])
+    for device in devices:
+        head = load_mhr_head(args.checkpoint_path, mhr_path, device)
+        mapping = head.keypoint_mapping
+        vert_idx, joint_idx, weights = head.keypoint_regressor()
+        print(
+            f"[{device}] keypoint_mapping {tuple(mapping.shape)}, 非零 "
+            f"{int((mapping != 0).sum())}; 前 {weights.shape[0]} 个关键点引用 "
+            f"{len(vert_idx)} 个顶点 + {len(joint_idx)} 个关节"
+        )
+
+        # 随机姿态/体型下的顶点与关节
+        torch.manual_seed(0)
+        n = args.batch_size
+        with torch.no_grad():
+            verts, jcoords = head.mhr_forward(
+                global_trans=torch.zeros(n, 3, device=device),
+                global_rot=torch.randn(n, 3, device=device) * 0.1,
+                body_pose_params=torch.randn(n, 133, device=device) * 0.1,
+                hand_pose_params=torch.randn(n, 108, device=device) * 0.1,
+                scale_params=torch.randn(n, 28, device=device) * 0.1,
+                shape_params=torch.randn(n, 45, device=device) * 0.1,
+                return_joint_coords=True,
+            )
+
+        def dense():
+            points = torch.cat([verts, jcoords], dim=1)
+            out = (
+                (mapping @ points.permute(1, 0, 2).flatten(1, 2))
+                .reshape(-1, n, 3)
+                .permute(1, 0, 2)
+            )
+            return out[:, : weights.shape[0]]
+
+        def sparse():
+            vert_idx, joint_idx, weights = head.keypoint_regressor()
+            return weights @ torch.cat(
+                [verts[:, vert_idx], jcoords[:, joint_idx]], dim=1
+            )
+
+        results = {}
+        for name, fn in [("稠密", dense), ("稀疏", sparse)]:
+            with torch.no_grad():
+                fn()  # 预热
+                if device == "cuda":
+                    torch.cuda.synchronize()
+                start = time.perf_counter()
+                for _ in range(args.repeats):
+                    results[name] = fn()
+                if device == "cuda":
+                    torch.cuda.synchronize()
+            elapsed = (time.perf_counter() - start) / args.repeats
+            print(f"[{device}] {name} (B={n}): {elapsed * 1000:8.3f}ms")
+        diff = float((results["稠密"] - results["稀疏"]).abs().max())
+        print(f"[{device}] 最大误差: {diff:.2e}")
+
+
+def benchmark_compile(args):
+    """eager 与 torch.compile 姿态分支的稳态逐帧延迟 (中位数 / P90)"""
+    import numpy as np
+
+    estimator = _build_estimator(args)
+    model = estimator.model
+    frames = _load_video_frames(args.video, args.num_frames, args.frame_skip)
+    print(f"读取 {len(frames)} 帧")
+
+    def run():
+        outputs, latencies = [], []
+        for frame in frames:
+            start = time.perf_counter()
+            outputs.extend(estimator.process_frames([frame]))
+            _sync()
+            latencies.append((time.perf_counter() - start) * 1000)
+        return outputs, np.array(latencies)
+
+    estimator.process_frames(frames[:1])  # 预热
+    results = {"eager": run()}
+
+    _, compile_time = _timed(
+        model.compile_pose_branch, tuple(args.buckets), mode=args.compile_mode
+    )
+    print(f"编译与预热耗时: {compile_time:.1f}s (人数分桶: {tuple(args.buckets)})")
+    estimator.process_frames(frames[:1])
+    results["compile"] = run()
+
+    for name, (_, latencies) in results.items():
+        print(
+            f"{name:<8s} 中位数 {np.median(latencies):7.2f}ms  "
+            f"P90 {np.percentile(latencies, 90):7.2f}ms  "
+            f"({1000 / np.median(latencies):.2f} 帧/秒)"
+        )
+    diffs = _compare_outputs(
+        results["eager"][0],
+        results["compile"][0],
+        ["pred_vertices", "pred_keypoints_2d"],
+    )
+    for key, diff in diffs.items():
+        print(f"{key:<20s} 最大误差: {diff:.2e}")
+
+
+def benchmark_precision(args):
+    """不同推理精度在样例图片上的延迟与相对fp32的误差 (Markdown表格)"""
+    import gc
+    from pathlib import Path
+
+    import cv2
+    import numpy as np
+    import torch
+
+    image_paths = []
+    for path in map(Path, args.images):
+        image_paths += sorted(path.glob("*.jpg")) if path.is_dir() else [path]
+    images = [cv2.cvtColor(cv2.imread(str(p)), cv2.COLOR_BGR2RGB) for p in image_paths]
+    print(f"读取 {len(images)} 张图片")
+
+    results = {}
+    for precision in args.precisions:
+        estimator = _build_estimator(args, precision=precision)
+        estimator.process_one_image(images[0])  # 预热
+        outputs, latencies = [], []
+        for img in images:
+            for _ in range(args.repeats):
+                _sync()
+                start = time.perf_counter()
+                output = estimator.process_one_image(img)
+                _sync()
+                latencies.append((time.perf_counter() - start) * 1000)
+            outputs.append(output)
+        results[precision] = (outputs, np.median(latencies))
+        del estimator
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    reference = results.get("fp32", results[args.precisions[0]])[0]
+    lines = [
+        "| 精度 | 延迟中位数 (ms) | 顶点误差 平均/最大 (mm) | 2D关键点误差 平均/最大 (px) |",
+        "|---|---|---|---|",
+    ]
+    for precision, (outputs, latency) in results.items():
+        vert_err, kp_err = [], []
+        for ref_frame, out_frame in zip(reference, outputs):
+            for ref, out in zip(ref_frame, out_frame):
+                vert_err.append(
+                    np.linalg.norm(ref["pred_vertices"] - out["pred_vertices"], axis=-1)
+                )
+                kp_err.append(
+                    np.linalg.norm(
+                        ref["pred_keypoints_2d"] - out["pred_keypoints_2d"], axis=-1
+                    )
+                )
+        vert_err = np.concatenate(vert_err) * 1000 if vert_err else np.zeros(1)
+        kp_err = np.concatenate(kp_err) if kp_err else np.zeros(1)
+        lines.append(
+            f"| {precision} | {latency:.1f} | {vert_err.mean():.2f} / {vert_err.max():.2f} "
+            f"| {kp_err.mean():.2f} / {kp_err.max():.2f} |"
+        )
+    report = "\n".join(lines)
+    print(report)
+    if args.report:
+        Path(args.report).write_text(report + "\n")
+        print(f"报告已保存到: {args.report}")
+
+
+def _add_model_args(parser):
+    parser.add_argument(
+        "--checkpoint_path",
+        default="./checkpoints/sam-3d-body-dinov3/model.ckpt",
+        type=str,
+        help="SAM 3D Body模型检查点路径",
+    )
+    parser.add_argument(
+        "--mhr_path",
+        default="./checkpoints/sam-3d-body-dinov3/assets/mhr_model.pt",
+        type=str,
+        help="MHR资源路径",
+    )
+    parser.add_argument(
+        "--detector_name", default="vitdet", type=str, help="人体检测模型名称"
+    )
+    parser.add_argument("--detector_path", default="", type=str, help="人体检测模型路径")
+
+
+def benchmark_kvcache(args):
+    """关键点提示重跑解码器时复用图像token交叉注意力K/V缓存前后的耗时与一致性"""
+    from tools.video_io import iter_batches
+
+    estimator = _build_estimator(args)
+    model = estimator.model
+    frames = _load_video_frames(args.video, args.num_frames, args.frame_skip)
+    print(f"读取 {len(frames)} 帧, 批大小: {args.batch_size}")
+
+    timings = {}
+    _time_calls(model, ["forward_decoder", "run_keypoint_prompt"], timings)
+
+    results = {}
+    for use_cache in [False, True]:
+        model.decoder_kv_cache = use_cache
+        estimator.process_frames(frames[: args.batch_size])  # 预热
+        for times in timings.values():
+            times.clear()
+        outputs = []
+        for frame_batch in iter_batches(frames, args.batch_size):
+            outputs.extend(estimator.process_frames(frame_batch))
+        results[use_cache] = outputs
+        label = "K/V缓存" if use_cache else "不缓存"
+        for name, times in timings.items():
+            if times:
+                print(
+                    f"{label} {name:<22s} {len(times):4d} 次, "
+                    f"平均 {sum(times) / len(times) * 1000:7.2f}ms"
+                )
+
+    diffs = _compare_outputs(
+        results[False],
+        results[True],
+        ["pred_vertices", "pred_keypoints_2d", "body_pose_params", "hand_pose_params"],
+    )
+    for key, diff in diffs.items():
+        print(f"{key:<20s} 最大误差: {diff:.2e}")
+
+
+def benchmark_session(args):
+    """交互式提示会话: 打开会话的耗时与单次关键点修正 (refine) 的延迟"""
+    from pathlib import Path
+
+    import cv2
+    import numpy as np
+
+    image_paths = []
+    for path in map(Path, args.images):
+        image_paths += sorted(path.glob("*.jpg")) if path.is_dir() else [path]
+    images = [cv2.cvtColor(cv2.imread(str(p)), cv2.COLOR_BGR2RGB) for p in image_paths]
+    print(f"读取 {len(images)} 张图片")
+
+    estimator = _build_estimator(args)
+    estimator.process_one_image(images[0])  # 预热
+    full_times, open_times, refine_times = [], [], []
+    for img in images:
+        _, elapsed = _timed(estimator.process_one_image, img)
+        full_times.append(elapsed * 1000)
+        _sync()
+        session, elapsed = _timed(estimator.open_session, img)
+        _sync()
+        open_times.append(elapsed * 1000)
+        if session is None:
+            continue
+        for click in range(args.clicks):
+            person_id = click % session.num_persons
+            kp2d = session.outputs[person_id]["pred_keypoints_2d"]
+            # 模拟用户把一个手腕关键点拖动几个像素
+            kp_idx = [41, 62][click % 2]
+            keypoints = np.array([[*(kp2d[kp_idx] + args.offset), kp_idx]])
+            _sync()
+            start = time.perf_counter()
+            session.refine(person_id, keypoints)
+            _sync()
+            refine_times.append((time.perf_counter() - start) * 1000)
+        session.close()
+
+    refine_times = np.array(refine_times)
+    print(f"完整推理 (process_one_image) 中位数 {np.median(full_times):7.2f}ms")
+    print(f"打开会话 (open_session)       中位数 {np.median(open_times):7.2f}ms")
+    if len(refine_times):
+        print(
+            f"关键点修正 (refine) {len(refine_times)} 次, "
+            f"中位数 {np.median(refine_times):7.2f}ms  "
+            f"P90 {np.percentile(refine_times, 90):7.2f}ms  "
+            f"(50ms以内: {np.mean(refine_times < 50) * 100:.0f}%)"
+        )
+
+
+def benchmark_earlyexit(args):
+    """身体解码器提前退出: 各阈值下的平均执行层数、解码器耗时与相对完整解码的误差"""
+    from pathlib import Path
+
+    import numpy as np
+    from tools.video_io import iter_batches
+
+    estimator = _build_estimator(args)
+    model = estimator.model
+    frames = _load_video_frames(args.video, args.num_frames, args.frame_skip)
+    print(f"读取 {len(frames)} 帧, 批大小: {args.batch_size}")
+
+    timings, layers = {}, []
+    _time_calls(model, ["forward_decoder"], timings)
+    forward_decoder = model.forward_decoder
+
+    def forward_decoder_with_layers(*fn_args, **fn_kwargs):
+        result = forward_decoder(*fn_args, **fn_kwargs)
+        decoder_layers = result[1][-1].get("decoder_layers")
+        if decoder_layers is not None:
+            layers.append(decoder_layers.cpu().numpy())
+        return result
+
+    model.forward_decoder = forward_decoder_with_layers
+
+    results = {}
+    for tol in [None] + args.tols:
+        estimator.early_exit_tol = tol
+        estimator.process_frames(frames[: args.batch_size])  # 预热
+        timings["forward_decoder"].clear()
+        layers.clear()
+        outputs = []
+        for frame_batch in iter_batches(frames, args.batch_size):
+            outputs.extend(estimator.process_frames(frame_batch))
+        times = timings["forward_decoder"]
+        mean_layers = (
+            float(np.concatenate(layers).mean())
+            if layers
+            else float(len(model.decoder.layers))
+        )
+        results[tol] = (outputs, mean_layers, np.mean(times) * 1000 if times else 0.0)
+
+    reference = results[None][0]
+    lines = [
+        "| 阈值 (m) | 平均层数 | forward_decoder 平均 (ms) | 顶点误差 平均/最大 (mm) "
+        "| 2D关键点误差 平均/最大 (px) |",
+        "|---|---|---|---|---|",
+    ]
+    for tol, (outputs, mean_layers, latency) in results.items():
+        vert_err, kp_err = [], []
+        for ref_frame, out_frame in zip(reference, outputs):
+            for ref, out in zip(ref_frame, out_frame):
+                vert_err.append(
+                    np.linalg.norm(ref["pred_vertices"] - out["pred_vertices"], axis=-1)
+                )
+                kp_err.append(
+                    np.linalg.norm(
+                        ref["pred_keypoints_2d"] - out["pred_keypoints_2d"], axis=-1
+                    )
+                )
+        vert_err = np.concatenate(vert_err) * 1000 if vert_err else np.zeros(1)
+        kp_err = np.concatenate(kp_err) if kp_err else np.zeros(1)
+        lines.append(
+            f"| {'完整' if tol is None else tol} | {mean_layers:.2f} | {latency:.2f} "
+            f"| {vert_err.mean():.2f} / {vert_err.max():.2f} "
+            f"| {kp_err.mean():.2f} / {kp_err.max():.2f} |"
+        )
+    report = "\n".join(lines)
+    print(report)
+    if args.report:
+        Path(args.report).write_text(report + "\n")
+        print(f"报告已保存到: {args.report}")
+
+
+def benchmark_export(args):
+    """导出的身体推理图与 eager 模式在CPU上的启动时间、吞吐量和一致性"""
+    from pathlib import Path
+
+    import cv2
+    import numpy as np
+    import torch
+    from sam_3d_body import ExportedBodyModel, load_sam_3d_body
+    from sam_3d_body.data.utils.batch_crop import BatchCropper
+
+    torch.set_num_threads(args.num_threads or torch.get_num_threads())
+    mhr_path = args.mhr_path or os.environ.get("SAM3D_MHR_PATH", "")
+    (model, _), eager_startup = _timed(
+        load_sam_3d_body, args.checkpoint_path, device="cpu", mhr_path=mhr_path
+    )
+    exported, exported_startup = _timed(
+        ExportedBodyModel, args.export_dir, backend=args.backend
+    )
+    print(
+        f"启动时间: eager {eager_startup:.2f}s, "
+        f"导出模型 ({exported.backend}) {exported_startup:.2f}s"
+    )
+
+    image_paths = []
+    for path in map(Path, args.images):
+        image_paths += sorted(path.glob("*.jpg")) if path.is_dir() else [path]
+    images = [cv2.cvtColor(cv2.imread(str(p)), cv2.COLOR_BGR2RGB) for p in image_paths]
+    cropper = BatchCropper(model.cfg.MODEL.IMAGE_SIZE)
+
+    for num_person in args.persons:
+        batches = []
+        for img in images:
+            box = np.array([[0, 0, img.shape[1], img.shape[0]]], dtype=np.float32)
+            batches.append(
+                cropper.crop(
+                    BatchCropper.upload([img], "cpu"), [box.repeat(num_person, 0)]
+                )
+            )
+
+        def run_eager(batch):
+            model._initialize_batch(batch)
+            return model.forward_step(batch, decoder_type="body")["mhr"]
+
+        results = {}
+        for name, fn in [("eager", run_eager), ("导出", exported.run_batch)]:
+            with torch.no_grad():
+                fn(batches[0])  # 预热
+                outputs, start = [], time.perf_counter()
+                for _ in range(args.repeats):
+                    outputs = [fn(batch) for batch in batches]
+                elapsed = time.perf_counter() - start
+            results[name] = outputs
+            num_batches = len(batches) * args.repeats
+            print(
+                f"{num_person} 人 {name:<6s} 每批 {elapsed / num_batches * 1000:8.1f}ms, "
+                f"{num_person * num_batches / elapsed:6.2f} 人/秒"
+            )
+        for key in ["pred_vertices", "pred_keypoints_2d"]:
+            diff = max(
+                float((ref[key] - out[key]).abs().max())
+                for ref, out in zip(results["eager"], results["导出"])
+            )
+            print(f"{num_person} 人 {key:<20s} 最大误差: {diff:.2e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="SAM 3D Body 性能基准测试",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    decode_parser = subparsers.add_parser("decode", help="视频解码吞吐量")
+    decode_parser.add_argument("--video", required=True, type=str, help="输入视频路径")
+    decode_parser.add_argument("--frame_skip", default=0, type=int, help="跳帧数")
+    decode_parser.add_argument("--start_frame", default=0, type=int, help="起始帧")
+    decode_parser.add_argument("--end_frame", default=-1, type=int, help="结束帧")
+    decode_parser.set_defaults(func=benchmark_decode)
+
+    batch_parser = subparsers.add_parser("batch", help="多帧批量推理吞吐量")
+    _add_model_args(batch_parser)
+    batch_parser.add_argument("--video", required=True, type=str, help="输入视频路径")
+    batch_parser.add_argument("--num_frames", default=64, type=int, help="测试帧数")
+    batch_parser.add_argument("--frame_skip", default=0, type=int, help="跳帧数")
+    batch_parser.add_argument(
+        "--batch_sizes", default=[4, 8, 16], type=int, nargs="+", help="批大小"
+    )
+    batch_parser.set_defaults(func=benchmark_batch)
+
+    regen_parser = subparsers.add_parser("regen", help="从参数重建网格")
+    _add_model_args(regen_parser)
+    regen_parser.add_argument("--video", required=True, type=str, help="输入视频路径")
+    regen_parser.add_argument("--num_frames", default=32, type=int, help="测试帧数")
+    regen_parser.add_argument("--frame_skip", default=0, type=int, help="跳帧数")
+    regen_parser.add_argument("--repeats", default=5, type=int, help="重复次数")
+    regen_parser.set_defaults(func=benchmark_regen)
+
+    seqcodec_parser = subparsers.add_parser("seqcodec", help="序列顶点编码压缩比")
+    seqcodec_parser.add_argument(
+        "--mhr_folder", required=True, type=str, help="process_video.py 的输出目录"
+    )
+    seqcodec_parser.add_argument(
+        "--keyframe_intervals", default=[5, 10, 30], type=int, nargs="+", help="关键帧间隔"
+    )
+    seqcodec_parser.add_argument(
+        "--max_vertex_error", default=5e-4, type=float, help="最大顶点误差 (米)"
+    )
+    seqcodec_parser.add_argument(
+        "--dtype", default="float32", choices=["float32", "float16"], help="关键帧精度"
+    )
+    seqcodec_parser.add_argument(
+        "--zstd", action="store_true", default=False, help="同时测试zstd压缩"
+    )
+    seqcodec_parser.set_defaults(func=benchmark_seqcodec)
+
+    cpu_parser = subparsers.add_parser("cpu", help="纯CPU推理吞吐量")
+    _add_model_args(cpu_parser)
+    cpu_parser.add_argument("--video", required=True, type=str, help="输入视频路径")
+    cpu_parser.add_argument("--num_frames", default=16, type=int, help="测试帧数")
+    cpu_parser.add_argument("--frame_skip", default=0, type=int, help="跳帧数")
+    cpu_parser.add_argument("--batch_size", default=4, type=int, help="批大小")
+    cpu_parser.add_argument(
+        "--threads", default=[0], type=int, nargs="+", help="线程数 (0 表示所有核心)"
+    )
+    cpu_parser.add_argument(
+        "--bf16", action="store_true", default=False, help="同时测试bf16骨干网络"
+    )
+    cpu_parser.set_defaults(func=benchmark_cpu)
+
+    crop_parser = subparsers.add_parser("crop", help="设备端批量裁剪")
+    crop_parser.add_argument("--video", required=True, type=str, help="输入视频路径")
+    crop_parser.add_argument("--num_frames", default=32, type=int, help="测试帧数")
+    crop_parser.add_argument("--frame_skip", default=0, type=int, help="跳帧数")
+    crop_parser.add_argument("--batch_size", default=8, type=int, help="批大小")
+    crop_parser.add_argument("--num_people", default=4, type=int, help="每帧人数")
+    crop_parser.add_argument(
+        "--input_size", default=[512, 512], type=int, nargs=2, help="模型输入尺寸 (w h)"
+    )
+    crop_parser.add_argument(
+        "--device", default="", type=str, help="裁剪设备 (默认: 有GPU时用cuda)"
+    )
+    crop_parser.set_defaults(func=benchmark_crop)
+
+    hands_parser = subparsers.add_parser("hands", help="左右手合并前向")
+    _add_model_args(hands_parser)
+    hands_parser.add_argument("--video", required=True, type=str, help="输入视频路径")
+    hands_parser.add_argument("--num_frames", default=32, type=int, help="测试帧数")
+    hands_parser.add_argument("--frame_skip", default=0, type=int, help="跳帧数")
+    hands_parser.add_argument("--batch_size", default=4, type=int, help="批大小")
+    hands_parser.set_defaults(func=benchmark_hands)
+
+    decoder_parser = subparsers.add_parser("decoder", help="中间层只计算关键点")
+    _add_model_args(decoder_parser)
+    decoder_parser.add_argument("--video", required=True, type=str, help="输入视频路径")
+    decoder_parser.add_argument("--num_frames", default=32, type=int, help="测试帧数")
+    decoder_parser.add_argument("--frame_skip", default=0, type=int, help="跳帧数")
+    decoder_parser.add_argument("--batch_size", default=4, type=int, help="批大小")
+    decoder_parser.set_defaults(func=benchmark_decoder)
+
+    keypoints_parser = subparsers.add_parser("keypoints", help="稀疏关键点回归器")
+    _add_model_args(keypoints_parser)
+    keypoints_parser.add_argument("--batch_size", default=256, type=int, help="批大小")
+    keypoints_parser.add_argument("--repeats", default=50, type=int, help="重复次数")
+    keypoints_parser.add_argument(
+        "--devices",
+        nargs="+",
+        default=None,
+        choices=["cpu", "cuda"],
+        help="测试设备 (默认: cpu, 有GPU时再加 cuda)",
+    )
+    keypoints_parser.set_defaults(func=benchmark_keypoints)
+
+    compile_parser = subparsers.add_parser("compile", help="torch.compile 逐帧延迟")
+    _add_model_args(compile_parser)
+    compile_parser.add_argument("--video", required=True, type=str, help="输入视频路径")
+    compile_parser.add_argument("--num_frames", default=64, type=int, help="测试帧数")
+    compile_parser.add_argument("--frame_skip", default=0, type=int, help="跳帧数")
+    compile_parser.add_argument(
+        "--buckets", nargs="+", default=[1, 2, 4, 8], type=int, help="人数分桶"
+    )
+    compile_parser.add_argument(
+        "--compile_mode",
+        default="default",
+        choices=["default", "reduce-overhead", "max-autotune"],
+        help="torch.compile 模式, reduce-overhead 会使用CUDA Graph",
+    )
+    compile_parser.set_defaults(func=benchmark_compile)
+
+    precision_parser = subparsers.add_parser("precision", help="推理精度与延迟报告")
+    _add_model_args(precision_parser)
+    precision_parser.add_argument(
+        "--images",
+        nargs="+",
+        default=["./notebook/images"],
+        help="样例图片或图片目录 (默认: ./notebook/images)",
+    )
+    precision_parser.add_argument(
+        "--precisions",
+        nargs="+",
+        default=["fp32", "bf16", "fp16"],
+        choices=["fp32", "bf16", "fp16"],
+        help="要测试的精度, 误差相对 fp32 计算",
+    )
+    precision_parser.add_argument("--repeats", default=5, type=int, help="每张图片重复次数")
+    precision_parser.add_argument(
+        "--report", default="", type=str, help="Markdown 报告输出路径 (可选)"
+    )
+    precision_parser.set_defaults(func=benchmark_precision)
+
+    kvcache_parser = subparsers.add_parser("kvcache", help="解码器交叉注意力K/V缓存")
+    _add_model_args(kvcache_parser)
+    kvcache_parser.add_argument("--video", required=True, type=str, help="输入视频路径")
+    kvcache_parser.add_argument("--num_frames", default=32, type=int, help="测试帧数")
+    kvcache_parser.add_argument("--frame_skip", default=0, type=int, help="跳帧数")
+    kvcache_parser.add_argument("--batch_size", default=4, type=int, help="批大小")
+    kvcache_parser.set_defaults(func=benchmark_kvcache)
+
+    session_parser = subparsers.add_parser("session", help="交互式关键点修正延迟")
+    _add_model_args(session_parser)
+    session_parser.add_argument(
+        "--images",
+        nargs="+",
+        default=["./notebook/images"],
+        help="样例图片或图片目录 (默认: ./notebook/images)",
+    )
+    session_parser.add_argument("--clicks", default=20, type=int, help="每张图片的修正次数")
+    session_parser.add_argument(
+        "--offset", default=8.0, type=float, help="模拟拖动关键点的像素偏移"
+    )
+    session_parser.set_defaults(func=benchmark_session)
+
+    earlyexit_parser = subparsers.add_parser("earlyexit", help="解码器提前退出")
+    _add_model_args(earlyexit_parser)
+    earlyexit_parser.add_argument("--video", required=True, type=str, help="输入视频路径")
+    earlyexit_parser.add_argument("--num_frames", default=32, type=int, help="测试帧数")
+    earlyexit_parser.add_argument("--frame_skip", default=0, type=int, help="跳帧数")
+    earlyexit_parser.add_argument("--batch_size", default=4, type=int, help="批大小")
+    earlyexit_parser.add_argument(
+        "--tols",
+        nargs="+",
+        default=[0.0005, 0.001, 0.002, 0.005],
+        type=float,
+        help="要测试的提前退出阈值 (米), 误差相对完整解码计算",
+    )
+    earlyexit_parser.add_argument(
+        "--report", default="", type=str, help="Markdown 报告输出路径 (可选)"
+    )
+    earlyexit_parser.set_defaults(func=benchmark_earlyexit)
+
+    export_parser = subparsers.add_parser("export", help="导出模型与eager对比")
+    _add_model_args(export_parser)
+    export_parser.add_argument(
+        "--export_dir", required=True, type=str, help="export_model.py 的导出目录"
+    )
+    export_parser.add_argument(
+        "--backend",
+        default=None,
+        choices=["torchscript", "onnxruntime"],
+        help="运行时 (默认: 按导出格式选择)",
+    )
+    export_parser.add_argument(
+        "--images",
+        nargs="+",
+        default=["./notebook/images"],
+        help="样例图片或图片目录 (默认: ./notebook/images)",
+    )
+    export_parser.add_argument(
+        "--persons", nargs="+", default=[1, 4], type=int, help="每张图片的人数 (重复裁剪)"
+    )
+    export_parser.add_argument("--repeats", default=3, type=int, help="重复次数")
+    export_parser.add_argument(
+        "--num_threads", default=0, type=int, help="CPU线程数 (0=全部)"
+    )
+    export_parser.set_defaults(func=benchmark_export)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
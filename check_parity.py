@@ -0,0 +1,385 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+"""
+数值一致性检查脚本: 加速路径与参考路径的输出差异超过容差时以非零状态退出
+(耗时对比见 benchmark.py 的同名子命令)
+
+使用方法:
+    python check_parity.py crop
+    python check_parity.py crop --image path/to/image.jpg --device cuda
+    python check_parity.py hands --images ./notebook/images
+    python check_parity.py kvcache --early_exit_tol 0.001
+
+子命令:
+    crop    设备端批量裁剪 (BatchCropper) 与 cv2 逐人裁剪 (TopdownAffine)，
+            包括翻转的手部裁剪和越过图像边界的检测框；不需要加载模型
+    hands   左右手合并前向 (fuse_hands) 与分两次前向的 process_frames 输出，
+            包括多人画面中某人只细化一只手的情况；需要多人的样例图片
+    kvcache 关键点提示重跑解码器时复用与不复用图像token K/V缓存的输出，包括
+            多人批次、身体解码器提前退出和交互式会话的逐人修正 (refine)
+
+退出状态:
+    0 全部通过, 1 有检查超出容差
+"""
+
+import argparse
+import os
+import sys
+
+import pyrootutils
+
+root = pyrootutils.setup_root(
+    search_from=__file__,
+    indicator=[".git", "pyproject.toml", ".sl"],
+    pythonpath=True,
+    dotenv=True,
+)
+
+# 裁剪容差:
+# - 几何量 (affine_trans / bbox_center / bbox_scale) 只有 float32 与 float64 的舍入差异，
+#   按相对误差 |差| / (1 + |参考值|) 检查
+# - 像素值 (0-255 灰度级): cv2.warpAffine 把采样坐标定点化到 1/32 像素并把结果取整为
+#   uint8，在 255 灰度级/像素的硬边缘上最多差约 8 级；平均误差主要来自取整 (约 0.25 级)
+CROP_TOL_GEOMETRY = 1e-5
+CROP_TOL_IMG_MAX = 10.0
+CROP_TOL_IMG_MEAN = 0.5
+
+# 模型输出容差 (fp32): 两条路径的计算只在批次组成上不同，差异来自浮点累加顺序
+OUTPUT_TOLS = {
+    "pred_vertices": 1e-3,  # 米
+    "pred_keypoints_2d": 0.5,  # 像素
+    "body_pose_params": 1e-3,
+    "hand_pose_params": 1e-3,
+    "scale_params": 1e-3,
+    "shape_params": 1e-3,
+}
+
+
+def _check(failures, label, diff, tol):
+    """打印一项检查的结果，超出容差时记入 failures"""
+    passed = diff <= tol
+    print(f"{'通过' if passed else '失败'}  {label:<44s} {diff:.2e} (容差 {tol:.0e})")
+    if not passed:
+        failures.append(label)
+
+
+def _check_outputs(failures, label, reference, outputs, tol_scale=1.0):
+    """逐帧逐人比较两组 process_frames 输出的 OUTPUT_TOLS 各字段"""
+    import numpy as np
+
+    counts = [len(frame) for frame in reference], [len(frame) for frame in outputs]
+    if counts[0] != counts[1]:
+        print(f"失败  {label} 每帧人数不同: {counts[0]} / {counts[1]}")
+        failures.append(f"{label} 人数")
+        return
+    for key, tol in OUTPUT_TOLS.items():
+        diff = max(
+            (
+                float(np.abs(np.asarray(ref[key]) - np.asarray(out[key])).max())
+                for ref_frame, out_frame in zip(reference, outputs)
+                for ref, out in zip(ref_frame, out_frame)
+            ),
+            default=0.0,
+        )
+        _check(failures, f"{label} {key}", diff, tol * tol_scale)
+
+
+def _build_estimator(args):
+    """加载模型与可选模块，构建估计器"""
+    import torch
+    from sam_3d_body import load_sam_3d_body, SAM3DBodyEstimator
+
+    device = torch.device(
+        args.device or ("cuda" if torch.cuda.is_available() else "cpu")
+    )
+    mhr_path = args.mhr_path or os.environ.get("SAM3D_MHR_PATH", "")
+    model, model_cfg = load_sam_3d_body(
+        args.checkpoint_path, device=device, mhr_path=mhr_path
+    )
+
+    human_detector = None
+    if args.detector_name:
+        from tools.build_detector import HumanDetector
+
+        human_detector = HumanDetector(
+            name=args.detector_name, device=device, path=args.detector_path
+        )
+
+    return SAM3DBodyEstimator(
+        sam_3d_body_model=model,
+        model_cfg=model_cfg,
+        human_detector=human_detector,
+    )
+
+
+def _load_frames(estimator, image_args):
+    """
+    读取样例图片并加上水平翻转的副本 (一个批次中有多帧)，检测一次人体框供各次运行共用
+
+    Returns:
+        frames, bboxes; 没有多人的帧时返回 None
+    """
+    from pathlib import Path
+
+    import cv2
+    import numpy as np
+
+    image_paths = []
+    for path in map(Path, image_args):
+        image_paths += sorted(path.glob("*.jpg")) if path.is_dir() else [path]
+    frames = [cv2.cvtColor(cv2.imread(str(p)), cv2.COLOR_BGR2RGB) for p in image_paths]
+    frames += [np.ascontiguousarray(frame[:, ::-1]) for frame in frames]
+
+    detections = estimator.process_frames(frames, inference_type="body")
+    bboxes = [
+        np.stack([person["bbox"] for person in out]) if out else None
+        for out in detections
+    ]
+    num_people = [len(out) for out in detections]
+    print(f"读取 {len(frames)} 帧 (含翻转), 每帧人数: {num_people}")
+    if max(num_people, default=0) < 2:
+        return None
+    return frames, bboxes
+
+
+def _synthetic_image(width, height, seed=0):
+    """平滑的随机色块加若干硬边缘矩形的测试图片 (RGB uint8)"""
+    import cv2
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    low = rng.uniform(0, 255, (9, 16, 3)).astype(np.float32)
+    img = cv2.resize(low, (width, height), interpolation=cv2.INTER_CUBIC)
+    for _ in range(8):
+        x1, y1 = rng.integers(0, [width, height])
+        x2, y2 = rng.integers([x1, y1], [width, height]) + 1
+        color = rng.uniform(0, 255, 3).tolist()
+        cv2.rectangle(img, (int(x1), int(y1)), (int(x2), int(y2)), color, -1)
+    return np.clip(img, 0, 255).astype(np.uint8)
+
+
+def _crop_boxes(width, height, num_random, seed=0):
+    """固定的越界检测框加随机检测框 (xyxy)"""
+    import numpy as np
+
+    boxes = [
+        [-0.2, -0.1, 0.3, 0.4],  # 越过左边界和上边界
+        [0.75, 0.7, 1.2, 1.15],  # 越过右边界和下边界
+        [-0.1, -0.1, 1.1, 1.1],  # 比整幅图还大
+        [0.45, 0.45, 0.5, 0.52],  # 手部大小的小框
+    ]
+    rng = np.random.default_rng(seed)
+    size = rng.uniform(0.05, 0.6, (num_random, 2))
+    x1y1 = rng.uniform(-0.1, 0.9, (num_random, 2))
+    boxes = np.vstack([boxes, np.hstack([x1y1, x1y1 + size])])
+    return (boxes * [width, height, width, height]).astype(np.float32)
+
+
+def check_crop(args):
+    """BatchCropper 与 prepare_batch_multi + TopdownAffine (cv2) 的裁剪一致性"""
+    import cv2
+    import torch
+    from sam_3d_body.data.transforms import (
+        Compose,
+        GetBBoxCenterScale,
+        TopdownAffine,
+        VisionTransformWrapper,
+    )
+    from sam_3d_body.data.utils.batch_crop import BatchCropper
+    from sam_3d_body.data.utils.prepare_batch import prepare_batch_multi
+    from torchvision.transforms import ToTensor
+
+    device = torch.device(
+        args.device or ("cuda" if torch.cuda.is_available() else "cpu")
+    )
+    if args.image:
+        img = cv2.cvtColor(cv2.imread(args.image), cv2.COLOR_BGR2RGB)
+    else:
+        img = _synthetic_image(1280, 720)
+    height, width = img.shape[:2]
+    boxes = _crop_boxes(width, height, args.num_people)
+    print(f"图片 {width}x{height}, {len(boxes)} 个检测框, 设备: {device}")
+
+    failures = []
+    input_size = tuple(args.input_size)
+    uploaded = BatchCropper.upload([img], device)
+    for name, padding in [("body", 1.25), ("hand", 0.9)]:
+        transform = Compose(
+            [
+                GetBBoxCenterScale(padding=padding),
+                TopdownAffine(input_size=input_size, use_udp=False),
+                VisionTransformWrapper(ToTensor()),
+            ]
+        )
+        cropper = BatchCropper(input_size, padding=padding)
+        # 左手在水平翻转的图片上裁剪 (检测框为翻转后的坐标)
+        for flip in [False, True] if name == "hand" else [False]:
+            ref = prepare_batch_multi([img[:, ::-1] if flip else img], transform, [boxes])
+            out = cropper.crop(uploaded, [boxes], flip=flip)
+            label = f"{name}{' (flip)' if flip else ''}"
+            for key in ["affine_trans", "bbox_center", "bbox_scale"]:
+                r, o = ref[key].double().cpu(), out[key].double().cpu()
+                diff = float(((r - o).abs() / (1 + r.abs())).max())
+                _check(failures, f"{label} {key} 相对误差", diff, CROP_TOL_GEOMETRY)
+            diff = (ref["img"].double().cpu() - out["img"].double().cpu()).abs() * 255
+            _check(
+                failures, f"{label} img 最大误差 (灰度级)", float(diff.max()), CROP_TOL_IMG_MAX
+            )
+            _check(
+                failures,
+                f"{label} img 平均误差 (灰度级)",
+                float(diff.mean()),
+                CROP_TOL_IMG_MEAN,
+            )
+    return failures
+
+
+def check_hands(args):
+    """合并前向与分两次前向 (都是 hand_refine="always") 的 process_frames 输出一致性"""
+    estimator = _build_estimator(args)
+    model = estimator.model
+    failures = []
+    loaded = _load_frames(estimator, args.images)
+    if loaded is None:
+        print("失败  样例图片中没有多人的帧")
+        return ["多人画面"]
+    frames, bboxes = loaded
+
+    hand_refine_mask = model._hand_refine_mask
+
+    def one_hand_mask(batch, *mask_args, **mask_kwargs):
+        # 每帧第一个人只细化右手
+        keep = hand_refine_mask(batch, *mask_args, **mask_kwargs)
+        keep[:: batch["img"].shape[1], 0] = False
+        return keep
+
+    estimator.hand_refine = "always"
+    configs = [("全部手部", hand_refine_mask), ("第一人只细化右手", one_hand_mask)]
+    for label, mask_fn in configs:
+        model._hand_refine_mask = mask_fn
+        results = {}
+        for fuse_hands in [False, True]:
+            estimator.fuse_hands = fuse_hands
+            results[fuse_hands] = estimator.process_frames(frames, bboxes=bboxes)
+        _check_outputs(failures, label, results[False], results[True], args.tol_scale)
+    del model._hand_refine_mask
+    return failures
+
+
+def check_kvcache(args):
+    """K/V缓存开启与关闭时 process_frames 和 PromptSession.refine 的输出一致性"""
+    import numpy as np
+
+    estimator = _build_estimator(args)
+    model = estimator.model
+    failures = []
+    loaded = _load_frames(estimator, args.images)
+    if loaded is None:
+        print("失败  样例图片中没有多人的帧")
+        return ["多人画面"]
+    frames, bboxes = loaded
+
+    # 提前退出时缓存按仍在细化的行切片
+    for tol in [None, args.early_exit_tol]:
+        estimator.early_exit_tol = tol
+        results = {}
+        for use_cache in [False, True]:
+            model.decoder_kv_cache = use_cache
+            results[use_cache] = estimator.process_frames(frames, bboxes=bboxes)
+        label = "完整解码" if tol is None else f"提前退出 {tol}"
+        _check_outputs(failures, label, results[False], results[True], args.tol_scale)
+
+    # 交互式会话: 缓存按人切片，每人拖动一个手腕关键点
+    estimator.early_exit_tol = None
+    num_people = [len(boxes) if boxes is not None else 0 for boxes in bboxes]
+    frame_idx = int(np.argmax(num_people))
+    results, clicks = {}, None
+    for use_cache in [False, True]:
+        model.decoder_kv_cache = use_cache
+        session = estimator.open_session(frames[frame_idx], bboxes=bboxes[frame_idx])
+        if clicks is None:
+            clicks = [
+                np.array([[*(out["pred_keypoints_2d"][41] + 8.0), 41]])
+                for out in session.outputs
+            ]
+        results[use_cache] = [
+            [session.refine(i, keypoints) for i, keypoints in enumerate(clicks)]
+        ]
+        session.close()
+    _check_outputs(failures, "会话修正", results[False], results[True], args.tol_scale)
+    return failures
+
+
+def _add_model_args(parser):
+    parser.add_argument(
+        "--checkpoint_path",
+        default="./checkpoints/sam-3d-body-dinov3/model.ckpt",
+        type=str,
+        help="SAM 3D Body模型检查点路径",
+    )
+    parser.add_argument(
+        "--mhr_path",
+        default="./checkpoints/sam-3d-body-dinov3/assets/mhr_model.pt",
+        type=str,
+        help="MHR资源路径",
+    )
+    parser.add_argument(
+        "--detector_name", default="vitdet", type=str, help="人体检测模型名称"
+    )
+    parser.add_argument("--detector_path", default="", type=str, help="人体检测模型路径")
+    parser.add_argument(
+        "--device", default="", type=str, help="推理设备 (默认: 有GPU时用cuda)"
+    )
+    parser.add_argument(
+        "--images",
+        nargs="+",
+        default=["./notebook/images"],
+        help="多人样例图片或图片目录 (默认: ./notebook/images)",
+    )
+    parser.add_argument(
+        "--tol_scale", default=1.0, type=float, help="OUTPUT_TOLS 容差的倍数"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="加速路径与参考路径的数值一致性检查",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    crop_parser = subparsers.add_parser("crop", help="设备端批量裁剪与cv2裁剪")
+    crop_parser.add_argument(
+        "--image", default="", type=str, help="测试图片 (默认: 生成的测试图片)"
+    )
+    crop_parser.add_argument("--num_people", default=12, type=int, help="随机检测框数量")
+    crop_parser.add_argument(
+        "--input_size", default=[512, 512], type=int, nargs=2, help="模型输入尺寸 (w h)"
+    )
+    crop_parser.add_argument(
+        "--device", default="", type=str, help="裁剪设备 (默认: 有GPU时用cuda)"
+    )
+    crop_parser.set_defaults(func=check_crop)
+
+    hands_parser = subparsers.add_parser("hands", help="左右手合并前向与分两次前向")
+    _add_model_args(hands_parser)
+    hands_parser.set_defaults(func=check_hands)
+
+    kvcache_parser = subparsers.add_parser("kvcache", help="解码器K/V缓存")
+    _add_model_args(kvcache_parser)
+    kvcache_parser.add_argument(
+        "--early_exit_tol", default=0.001, type=float, help="同时检查的提前退出阈值 (米)"
+    )
+    kvcache_parser.set_defaults(func=check_kvcache)
+
+    args = parser.parse_args()
+    failures = args.func(args)
+    if failures:
+        print(f"\n{len(failures)} 项检查超出容差:")
+        for label in failures:
+            print(f"  {label}")
+        sys.exit(1)
+    print("\n全部检查通过")
+
+
+if __name__ == "__main__":
+    main()
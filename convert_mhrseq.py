@@ -0,0 +1,166 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+"""
+将已有的逐帧MHR输出目录转换为单个 .mhrseq 序列文件
+
+使用方法:
+    python convert_mhrseq.py --mhr_folder output/video_name
+    python convert_mhrseq.py --mhr_folder output/video_name --vertex_encoding delta --seq_compression zstd
+
+输出:
+    - output/video_name/sequence.mhrseq
+"""
+
+import argparse
+import json
+import re
+from pathlib import Path
+
+import pyrootutils
+
+root = pyrootutils.setup_root(
+    search_from=__file__,
+    indicator=[".git", "pyproject.toml", ".sl"],
+    pythonpath=True,
+    dotenv=True,
+)
+
+import numpy as np
+from tools.mhr_io import (
+    mhr_json_to_outputs,
+    MHRSequenceWriter,
+    SEQUENCE_SUFFIX,
+    VERTEX_ENCODINGS,
+)
+from tqdm import tqdm
+
+
+def list_frames(mhr_folder: Path):
+    """返回 [(frame_idx, 文件路径)] 以及视频元信息 (没有 video_info.json 时为 None)"""
+    info_path = mhr_folder / "video_info.json"
+    if info_path.exists():
+        with open(info_path, "r") as f:
+            video_info = json.load(f)
+        frames = [
+            (f["frame_idx"], mhr_folder / f["file"])
+            for f in video_info["processed_frames"]
+        ]
+        return frames, video_info
+
+    frames = []
+    for i, path in enumerate(sorted(mhr_folder.glob("*.mhr.json"))):
+        match = re.search(r"(\d+)\.mhr\.json$", path.name)
+        frames.append((int(match.group(1)) if match else i, path))
+    return frames, None
+
+
+def convert_folder(mhr_folder, output_path=None, dtype="float32", **encoding_kwargs):
+    """
+    转换一个输出目录，返回生成的 .mhrseq 路径
+
+    encoding_kwargs 为顶点编码参数 (vertex_encoding, keyframe_interval, max_error,
+    compression)，见 MHRSequenceWriter
+    """
+    mhr_folder = Path(mhr_folder)
+    frames, video_info = list_frames(mhr_folder)
+    if not frames:
+        raise ValueError(f"未找到MHR文件: {mhr_folder}")
+
+    output_path = Path(output_path or mhr_folder / f"sequence{SEQUENCE_SUFFIX}")
+
+    faces = None
+    faces_path = mhr_folder / "faces.json"
+    if faces_path.exists():
+        with open(faces_path, "r") as f:
+            faces = np.array(json.load(f))
+
+    metadata = dict(video_info) if video_info else {}
+    metadata.pop("processed_frames", None)
+
+    writer = MHRSequenceWriter(
+        output_path, faces, dtype=dtype, metadata=metadata, **encoding_kwargs
+    )
+    with writer:
+        for frame_idx, path in tqdm(frames, desc="转换MHR文件"):
+            with open(path, "r") as f:
+                mhr_data = json.load(f)
+            if writer.faces is None and mhr_data.get("faces"):
+                writer.faces = np.asarray(mhr_data["faces"], dtype=np.int32)
+            if "image_size" not in writer.metadata and mhr_data.get("image_size"):
+                writer.metadata["image_size"] = mhr_data["image_size"]
+            writer.add_frame(frame_idx, mhr_json_to_outputs(mhr_data))
+
+    json_size = sum(path.stat().st_size for _, path in frames)
+    seq_size = output_path.stat().st_size
+    print(
+        f"JSON总大小: {json_size / 1e6:.1f}MB, 序列文件: {seq_size / 1e6:.1f}MB "
+        f"({json_size / max(seq_size, 1):.1f}x)"
+    )
+    return output_path
+
+
+def add_encoding_args(parser):
+    """顶点编码相关的命令行参数"""
+    parser.add_argument(
+        "--vertex_encoding",
+        default="raw",
+        choices=VERTEX_ENCODINGS,
+        help="顶点编码: raw=逐帧完整存储, delta=关键帧+int16量化增量 (默认: raw)",
+    )
+    parser.add_argument(
+        "--keyframe_interval",
+        default=10,
+        type=int,
+        help="delta 编码的关键帧间隔 (默认: 10)",
+    )
+    parser.add_argument(
+        "--max_vertex_error",
+        default=5e-4,
+        type=float,
+        help="delta 编码允许的最大顶点误差, 单位米 (默认: 0.0005)",
+    )
+    parser.add_argument(
+        "--seq_compression",
+        default="none",
+        choices=["none", "zstd"],
+        help="delta 编码增量的压缩方式 (默认: none)",
+    )
+
+
+def encoding_kwargs(args):
+    return dict(
+        vertex_encoding=args.vertex_encoding,
+        keyframe_interval=args.keyframe_interval,
+        max_error=args.max_vertex_error,
+        compression=None if args.seq_compression == "none" else args.seq_compression,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="将逐帧MHR文件转换为 .mhrseq 序列文件",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        "--mhr_folder", required=True, type=str, help="process_video.py 的输出目录"
+    )
+    parser.add_argument(
+        "--output",
+        default="",
+        type=str,
+        help="输出文件路径 (默认: <mhr_folder>/sequence.mhrseq)",
+    )
+    parser.add_argument(
+        "--dtype",
+        default="float32",
+        choices=["float32", "float16"],
+        help="顶点和3D关键点的存储精度 (默认: float32)",
+    )
+    add_encoding_args(parser)
+    args = parser.parse_args()
+    convert_folder(
+        args.mhr_folder, args.output or None, args.dtype, **encoding_kwargs(args)
+    )
+
+
+if __name__ == "__main__":
+    main()
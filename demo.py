@@ -1880,20 +1880,19 @@ def process_video_file(filepath, frame_skip, est):
     import cv2
     import json
     from tools.mhr_io import save_mhr, numpy_to_list
+    from tools.video_io import VideoFrameReader
     
     processing_status['message'] = '正在分析视频...'
     processing_status['is_video'] = True
     
-    cap = cv2.VideoCapture(filepath)
-    if not cap.isOpened():
-        raise ValueError("无法打开视频")
+    reader = VideoFrameReader(filepath)
     
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    fps = reader.fps
+    total_frames = reader.total_frames
+    width = reader.width
+    height = reader.height
     
-    frames_to_process = list(range(0, total_frames, frame_skip + 1))
+    frames_to_process = reader.frame_range(0, total_frames, frame_skip)
     num_frames = len(frames_to_process)
     
     processing_status['total_frames'] = num_frames
@@ -1916,23 +1915,18 @@ def process_video_file(filepath, frame_skip, est):
     faces_saved = False
     frame_times = []
     
-    for i, frame_idx in enumerate(frames_to_process):
-        frame_start = time.time()
-        
-        cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
-        ret, frame = cap.read()
-        if not ret:
-            continue
-        
-        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        
+    frame_start = time.time()
+    for i, (frame_idx, frame_rgb) in enumerate(reader.read_frames(frames_to_process)):
         try:
             outputs = est.process_one_image(frame_rgb, bbox_thr=0.8, use_mask=False)
-        except:
+        except Exception:
+            # 失败帧不计入耗时, 下一帧从现在开始计时
+            frame_start = time.time()
             continue
         
         frame_time = time.time() - frame_start
         frame_times.append(frame_time)
+        frame_start = time.time()
         
         # 更新进度
         progress = 10 + int(90 * (i + 1) / num_frames)
@@ -1999,7 +1993,7 @@ def process_video_file(filepath, frame_skip, est):
             "num_people": len(outputs),
         })
     
-    cap.release()
+    reader.release()
     
     with open(video_output / "video_info.json", 'w') as f:
         json.dump(video_info, f, indent=2)
@@ -0,0 +1,78 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+"""
+导出部署用的身体推理图 (骨干网络 + 身体解码器 + MHR头), 按人数分桶保存为 TorchScript 或 ONNX
+
+使用方法:
+    python export_model.py --output_dir exported/body
+    python export_model.py --output_dir exported/body_onnx --format onnx --buckets 1 2 4
+
+输出:
+    - <output_dir>/body_p<人数>.pt (或 .onnx)  # 每个人数分桶一个计算图
+    - <output_dir>/faces.npy                   # 网格面片
+    - <output_dir>/manifest.json               # 输入输出、裁剪尺寸、分桶等信息
+
+加载:
+    from sam_3d_body import ExportedBodyModel
+    model = ExportedBodyModel("exported/body")  # 不需要配置文件、MHR资源和 SAM3DBody
+"""
+
+import argparse
+import os
+
+import pyrootutils
+
+root = pyrootutils.setup_root(
+    search_from=__file__,
+    indicator=[".git", "pyproject.toml", ".sl"],
+    pythonpath=True,
+    dotenv=True,
+)
+
+from sam_3d_body import export_body_pipeline, load_sam_3d_body
+from sam_3d_body.export import EXPORT_FORMATS
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="导出部署用的身体推理图 (TorchScript / ONNX)",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        "--checkpoint_path",
+        default="./checkpoints/sam-3d-body-dinov3/model.ckpt",
+        type=str,
+        help="SAM 3D Body模型检查点路径",
+    )
+    parser.add_argument(
+        "--mhr_path",
+        default="./checkpoints/sam-3d-body-dinov3/assets/mhr_model.pt",
+        type=str,
+        help="MHR资源路径",
+    )
+    parser.add_argument("--output_dir", required=True, type=str, help="导出目录")
+    parser.add_argument(
+        "--format",
+        default="torchscript",
+        choices=EXPORT_FORMATS,
+        help="导出格式 (默认: torchscript)",
+    )
+    parser.add_argument(
+        "--buckets", nargs="+", default=[1, 2, 4, 8], type=int, help="人数分桶"
+    )
+    parser.add_argument("--opset", default=17, type=int, help="ONNX opset 版本")
+    args = parser.parse_args()
+
+    mhr_path = args.mhr_path or os.environ.get("SAM3D_MHR_PATH", "")
+    model, _ = load_sam_3d_body(args.checkpoint_path, device="cpu", mhr_path=mhr_path)
+    manifest_path = export_body_pipeline(
+        model,
+        args.output_dir,
+        person_buckets=args.buckets,
+        export_format=args.format,
+        opset=args.opset,
+    )
+    print(f"导出完成: {manifest_path}")
+
+
+if __name__ == "__main__":
+    main()
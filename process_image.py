@@ -4,6 +4,7 @@
 
 使用方法:
     python process_image.py --image path/to/image.jpg --checkpoint_path path/to/model.ckpt
+    python process_image.py --image_dir path/to/images --batch_size 8
 
 输出:
     - output/<image_name>.mhr.json  # MHR数据文件，可用于网页查看器
@@ -13,6 +14,9 @@
 
 import argparse
 import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import pyrootutils
@@ -28,17 +32,17 @@ import cv2
 import numpy as np
 import torch
 from sam_3d_body import load_sam_3d_body, SAM3DBodyEstimator
+from sam_3d_body.utils.cpu import configure_cpu_inference
 from tools.mhr_io import save_mhr, export_obj
 from tools.vis_utils import visualize_sample_together
+from tqdm import tqdm
 
 
-def process_image(args):
-    """处理单张图片并生成MHR文件"""
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
 
-    # 设置输出目录
-    output_folder = Path(args.output_folder)
-    output_folder.mkdir(parents=True, exist_ok=True)
 
+def build_estimator(args):
+    """加载模型和可选模块，创建估计器"""
     # 获取模型路径
     mhr_path = args.mhr_path or os.environ.get("SAM3D_MHR_PATH", "")
     detector_path = args.detector_path or os.environ.get("SAM3D_DETECTOR_PATH", "")
@@ -46,14 +50,26 @@ def process_image(args):
     fov_path = args.fov_path or os.environ.get("SAM3D_FOV_PATH", "")
 
     # 初始化设备
-    device = torch.device("cuda") if torch.cuda.is_available() else torch.device("cpu")
+    use_cuda = torch.cuda.is_available() and args.device != "cpu"
+    device = torch.device("cuda") if use_cuda else torch.device("cpu")
     print(f"使用设备: {device}")
 
     # 加载SAM 3D Body模型
     print("正在加载SAM 3D Body模型...")
     model, model_cfg = load_sam_3d_body(
-        args.checkpoint_path, device=device, mhr_path=mhr_path
+        args.checkpoint_path,
+        device=device,
+        mhr_path=mhr_path,
+        precision=args.precision,
     )
+    if device.type == "cpu":
+        num_threads = configure_cpu_inference(
+            model, num_threads=args.cpu_threads, bf16=args.cpu_bf16
+        )
+        print(f"CPU推理线程数: {num_threads}")
+    if args.compile:
+        print("正在编译姿态分支 (torch.compile, 人数分桶 1/2/4/8)...")
+        model.compile_pose_branch(batch_size=args.batch_size)
 
     # 加载可选模块
     human_detector, human_segmentor, fov_estimator = None, None, None
@@ -87,30 +103,16 @@ def process_image(args):
         human_segmentor=human_segmentor,
         fov_estimator=fov_estimator,
     )
+    estimator.hand_refine = args.hand_refine
+    if args.early_exit_tol > 0:
+        estimator.early_exit_tol = args.early_exit_tol
+    return estimator
 
-    # 处理图片
-    image_path = Path(args.image)
-    print(f"\n正在处理图片: {image_path}")
 
-    # 读取图片获取尺寸
-    img = cv2.imread(str(image_path))
-    if img is None:
-        raise ValueError(f"无法读取图片: {image_path}")
+def save_outputs(args, estimator, output_folder, image_path, img, outputs):
+    """保存一张图片的MHR文件以及可选的OBJ和可视化结果 (img 为已解码的RGB图片)"""
     image_size = (img.shape[1], img.shape[0])  # (width, height)
 
-    # 运行推理
-    outputs = estimator.process_one_image(
-        str(image_path),
-        bbox_thr=args.bbox_thresh,
-        use_mask=args.use_mask,
-    )
-
-    if not outputs:
-        print("未检测到人体!")
-        return
-
-    print(f"检测到 {len(outputs)} 个人体")
-
     # 获取输出文件名
     base_name = image_path.stem
 
@@ -133,9 +135,116 @@ def process_image(args):
     # 可选：保存可视化结果
     if args.save_vis:
         vis_path = output_folder / f"{base_name}_vis.jpg"
-        rend_img = visualize_sample_together(img, outputs, estimator.faces)
+        img_bgr = cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
+        rend_img = visualize_sample_together(img_bgr, outputs, estimator.faces)
         cv2.imwrite(str(vis_path), rend_img.astype(np.uint8))
-        print(f"可视化结果已保存到: {vis_path}")
+    return mhr_path_out
+
+
+def process_image_dir(args, estimator, output_folder):
+    """批量处理目录中的所有图片"""
+    image_dir = Path(args.image_dir)
+    image_paths = sorted(
+        p for p in image_dir.iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS
+    )
+    if not image_paths:
+        raise ValueError(f"目录中没有图片: {image_dir}")
+    print(f"\n共 {len(image_paths)} 张图片, 批大小: {args.batch_size}")
+
+    start = time.perf_counter()
+    num_people, num_detected = 0, 0
+    pending = deque()
+    with ThreadPoolExecutor(max(args.num_writers, 1)) as writer_pool:
+        results = estimator.process_images(
+            [str(p) for p in image_paths],
+            batch_size=args.batch_size,
+            num_workers=args.num_workers,
+            bbox_thr=args.bbox_thresh,
+            use_mask=args.use_mask,
+            return_images=True,
+        )
+        for image_path, (img, outputs) in tqdm(
+            zip(image_paths, results), total=len(image_paths), desc="处理图片"
+        ):
+            if not outputs:
+                continue
+            num_detected += 1
+            num_people += len(outputs)
+            # 复用推理时解码的图片，不在写线程中重新读取
+            pending.append(
+                writer_pool.submit(
+                    save_outputs, args, estimator, output_folder, image_path, img, outputs
+                )
+            )
+            # 写入跟不上推理时等待，避免结果在内存中堆积
+            while len(pending) > 4 * max(args.num_writers, 1):
+                pending.popleft().result()
+        for future in pending:
+            future.result()
+    elapsed = time.perf_counter() - start
+
+    print(
+        f"\n处理完成! {len(image_paths)} 张图片, 其中 {num_detected} 张检测到人体, "
+        f"共 {num_people} 人"
+    )
+    print(
+        f"总耗时: {elapsed:.2f}s, 吞吐量: {len(image_paths) / max(elapsed, 1e-6):.2f} 张/秒"
+    )
+    hand_stats = estimator.hand_stats
+    print(
+        f"手部裁剪 (策略: {estimator.hand_refine}): 共 {hand_stats['hand_crops']}, "
+        f"跳过 {hand_stats['skipped']}"
+    )
+    print(f"输出目录: {output_folder}")
+
+
+def process_image(args):
+    """处理图片并生成MHR文件"""
+
+    # 设置输出目录
+    output_folder = Path(args.output_folder)
+    output_folder.mkdir(parents=True, exist_ok=True)
+
+    estimator = build_estimator(args)
+
+    if args.image_dir:
+        process_image_dir(args, estimator, output_folder)
+        return
+
+    # 处理图片
+    image_path = Path(args.image)
+    print(f"\n正在处理图片: {image_path}")
+
+    # 读取图片
+    img = cv2.imread(str(image_path))
+    if img is None:
+        raise ValueError(f"无法读取图片: {image_path}")
+
+    # 运行推理
+    outputs = estimator.process_one_image(
+        str(image_path),
+        bbox_thr=args.bbox_thresh,
+        use_mask=args.use_mask,
+    )
+
+    if not outputs:
+        print("未检测到人体!")
+        return
+
+    print(f"检测到 {len(outputs)} 个人体")
+    hand_stats = estimator.hand_stats
+    print(f"跳过的手部裁剪: {hand_stats['skipped']}/{hand_stats['hand_crops']}")
+
+    mhr_path_out = save_outputs(
+        args,
+        estimator,
+        output_folder,
+        image_path,
+        cv2.cvtColor(img, cv2.COLOR_BGR2RGB),
+        outputs,
+    )
+    if args.save_vis:
+        print(f"可视化结果已保存到: {output_folder / f'{image_path.stem}_vis.jpg'}")
 
     print(f"\n处理完成! MHR文件: {mhr_path_out}")
     print(f"使用以下命令启动网页查看器:")
@@ -158,12 +267,17 @@ def main():
         """,
     )
 
-    parser.add_argument(
+    input_group = parser.add_mutually_exclusive_group(required=True)
+    input_group.add_argument(
         "--image",
-        required=True,
         type=str,
         help="输入图片路径",
     )
+    input_group.add_argument(
+        "--image_dir",
+        type=str,
+        help="输入图片目录，批量处理目录中的所有图片",
+    )
     parser.add_argument(
         "--output_folder",
         default="./output",
@@ -224,6 +338,50 @@ def main():
         type=str,
         help="本地MoGe模型文件路径 (model.pt)",
     )
+    parser.add_argument(
+        "--device",
+        default="auto",
+        choices=["auto", "cuda", "cpu"],
+        help="推理设备, auto 时有GPU则使用GPU (默认: auto)",
+    )
+    parser.add_argument(
+        "--cpu_threads",
+        default=0,
+        type=int,
+        help="CPU推理的线程数, 0 表示使用所有可用核心 (默认: 0)",
+    )
+    parser.add_argument(
+        "--cpu_bf16",
+        action="store_true",
+        default=False,
+        help="CPU推理时骨干网络使用bf16自动混合精度 (需要CPU支持AVX512-BF16/AMX)",
+    )
+    parser.add_argument(
+        "--precision",
+        default="fp32",
+        choices=["fp32", "bf16", "fp16"],
+        help="骨干网络和解码器的推理精度, MHR与相机头始终为fp32 (默认: fp32)",
+    )
+    parser.add_argument(
+        "--compile",
+        action="store_true",
+        default=False,
+        help="使用 torch.compile 编译姿态分支 (加载时预热, 适合长视频/大量图片)",
+    )
+    parser.add_argument(
+        "--hand_refine",
+        default="auto",
+        choices=["auto", "always", "never"],
+        help="手部细化策略: auto=跳过过小或不在画面内的手, always=所有手都细化, "
+        "never=不运行手部解码器 (默认: auto)",
+    )
+    parser.add_argument(
+        "--early_exit_tol",
+        default=0.0,
+        type=float,
+        help="身体解码器提前退出阈值 (米): 相邻两层预测的3D关键点最大位移小于该值时"
+        "停止细化该人, 0=运行所有层 (默认: 0)",
+    )
     parser.add_argument(
         "--bbox_thresh",
         default=0.8,
@@ -242,6 +400,24 @@ def main():
         default=False,
         help="同时导出OBJ格式3D模型",
     )
+    parser.add_argument(
+        "--batch_size",
+        default=8,
+        type=int,
+        help="--image_dir 模式下每次检测和推理的图片数 (默认: 8)",
+    )
+    parser.add_argument(
+        "--num_workers",
+        default=4,
+        type=int,
+        help="--image_dir 模式下的图片解码线程数 (默认: 4)",
+    )
+    parser.add_argument(
+        "--num_writers",
+        default=2,
+        type=int,
+        help="--image_dir 模式下的结果写入线程数 (默认: 2)",
+    )
     parser.add_argument(
         "--save_vis",
         action="store_true",
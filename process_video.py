@@ -10,11 +10,18 @@
     - output/<video_name>/frame_0001.mhr.json
     - ...
     - output/<video_name>/video_info.json  # 视频元信息
+    - output/<video_name>/manifest.jsonl   # 已完成帧的清单 (用于 --resume)
+    - output/<video_name>/sequence.mhrseq  # 使用 --output_format mhrseq 时替代逐帧文件
 """
 
 import argparse
 import os
 import json
+import subprocess
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import pyrootutils
@@ -29,8 +36,35 @@ root = pyrootutils.setup_root(
 import cv2
 import numpy as np
 import torch
+import torch.distributed as torch_dist
 from sam_3d_body import load_sam_3d_body, SAM3DBodyEstimator
-from tools.mhr_io import save_mhr
+from sam_3d_body.mesh_regenerator import strip_mesh
+from sam_3d_body.utils.cpu import configure_cpu_inference
+from sam_3d_body.utils.dist import (
+    barrier,
+    broadcast_object_list,
+    collect_results,
+    get_dist_info,
+    is_main_process,
+)
+from tools.intrinsics import INTRINSICS_MODES, load_cached_intrinsics, VideoIntrinsics
+from tools.keyframes import format_report, motion_scores, select_keyframes, selection_report
+from tools.manifest import (
+    file_checksum,
+    FrameManifest,
+    manifest_name,
+    merge_processed_frames,
+    merge_shards,
+    read_manifest,
+    verify_records,
+    VIDEO_INFO_NAME,
+    video_info_name,
+    write_json_atomic,
+)
+from tools.mhr_io import MHRSequenceWriter, save_mhr, VERTEX_ENCODINGS
+from tools.pipeline import background_iter, StageTimer
+from tools.tracking import BoxTracker
+from tools.video_io import iter_batches, shard_frames, VideoFrameReader
 from tools.vis_utils import visualize_sample_together
 from tqdm import tqdm
 
@@ -47,16 +81,14 @@ def process_video(args):
     output_folder = Path(args.output_folder) / video_name
     output_folder.mkdir(parents=True, exist_ok=True)
 
-    # 打开视频
-    cap = cv2.VideoCapture(str(video_path))
-    if not cap.isOpened():
-        raise ValueError(f"无法打开视频: {video_path}")
+    # 打开视频 (顺序流式解码)
+    reader = VideoFrameReader(video_path)
 
     # 获取视频信息
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    fps = reader.fps
+    total_frames = reader.total_frames
+    width = reader.width
+    height = reader.height
 
     print(f"视频信息: {width}x{height}, {fps:.2f}fps, {total_frames}帧")
 
@@ -65,23 +97,85 @@ def process_video(args):
     start_frame = args.start_frame
     end_frame = args.end_frame if args.end_frame > 0 else total_frames
 
-    frames_to_process = list(range(start_frame, min(end_frame, total_frames), frame_skip + 1))
+    frames_to_process = reader.frame_range(start_frame, end_frame, frame_skip)
     print(f"将处理 {len(frames_to_process)} 帧 (跳帧: {frame_skip})")
 
+    # 自适应关键帧: 按运动量把处理帧数预算分配到运动剧烈的片段
+    frame_selection = None
+    if args.frame_budget > 0 or args.motion_threshold > 0:
+        print("正在计算帧运动量...")
+        candidates = frames_to_process
+        scores = motion_scores(video_path, candidates)
+        frames_to_process = select_keyframes(
+            candidates, scores, args.frame_budget, args.motion_threshold
+        )
+        report = selection_report(candidates, scores, frames_to_process)
+        print(format_report(report, args.frame_budget))
+        write_json_atomic(output_folder / "frame_selection.json", report, indent=2)
+        frame_selection = {
+            "frame_budget": args.frame_budget,
+            "motion_threshold": args.motion_threshold,
+            "num_candidates": report["num_candidates"],
+            "num_selected": report["num_selected"],
+        }
+
+    # 分片: 每个分片处理连续的一段帧，写自己的清单和元信息
+    use_cuda = torch.cuda.is_available() and args.device != "cpu"
+    distributed = init_distributed(use_cuda)
+    if distributed:
+        args.shard_id, args.num_shards = get_dist_info()
+    num_shards, shard_id = max(args.num_shards, 1), args.shard_id
+    use_sequence = args.output_format == "mhrseq"
+    if use_sequence and (args.resume or num_shards > 1):
+        raise ValueError("--output_format mhrseq 暂不支持 --resume 和分片处理")
+    # once / median 内参在全部帧 (分片前) 上估计, 各分片得到相同的结果
+    all_frames = frames_to_process
+    if num_shards > 1:
+        frames_to_process = shard_frames(frames_to_process, num_shards, shard_id)
+        print(f"分片 {shard_id}/{num_shards}: 处理 {len(frames_to_process)} 帧")
+
+    # 断点续跑: 跳过清单中已完成且输出文件校验通过的帧
+    manifest_path = output_folder / manifest_name(shard_id, num_shards)
+    done_records = {}
+    if args.resume:
+        wanted = set(frames_to_process)
+        done_records = {
+            frame_idx: record
+            for frame_idx, record in verify_records(
+                output_folder, read_manifest(manifest_path)
+            ).items()
+            if frame_idx in wanted
+        }
+        frames_to_process = [i for i in frames_to_process if i not in done_records]
+        print(f"断点续跑: 已完成 {len(done_records)} 帧, 剩余 {len(frames_to_process)} 帧")
+
     # 获取模型路径
     mhr_path = args.mhr_path or os.environ.get("SAM3D_MHR_PATH", "")
     detector_path = args.detector_path or os.environ.get("SAM3D_DETECTOR_PATH", "")
     segmentor_path = args.segmentor_path or os.environ.get("SAM3D_SEGMENTOR_PATH", "")
 
     # 初始化设备
-    device = torch.device("cuda") if torch.cuda.is_available() else torch.device("cpu")
+    device = torch.device("cuda") if use_cuda else torch.device("cpu")
+    if distributed and use_cuda:
+        device = torch.device("cuda", torch.cuda.current_device())
     print(f"使用设备: {device}")
 
     # 加载模型
     print("正在加载SAM 3D Body模型...")
     model, model_cfg = load_sam_3d_body(
-        args.checkpoint_path, device=device, mhr_path=mhr_path
+        args.checkpoint_path,
+        device=device,
+        mhr_path=mhr_path,
+        precision=args.precision,
     )
+    if device.type == "cpu":
+        num_threads = configure_cpu_inference(
+            model, num_threads=args.cpu_threads, bf16=args.cpu_bf16
+        )
+        print(f"CPU推理线程数: {num_threads}")
+    if args.compile:
+        print("正在编译姿态分支 (torch.compile, 人数分桶 1/2/4/8)...")
+        model.compile_pose_branch(batch_size=args.batch_size)
 
     # 加载可选模块
     human_detector, human_segmentor, fov_estimator = None, None, None
@@ -100,7 +194,17 @@ def process_video(args):
             name=args.segmentor_name, device=device, path=segmentor_path
         )
 
-    if args.fov_name:
+    # 重新处理同一视频时复用 video_info.json 中记录的相机内参，无需加载FOV估计器
+    video_info_path = output_folder / video_info_name(shard_id, num_shards)
+    cached_intrinsics = None
+    if args.fov_name and not args.recompute_intrinsics:
+        cached_intrinsics = load_cached_intrinsics(
+            video_info_path, args.intrinsics
+        ) or load_cached_intrinsics(output_folder / VIDEO_INFO_NAME, args.intrinsics)
+        if cached_intrinsics is not None:
+            print(f"使用 {video_info_path} 中缓存的相机内参 (模式: {args.intrinsics})")
+
+    if args.fov_name and cached_intrinsics is None:
         from tools.build_fov_estimator import FOVEstimator
         print(f"正在加载FOV估计器: {args.fov_name}")
         moge_path = args.local_moge_path if args.local_moge_path else ""
@@ -114,6 +218,33 @@ def process_video(args):
         human_segmentor=human_segmentor,
         fov_estimator=fov_estimator,
     )
+    estimator.hand_refine = args.hand_refine
+    if args.early_exit_tol > 0:
+        estimator.early_exit_tol = args.early_exit_tol
+
+    # 视频级相机内参策略
+    intrinsics = None
+    if fov_estimator is not None or cached_intrinsics is not None:
+        intrinsics = VideoIntrinsics(
+            fov_estimator,
+            mode=args.intrinsics,
+            num_frames=args.intrinsics_frames,
+            scene_cut_threshold=args.scene_cut_threshold,
+            segments=cached_intrinsics,
+        )
+        if distributed and intrinsics.mode in ("once", "median"):
+            # 由 rank 0 估计后广播，避免每个进程重复估计
+            if is_main_process():
+                with VideoFrameReader(video_path) as intrinsics_reader:
+                    intrinsics.initialize(intrinsics_reader.read_frames(all_frames))
+            segments = [intrinsics.segments]
+            broadcast_object_list(segments)
+            intrinsics.segments = segments[0]
+        else:
+            # --launch 或手动分片的子进程各自估计, 但都使用视频的前几帧,
+            # 与不分片时的内参一致
+            with VideoFrameReader(video_path) as intrinsics_reader:
+                intrinsics.initialize(intrinsics_reader.read_frames(all_frames))
 
     # 保存视频元信息
     video_info = {
@@ -126,89 +257,321 @@ def process_video(args):
         "frame_skip": frame_skip,
         "start_frame": start_frame,
         "end_frame": end_frame,
+        "status": "running",
+        "store": args.store,
         "processed_frames": [],
     }
+    if frame_selection is not None:
+        video_info["frame_selection"] = frame_selection
+    if num_shards > 1:
+        video_info["shard"] = {"shard_id": shard_id, "num_shards": num_shards}
+    if intrinsics is not None:
+        video_info["cam_int"] = intrinsics.to_dict()
+    merge_processed_frames(video_info, done_records.values())
+    # 先写入一份未完成的元信息，查看器可以结合清单显示已完成的帧
+    write_json_atomic(video_info_path, video_info, indent=2)
+
+    # 处理帧 (流水线: 解码线程 -> 预处理线程 -> 推理(主线程) -> 写文件线程池)
+    timer = StageTimer()
+    depth = args.pipeline_depth
+    faces_saved = bool(done_records) and (output_folder / "faces.json").exists()
+    manifest = FrameManifest(
+        manifest_path, fsync_every=args.fsync_every, resume=args.resume
+    )
 
-    # 处理帧
-    processed_count = 0
-    faces_saved = False
-
-    for frame_idx in tqdm(frames_to_process, desc="处理视频帧"):
-        cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
-        ret, frame = cap.read()
-
-        if not ret:
-            print(f"警告: 无法读取帧 {frame_idx}")
-            continue
-
-        # 转换颜色空间
-        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-
-        # 运行推理
-        try:
-            outputs = estimator.process_one_image(
-                frame_rgb,
-                bbox_thr=args.bbox_thresh,
-                use_mask=args.use_mask,
+    # 跟踪模式: 只在关键帧运行检测器，其余帧用上一帧关键点传播人体框
+    tracker = None
+    if args.detect_every > 1 and human_detector is not None:
+        tracker = BoxTracker(args.detect_every, redetect_iou=args.redetect_iou)
+        if args.batch_size > 1:
+            print("警告: 跟踪模式依赖上一帧的结果, batch_size 将被设为 1")
+            args.batch_size = 1
+
+    def preprocess(frame_batch):
+        """检测/FOV估计 + 裁剪打包 (TopdownAffine)"""
+        samples = []
+        for frame_idx, frame_rgb in frame_batch:
+            bboxes = tracker.boxes() if tracker is not None else None
+            cam_int = (
+                intrinsics.get(frame_idx, frame_rgb) if intrinsics is not None else None
             )
-        except Exception as e:
-            print(f"警告: 帧 {frame_idx} 处理失败: {e}")
-            continue
-
-        if not outputs:
-            print(f"警告: 帧 {frame_idx} 未检测到人体")
-            continue
+            try:
+                with timer.measure("detect" if bboxes is None else "track"):
+                    sample = estimator.prepare_image(
+                        frame_rgb,
+                        bboxes=bboxes,
+                        cam_int=cam_int,
+                        bbox_thr=args.bbox_thresh,
+                        use_mask=args.use_mask,
+                    )
+            except Exception as e:
+                print(f"警告: 帧 {frame_idx} 预处理失败: {e}")
+                sample = None
+            samples.append(sample)
+
+        valid_samples = [sample for sample in samples if sample is not None]
+        batch = None
+        if valid_samples:
+            with timer.measure("crop", len(valid_samples)):
+                batch = estimator.collate_samples(valid_samples)
+        return frame_batch, samples, batch
+
+    # 序列输出: 所有帧写入同一个 .mhrseq 文件 (在主线程中按帧顺序追加)
+    sequence_writer = None
+    if use_sequence:
+        sequence_writer = MHRSequenceWriter(
+            output_folder / SEQUENCE_NAME,
+            estimator.faces,
+            dtype=args.seq_dtype,
+            metadata={k: v for k, v in video_info.items() if k != "processed_frames"},
+            vertex_encoding=args.vertex_encoding,
+            keyframe_interval=args.keyframe_interval,
+            max_error=args.max_vertex_error,
+            compression=None if args.seq_compression == "none" else args.seq_compression,
+        )
+        sequence_writer.metadata["image_size"] = [width, height]
+        video_info["sequence_file"] = SEQUENCE_NAME
+        write_json_atomic(output_folder / "faces.json", estimator.faces.tolist())
 
-        # 保存MHR文件
+    def write_frame(frame_idx, frame_rgb, outputs, with_faces):
+        """保存单帧的MHR文件和可视化结果，返回 video_info 中的记录"""
         frame_name = f"frame_{frame_idx:06d}"
         mhr_path_out = output_folder / f"{frame_name}.mhr.json"
-
-        # 第一帧保存faces，后续帧不重复保存以节省空间
-        if not faces_saved:
-            save_mhr(
-                mhr_path_out,
-                outputs,
-                estimator.faces,
-                image_path=f"frame_{frame_idx}",
-                image_size=(width, height),
-            )
-            faces_saved = True
-            # 单独保存faces文件供后续使用
-            faces_path = output_folder / "faces.json"
-            with open(faces_path, 'w') as f:
-                json.dump(estimator.faces.tolist(), f)
-        else:
-            # 后续帧不保存faces
-            save_mhr_without_faces(
-                mhr_path_out,
-                outputs,
-                image_path=f"frame_{frame_idx}",
-                image_size=(width, height),
-            )
-
-        video_info["processed_frames"].append({
+        record = {
             "frame_idx": frame_idx,
             "file": f"{frame_name}.mhr.json",
             "num_people": len(outputs),
-        })
+        }
+        # 只保存参数时网格可由 MeshRegenerator 按需重建
+        saved_outputs = strip_mesh(outputs) if args.store == "params" else outputs
+
+        # 序列输出时数据已在主线程写入 .mhrseq，file 只作为该帧的名称
+        if sequence_writer is None:
+            with timer.measure("write"):
+                # 第一帧保存faces，后续帧不重复保存以节省空间
+                if with_faces:
+                    save_mhr(
+                        mhr_path_out,
+                        saved_outputs,
+                        estimator.faces,
+                        image_path=f"frame_{frame_idx}",
+                        image_size=(width, height),
+                    )
+                    # 单独保存faces文件供后续使用 (多个分片可能同时写入)
+                    faces_path = output_folder / "faces.json"
+                    write_json_atomic(faces_path, estimator.faces.tolist())
+                else:
+                    # 后续帧不保存faces
+                    save_mhr_without_faces(
+                        mhr_path_out,
+                        saved_outputs,
+                        image_path=f"frame_{frame_idx}",
+                        image_size=(width, height),
+                    )
+                record["sha256"] = file_checksum(mhr_path_out)
 
         # 可选：保存可视化
         if args.save_vis:
-            vis_path = output_folder / f"{frame_name}_vis.jpg"
-            rend_img = visualize_sample_together(frame, outputs, estimator.faces)
-            cv2.imwrite(str(vis_path), rend_img.astype(np.uint8))
+            with timer.measure("vis"):
+                vis_path = output_folder / f"{frame_name}_vis.jpg"
+                frame = cv2.cvtColor(frame_rgb, cv2.COLOR_RGB2BGR)
+                rend_img = visualize_sample_together(frame, outputs, estimator.faces)
+                cv2.imwrite(str(vis_path), rend_img.astype(np.uint8))
+
+        return record
+
+    # 按提交顺序收集写文件结果，保证 processed_frames 和清单有序
+    pending = deque()
+    new_records = []
+
+    def collect(max_pending):
+        while len(pending) > max_pending:
+            record = pending.popleft().result()
+            manifest.append(record)
+            new_records.append(record)
+
+    frames = background_iter(
+        timer.wrap_iter(reader.read_frames(frames_to_process), "decode"), depth
+    )
+    prepared = background_iter(
+        (preprocess(frame_batch) for frame_batch in iter_batches(frames, args.batch_size)),
+        # 跟踪模式下预处理需要上一帧的推理结果，因此在主线程中按需执行
+        depth if tracker is None else 0,
+    )
+
+    wall_start = time.perf_counter()
+    pbar = tqdm(total=len(frames_to_process), desc="处理视频帧")
+    writer = ThreadPoolExecutor(max_workers=max(args.num_writers, 1))
+    for frame_batch, samples, batch in prepared:
+        pbar.update(len(frame_batch))
+
+        batch_outputs = [[] for _ in frame_batch]
+        if batch is not None:
+            valid_idx = [i for i, sample in enumerate(samples) if sample is not None]
+            # 运行推理 (多帧打包为一个batch)
+            try:
+                with timer.measure("inference", len(valid_idx)):
+                    outputs = estimator.run_batch(
+                        batch, [samples[i] for i in valid_idx]
+                    )
+            except Exception as e:
+                frame_ids = [frame_batch[i][0] for i in valid_idx]
+                print(f"警告: 帧 {frame_ids} 处理失败: {e}")
+                if tracker is not None:
+                    tracker.reset()
+                continue
+            for i, out in zip(valid_idx, outputs):
+                batch_outputs[i] = out
+
+        if tracker is not None:
+            tracker.update(batch_outputs[-1], (width, height))
+
+        for (frame_idx, frame_rgb), outputs in zip(frame_batch, batch_outputs):
+            if not outputs:
+                print(f"警告: 帧 {frame_idx} 未检测到人体")
+                continue
+
+            if sequence_writer is not None:
+                with timer.measure("write"):
+                    sequence_writer.add_frame(
+                        frame_idx,
+                        strip_mesh(outputs) if args.store == "params" else outputs,
+                    )
+
+            pending.append(
+                writer.submit(write_frame, frame_idx, frame_rgb, outputs, not faces_saved)
+            )
+            faces_saved = True
 
-        processed_count += 1
+            # 限制未完成的写任务数量，避免帧数据堆积在内存中
+            collect(depth * max(args.batch_size, 1))
 
-    cap.release()
+    collect(0)
+    writer.shutdown()
+    if sequence_writer is not None:
+        with timer.measure("write"):
+            sequence_writer.close()
+    manifest.close()
+    pbar.close()
+    reader.release()
+    wall_time = time.perf_counter() - wall_start
+    processed_count = len(new_records)
 
     # 保存视频信息
-    video_info_path = output_folder / "video_info.json"
-    with open(video_info_path, 'w') as f:
-        json.dump(video_info, f, indent=2)
+    video_info["status"] = "complete"
+    if intrinsics is not None:
+        video_info["cam_int"] = intrinsics.to_dict()
+    merge_processed_frames(video_info, new_records)
+    write_json_atomic(video_info_path, video_info, indent=2)
+
+    if distributed:
+        # 收集各 rank 完成的帧，由 rank 0 合并出最终的 video_info.json
+        shard_frames_list = collect_results(
+            [video_info["processed_frames"]],
+            num_shards,
+            device="gpu" if use_cuda else "cpu",
+        )
+        if is_main_process():
+            merged_info = {k: v for k, v in video_info.items() if k != "shard"}
+            merged_info["processed_frames"] = []
+            for frames in shard_frames_list:
+                merge_processed_frames(merged_info, frames)
+            write_json_atomic(output_folder / VIDEO_INFO_NAME, merged_info, indent=2)
+        barrier()
 
     print(f"\n处理完成!")
     print(f"成功处理 {processed_count}/{len(frames_to_process)} 帧")
+    if done_records:
+        print(f"沿用之前已完成的 {len(done_records)} 帧")
+    hand_stats = estimator.hand_stats
+    print(
+        f"手部裁剪 (策略: {estimator.hand_refine}): 共 {hand_stats['hand_crops']}, "
+        f"跳过 {hand_stats['skipped']}"
+    )
+    print(f"输出目录: {output_folder}")
+    print(f"\n各阶段耗时 (流水线深度: {depth}):")
+    print(timer.summary(wall_time))
+    if intrinsics is not None:
+        print(
+            f"\n相机内参模式: {intrinsics.mode}, 分段数: {len(intrinsics.segments)}, "
+            f"FOV估计次数: {intrinsics.num_estimated}"
+        )
+    if tracker is not None:
+        print(f"\n跟踪模式 (每 {tracker.detect_every} 帧检测一次):")
+        print(
+            tracker.summary(
+                (timer.totals["detect"], timer.counts["detect"]),
+                (timer.totals["track"], timer.counts["track"]),
+            )
+        )
+    if num_shards > 1 and not distributed:
+        print(f"\n所有分片完成后合并结果:")
+        print(
+            f"  python process_video.py --video {args.video} "
+            f"--output_folder {args.output_folder} --num_shards {num_shards} --merge"
+        )
+    else:
+        print(f"\n使用以下命令播放:")
+        print(f"  python viewer.py --mhr_folder {output_folder}")
+
+
+SEQUENCE_NAME = "sequence.mhrseq"
+
+
+def init_distributed(use_cuda=True):
+    """使用 torchrun 启动时 (WORLD_SIZE > 1) 初始化进程组，每个 rank 作为一个分片"""
+    if int(os.environ.get("WORLD_SIZE", 1)) <= 1:
+        return False
+    if not torch_dist.is_initialized():
+        if use_cuda:
+            torch.cuda.set_device(int(os.environ.get("LOCAL_RANK", 0)))
+        torch_dist.init_process_group(backend="nccl" if use_cuda else "gloo")
+    return True
+
+
+def visible_devices():
+    """当前进程可见的GPU编号 (优先使用 CUDA_VISIBLE_DEVICES)"""
+    env = os.environ.get("CUDA_VISIBLE_DEVICES")
+    if env is not None:
+        return [d.strip() for d in env.split(",") if d.strip()]
+    return [str(i) for i in range(torch.cuda.device_count())]
+
+
+def launch_shards(args):
+    """为每个可见GPU启动一个分片子进程，全部结束后合并结果"""
+    devices = visible_devices()
+    if not devices:
+        raise RuntimeError("未找到可用的GPU, 无法使用 --launch")
+    num_shards = len(devices)
+    print(f"启动 {num_shards} 个分片: GPU {devices}")
+
+    argv = [a for a in sys.argv[1:] if a != "--launch"]
+    procs = []
+    for shard_id, device in enumerate(devices):
+        cmd = [
+            sys.executable,
+            str(Path(__file__).resolve()),
+            *argv,
+            "--num_shards",
+            str(num_shards),
+            "--shard_id",
+            str(shard_id),
+        ]
+        env = dict(os.environ, CUDA_VISIBLE_DEVICES=device)
+        procs.append(subprocess.Popen(cmd, env=env))
+
+    failed = [i for i, proc in enumerate(procs) if proc.wait() != 0]
+    if failed:
+        print(f"警告: 分片 {failed} 运行失败, 可使用 --resume 重新启动后再合并")
+
+    merge_video_shards(args, num_shards)
+
+
+def merge_video_shards(args, num_shards):
+    """合并各分片的输出为单个 video_info.json"""
+    output_folder = Path(args.output_folder) / Path(args.video).stem
+    video_info = merge_shards(output_folder, num_shards)
+    print(f"\n合并完成: {len(video_info['processed_frames'])} 帧, 状态: {video_info['status']}")
     print(f"输出目录: {output_folder}")
     print(f"\n使用以下命令播放:")
     print(f"  python viewer.py --mhr_folder {output_folder}")
@@ -264,6 +627,14 @@ def main():
     python process_video.py --video ./test.mp4
     python process_video.py --video ./test.mp4 --frame_skip 2  # 每3帧处理1帧
     python process_video.py --video ./test.mp4 --start_frame 100 --end_frame 200
+    python process_video.py --video ./test.mp4 --batch_size 4 --pipeline_depth 8
+    python process_video.py --video ./test.mp4 --frame_budget 300  # 按运动量选300帧
+    python process_video.py --video ./test.mp4 --detect_every 10  # 每10帧检测一次
+    python process_video.py --video ./test.mp4 --resume  # 从上次中断处继续
+    python process_video.py --video ./test.mp4 --launch  # 每个GPU一个分片
+    python process_video.py --video ./test.mp4 --num_shards 2 --shard_id 0
+    python process_video.py --video ./test.mp4 --num_shards 2 --merge
+    torchrun --nproc_per_node 4 process_video.py --video ./test.mp4
         """,
     )
 
@@ -327,6 +698,75 @@ def main():
         type=str,
         help="本地MoGe模型文件路径",
     )
+    parser.add_argument(
+        "--device",
+        default="auto",
+        choices=["auto", "cuda", "cpu"],
+        help="推理设备, auto 时有GPU则使用GPU (默认: auto)",
+    )
+    parser.add_argument(
+        "--cpu_threads",
+        default=0,
+        type=int,
+        help="CPU推理的线程数, 0 表示使用所有可用核心 (默认: 0)",
+    )
+    parser.add_argument(
+        "--cpu_bf16",
+        action="store_true",
+        default=False,
+        help="CPU推理时骨干网络使用bf16自动混合精度 (需要CPU支持AVX512-BF16/AMX)",
+    )
+    parser.add_argument(
+        "--precision",
+        default="fp32",
+        choices=["fp32", "bf16", "fp16"],
+        help="骨干网络和解码器的推理精度, MHR与相机头始终为fp32 (默认: fp32)",
+    )
+    parser.add_argument(
+        "--compile",
+        action="store_true",
+        default=False,
+        help="使用 torch.compile 编译姿态分支 (加载时预热, 适合长视频/大量图片)",
+    )
+    parser.add_argument(
+        "--hand_refine",
+        default="auto",
+        choices=["auto", "always", "never"],
+        help="手部细化策略: auto=跳过过小或不在画面内的手, always=所有手都细化, "
+        "never=不运行手部解码器 (默认: auto)",
+    )
+    parser.add_argument(
+        "--early_exit_tol",
+        default=0.0,
+        type=float,
+        help="身体解码器提前退出阈值 (米): 相邻两层预测的3D关键点最大位移小于该值时"
+        "停止细化该人, 0=运行所有层 (默认: 0)",
+    )
+    parser.add_argument(
+        "--intrinsics",
+        default="once",
+        choices=INTRINSICS_MODES,
+        help="相机内参策略: per_frame=每帧估计, once=只估计第一帧, "
+        "median=前N帧取中位数, scene_cut=镜头切换时重新估计 (默认: once)",
+    )
+    parser.add_argument(
+        "--intrinsics_frames",
+        default=5,
+        type=int,
+        help="median 模式下参与估计的帧数 (默认: 5)",
+    )
+    parser.add_argument(
+        "--scene_cut_threshold",
+        default=0.5,
+        type=float,
+        help="相邻帧颜色直方图相关系数低于该值视为镜头切换 (默认: 0.5)",
+    )
+    parser.add_argument(
+        "--recompute_intrinsics",
+        action="store_true",
+        default=False,
+        help="忽略 video_info.json 中缓存的相机内参，重新估计",
+    )
     parser.add_argument(
         "--bbox_thresh",
         default=0.8,
@@ -357,6 +797,127 @@ def main():
         type=int,
         help="结束帧 (默认: -1 表示处理到最后)",
     )
+    parser.add_argument(
+        "--frame_budget",
+        default=0,
+        type=int,
+        help="按运动量自适应选帧时最多处理的帧数, 与 --motion_threshold 同时使用时在阈值选出的帧中挑选 (默认: 0, 不限制)",
+    )
+    parser.add_argument(
+        "--motion_threshold",
+        default=0.0,
+        type=float,
+        help="累计帧差运动量 (0-255灰度) 超过该值时处理一帧 (默认: 0, 不使用)",
+    )
+    parser.add_argument(
+        "--batch_size",
+        default=1,
+        type=int,
+        help="每次推理打包的帧数 (默认: 1)",
+    )
+    parser.add_argument(
+        "--detect_every",
+        default=1,
+        type=int,
+        help="每隔多少帧运行一次人体检测器, 中间帧沿用上一帧关键点得到的人体框 (默认: 1, 每帧检测)",
+    )
+    parser.add_argument(
+        "--redetect_iou",
+        default=0.5,
+        type=float,
+        help="跟踪框与预测关键点框的IoU低于该值时下一帧重新检测 (默认: 0.5)",
+    )
+    parser.add_argument(
+        "--pipeline_depth",
+        default=4,
+        type=int,
+        help="流水线各阶段之间队列的容量, 0 表示串行执行 (默认: 4)",
+    )
+    parser.add_argument(
+        "--num_writers",
+        default=2,
+        type=int,
+        help="写MHR文件/可视化的线程数 (默认: 2)",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        default=False,
+        help="断点续跑: 跳过清单中已完成且校验通过的帧",
+    )
+    parser.add_argument(
+        "--fsync_every",
+        default=50,
+        type=int,
+        help="每完成多少帧将清单同步到磁盘 (默认: 50)",
+    )
+    parser.add_argument(
+        "--num_shards",
+        default=1,
+        type=int,
+        help="将视频切分为多少个分片, 每个分片处理连续的一段帧 (默认: 1)",
+    )
+    parser.add_argument(
+        "--shard_id",
+        default=0,
+        type=int,
+        help="当前进程处理的分片编号 (默认: 0)",
+    )
+    parser.add_argument(
+        "--launch",
+        action="store_true",
+        default=False,
+        help="为每个可见GPU启动一个分片进程, 结束后自动合并",
+    )
+    parser.add_argument(
+        "--merge",
+        action="store_true",
+        default=False,
+        help="只合并 --num_shards 个分片的结果, 不进行处理",
+    )
+    parser.add_argument(
+        "--output_format",
+        default="json",
+        choices=["json", "mhrseq"],
+        help="输出格式: json=每帧一个.mhr.json文件, mhrseq=单个二进制序列文件 (默认: json)",
+    )
+    parser.add_argument(
+        "--store",
+        default="full",
+        choices=["full", "params"],
+        help="保存内容: full=网格顶点和关键点, params=只保存MHR参数和相机 (体积约小100倍, "
+        "网格可用 MeshRegenerator 重建) (默认: full)",
+    )
+    parser.add_argument(
+        "--seq_dtype",
+        default="float32",
+        choices=["float32", "float16"],
+        help="mhrseq 格式中顶点和3D关键点的存储精度 (默认: float32)",
+    )
+    parser.add_argument(
+        "--vertex_encoding",
+        default="raw",
+        choices=VERTEX_ENCODINGS,
+        help="mhrseq 格式的顶点编码: raw=逐帧完整存储, delta=关键帧+int16量化增量 (默认: raw)",
+    )
+    parser.add_argument(
+        "--keyframe_interval",
+        default=10,
+        type=int,
+        help="delta 编码的关键帧间隔 (默认: 10)",
+    )
+    parser.add_argument(
+        "--max_vertex_error",
+        default=5e-4,
+        type=float,
+        help="delta 编码允许的最大顶点误差, 单位米 (默认: 0.0005)",
+    )
+    parser.add_argument(
+        "--seq_compression",
+        default="none",
+        choices=["none", "zstd"],
+        help="delta 编码增量的压缩方式 (默认: none)",
+    )
     parser.add_argument(
         "--save_vis",
         action="store_true",
@@ -365,7 +926,12 @@ def main():
     )
 
     args = parser.parse_args()
-    process_video(args)
+    if args.merge:
+        merge_video_shards(args, args.num_shards)
+    elif args.launch:
+        launch_shards(args)
+    else:
+        process_video(args)
 
 
 if __name__ == "__main__":
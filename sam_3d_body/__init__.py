@@ -2,11 +2,19 @@
 __version__ = "1.0.0"
 
 from .sam_3d_body_estimator import SAM3DBodyEstimator
-from .build_models import load_sam_3d_body, load_sam_3d_body_hf
+from .export import export_body_pipeline, ExportedBodyModel
+from .build_models import load_mhr_head, load_sam_3d_body, load_sam_3d_body_hf
+from .mesh_regenerator import MeshRegenerator
+from .prompt_session import PromptSession
 
 __all__ = [
     "__version__",
+    "export_body_pipeline",
+    "ExportedBodyModel",
+    "load_mhr_head",
     "load_sam_3d_body",
     "load_sam_3d_body_hf",
+    "MeshRegenerator",
+    "PromptSession",
     "SAM3DBodyEstimator",
 ]
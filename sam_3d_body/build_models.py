@@ -1,15 +1,57 @@
 # Copyright (c) Meta Platforms, Inc. and affiliates.
 import os
 import torch
+import torch.nn as nn
 
+from .models.heads import build_head
 from .models.meta_arch import SAM3DBody
 from .utils.config import get_config
 from .utils.checkpoint import load_state_dict
 
 
-def load_sam_3d_body(checkpoint_path: str = "", device: str = "cuda", mhr_path: str = ""):
+def load_sam_3d_body(
+    checkpoint_path: str = "",
+    device: str = "cuda",
+    mhr_path: str = "",
+    precision: str = "fp32",
+    compile: bool = False,
+    person_buckets=(1, 2, 4, 8),
+    compile_mode: str = "default",
+):
+    """
+    Args:
+        precision: "fp32", or "bf16" / "fp16" to run the backbone and decoders
+            in reduced precision (MHR and camera heads stay in fp32)
+        compile: run the pose branch through `torch.compile`, with person counts
+            padded to `person_buckets` so the compiled graphs are reused; all
+            buckets are compiled (warmed up) here
+        compile_mode: `torch.compile` mode ("reduce-overhead" for CUDA graphs)
+    """
     print("Loading SAM 3D Body model...")
     
+    model_cfg = _get_model_cfg(checkpoint_path, mhr_path)
+
+    # Initialze the model
+    model = SAM3DBody(model_cfg)
+
+    checkpoint = torch.load(checkpoint_path, map_location="cpu", weights_only=False)
+    if "state_dict" in checkpoint:
+        state_dict = checkpoint["state_dict"]
+    else:
+        state_dict = checkpoint
+    load_state_dict(model, state_dict, strict=False)
+
+    model = model.to(device)
+    model.eval()
+    model.set_precision(precision)
+
+    if compile:
+        print(f"Compiling pose branch for person buckets {tuple(person_buckets)}...")
+        model.compile_pose_branch(person_buckets, mode=compile_mode)
+    return model, model_cfg
+
+
+def _get_model_cfg(checkpoint_path: str, mhr_path: str = ""):
     # Check the current directory, and if not present check the parent dir.
     model_cfg = os.path.join(os.path.dirname(checkpoint_path), "model_config.yaml")
     if not os.path.exists(model_cfg):
@@ -24,20 +66,34 @@ def load_sam_3d_body(checkpoint_path: str = "", device: str = "cuda", mhr_path:
     model_cfg.defrost()
     model_cfg.MODEL.MHR_HEAD.MHR_MODEL_PATH = mhr_path
     model_cfg.freeze()
+    return model_cfg
 
-    # Initialze the model
-    model = SAM3DBody(model_cfg)
+
+def load_mhr_head(checkpoint_path: str = "", mhr_path: str = "", device: str = "cpu"):
+    """Load only the body MHR head (no backbone/decoder), e.g. for mesh regeneration."""
+    model_cfg = _get_model_cfg(checkpoint_path, mhr_path)
+
+    # Mirror the head setup in SAM3DBody.__init__
+    head = build_head(model_cfg, model_cfg.MODEL.PERSON_HEAD.POSE_TYPE)
+    head.hand_pose_comps_ori = nn.Parameter(
+        head.hand_pose_comps.clone(), requires_grad=False
+    )
+    head.hand_pose_comps.data = torch.eye(54).to(head.hand_pose_comps.data).float()
 
     checkpoint = torch.load(checkpoint_path, map_location="cpu", weights_only=False)
     if "state_dict" in checkpoint:
         state_dict = checkpoint["state_dict"]
     else:
         state_dict = checkpoint
-    load_state_dict(model, state_dict, strict=False)
+    prefix = "head_pose."
+    state_dict = {
+        k[len(prefix) :]: v for k, v in state_dict.items() if k.startswith(prefix)
+    }
+    load_state_dict(head, state_dict, strict=False)
 
-    model = model.to(device)
-    model.eval()
-    return model, model_cfg
+    head = head.to(device)
+    head.eval()
+    return head
 
 
 def _hf_download(repo_id):
@@ -48,4 +104,4 @@ def _hf_download(repo_id):
 
 def load_sam_3d_body_hf(repo_id, **kwargs):
     ckpt_path, mhr_path = _hf_download(repo_id)
-    return load_sam_3d_body(checkpoint_path=ckpt_path, mhr_path=mhr_path)
+    return load_sam_3d_body(checkpoint_path=ckpt_path, mhr_path=mhr_path, **kwargs)
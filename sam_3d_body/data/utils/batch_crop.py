@@ -0,0 +1,217 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+from typing import List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from sam_3d_body.data.transforms.bbox_utils import bbox_xyxy2cs, fix_aspect_ratio
+
+from .prepare_batch import NoCollate, PERSON_KEYS
+
+
+class BatchCropper:
+    """
+    Crop all person (or hand) patches of several images on the model device.
+
+    This is a vectorized equivalent of `prepare_batch_multi` with the
+    `Compose([GetBBoxCenterScale(padding), TopdownAffine(input_size),
+    VisionTransformWrapper(ToTensor())])` transform: the affine matrices of all
+    boxes are built at once, and every crop of an image is sampled in a single
+    `grid_sample` call from the image uploaded once to the device. The output
+    batch has the same fields (`affine_trans`, `bbox_center`, `bbox_scale`, ...)
+    and layout as `prepare_batch_multi`; pixel values match `cv2.warpAffine`
+    up to its fixed-point interpolation rounding (`check_parity.py crop`
+    checks this, flipped and out-of-image boxes included).
+
+    Args:
+        input_size: model input size (w, h)
+        padding: bbox padding, as in `GetBBoxCenterScale`
+        aspect_ratio: prior bbox aspect ratio, as in `TopdownAffine`
+    """
+
+    def __init__(
+        self,
+        input_size: Union[int, Tuple[int, int]],
+        padding: float = 1.25,
+        aspect_ratio: float = 0.75,
+    ):
+        if isinstance(input_size, int):
+            input_size = (input_size, input_size)
+        self.input_size = (int(input_size[0]), int(input_size[1]))
+        self.padding = padding
+        self.aspect_ratio = aspect_ratio
+
+    @staticmethod
+    def upload(imgs: Sequence[np.ndarray], device: torch.device) -> List[torch.Tensor]:
+        """Copy HxWx3 uint8 RGB images to `device` as 3xHxW float tensors in [0, 1]."""
+        tensors = []
+        for img in imgs:
+            x = torch.from_numpy(np.ascontiguousarray(img)).to(device, non_blocking=True)
+            tensors.append(x.permute(2, 0, 1).float().div_(255.0))
+        return tensors
+
+    def affine_params(self, boxes: np.ndarray):
+        """
+        Args:
+            boxes: (N, 4) xyxy boxes
+
+        Returns:
+            bbox_center (N, 2), bbox_scale (N, 2) and affine_trans (N, 2, 3),
+            identical to `GetBBoxCenterScale` + `TopdownAffine` (rotation 0).
+        """
+        w, h = self.input_size
+        center, scale = bbox_xyxy2cs(boxes.reshape(-1, 4), padding=self.padding)
+        scale = fix_aspect_ratio(scale, aspect_ratio=self.aspect_ratio)
+        scale = fix_aspect_ratio(scale, aspect_ratio=w / h)
+
+        # get_warp_matrix without rotation: a uniform scale that maps the bbox
+        # width to the output width, centered on the bbox center
+        k = w / scale[:, 0]
+        affine_trans = np.zeros((len(boxes), 2, 3), dtype=np.float64)
+        affine_trans[:, 0, 0] = k
+        affine_trans[:, 1, 1] = k
+        affine_trans[:, 0, 2] = w * 0.5 - k * center[:, 0]
+        affine_trans[:, 1, 2] = h * 0.5 - k * center[:, 1]
+        return center, scale, affine_trans
+
+    def _sample(
+        self, img: torch.Tensor, affine_trans: torch.Tensor, flip: bool
+    ) -> torch.Tensor:
+        """Sample N crops of a CxHxW image with bilinear interpolation -> NxCxhxw."""
+        w, h = self.input_size
+        channels, height, width = img.shape
+        num = affine_trans.shape[0]
+
+        # Output pixel (x, y) reads input pixel ((x - tx) / k, (y - ty) / k)
+        xs = torch.arange(w, device=img.device, dtype=torch.float32)
+        ys = torch.arange(h, device=img.device, dtype=torch.float32)
+        k = affine_trans[:, 0, 0].view(num, 1, 1)
+        u = (xs.view(1, 1, w) - affine_trans[:, 0, 2].view(num, 1, 1)) / k
+        v = (ys.view(1, h, 1) - affine_trans[:, 1, 2].view(num, 1, 1)) / k
+        if flip:
+            # Boxes are given in the horizontally flipped image
+            u = (width - 1) - u
+
+        # Pixel indices to grid_sample coordinates (align_corners=False)
+        grid = torch.stack(
+            [
+                ((2 * u + 1) / width - 1).expand(num, h, w),
+                ((2 * v + 1) / height - 1).expand(num, h, w),
+            ],
+            dim=-1,
+        )
+        # Stack all crops vertically so that one grid_sample call covers them
+        crops = F.grid_sample(
+            img[None],
+            grid.reshape(1, num * h, w, 2),
+            mode="bilinear",
+            padding_mode="zeros",
+            align_corners=False,
+        )
+        return crops.view(channels, num, h, w).transpose(0, 1)
+
+    def crop(
+        self,
+        imgs: Sequence[torch.Tensor],
+        boxes_list: Sequence[np.ndarray],
+        masks_list: Optional[Sequence[Optional[np.ndarray]]] = None,
+        masks_score_list: Optional[Sequence[Optional[np.ndarray]]] = None,
+        cam_int: Optional[torch.Tensor] = None,
+        flip: Union[bool, Sequence[bool]] = False,
+        image_index: Optional[Sequence[int]] = None,
+    ):
+        """
+        Build a [batch_size, num_person] batch like `prepare_batch_multi`.
+
+        Args:
+            imgs: device images from `upload`
+            boxes_list: list of (num_person_i, 4) xyxy boxes, one per batch row
+            masks_list / masks_score_list: optional per-row masks and scores
+            cam_int: optional intrinsics of shape (batch_size, 3, 3)
+            flip: crop from the horizontally flipped images (boxes are given in
+                flipped coordinates), like the left-hand pass of `run_inference`;
+                either one flag for all rows or one per row
+            image_index: optional index into `imgs` for every row (by default
+                row i crops from imgs[i]), so that several rows can share an
+                uploaded image without copying it
+        """
+        if image_index is None:
+            image_index = range(len(boxes_list))
+        if isinstance(flip, bool):
+            flip = [flip] * len(boxes_list)
+        row_imgs = [imgs[j] for j in image_index]
+        device = row_imgs[0].device
+        w, h = self.input_size
+        max_num_person = max(len(boxes) for boxes in boxes_list)
+
+        frames = []
+        for i, (img, boxes) in enumerate(zip(row_imgs, boxes_list)):
+            boxes = np.asarray(boxes).reshape(-1, 4)
+            num = len(boxes)
+            height, width = img.shape[1:]
+            center, scale, affine_trans = self.affine_params(boxes)
+            affine_trans = torch.as_tensor(affine_trans, device=device).float()
+
+            frame = dict(
+                img=self._sample(img, affine_trans, flip[i]),
+                img_size=torch.tensor([[w, h]], device=device).expand(num, 2),
+                ori_img_size=torch.tensor([[width, height]], device=device).expand(
+                    num, 2
+                ),
+                bbox_center=torch.as_tensor(center, device=device),
+                bbox_scale=torch.as_tensor(scale, device=device),
+                bbox=torch.as_tensor(boxes, device=device),
+                affine_trans=affine_trans,
+            )
+
+            masks = masks_list[i] if masks_list is not None else None
+            if masks is not None:
+                masks = torch.as_tensor(
+                    masks.reshape(-1, height, width), device=device
+                ).float()
+                # cv2.warpAffine rounds the interpolated uint8 mask
+                frame["mask"] = torch.cat(
+                    [
+                        self._sample(mask[None], affine_trans[j : j + 1], flip[i])
+                        for j, mask in enumerate(masks)
+                    ]
+                ).round()
+                scores = masks_score_list[i] if masks_score_list is not None else None
+                frame["mask_score"] = (
+                    torch.as_tensor(scores, device=device)
+                    if scores is not None
+                    else torch.ones(num, device=device)
+                )
+            else:
+                frame["mask"] = torch.zeros((num, 1, h, w), device=device)
+                frame["mask_score"] = torch.zeros(num, device=device)
+
+            # Pad the person dimension by repeating the last crop
+            num_pad = max_num_person - num
+            for key, x in frame.items():
+                x = x.float()
+                if num_pad > 0:
+                    x = torch.cat([x, x[-1:].expand(num_pad, *x.shape[1:])], dim=0)
+                frame[key] = x[None]
+            person_valid = torch.zeros((1, max_num_person), device=device)
+            person_valid[:, :num] = 1
+            frame["person_valid"] = person_valid
+
+            if cam_int is not None:
+                frame["cam_int"] = cam_int[i : i + 1].to(frame["img"])
+            else:
+                # Default camera intrinsics according image size
+                focal = (height**2 + width**2) ** 0.5
+                frame["cam_int"] = torch.tensor(
+                    [[[focal, 0, width / 2.0], [0, focal, height / 2.0], [0, 0, 1]]],
+                    device=device,
+                ).float()
+            frames.append(frame)
+
+        batch = {
+            key: torch.cat([frame[key] for frame in frames], dim=0)
+            for key in PERSON_KEYS + ["person_valid", "cam_int"]
+        }
+        batch["img_ori"] = [NoCollate(img) for img in row_imgs]
+        return batch
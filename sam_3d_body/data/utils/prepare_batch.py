@@ -5,6 +5,20 @@ import torch
 from torch.utils.data import default_collate
 
 
+# Per-person fields with a leading [batch_size, num_person] shape
+PERSON_KEYS = [
+    "img",
+    "img_size",
+    "ori_img_size",
+    "bbox_center",
+    "bbox_scale",
+    "bbox",
+    "affine_trans",
+    "mask",
+    "mask_score",
+]
+
+
 class NoCollate:
     def __init__(self, data):
         self.data = data
@@ -43,17 +57,7 @@ def prepare_batch(
     batch = default_collate(data_list)
 
     max_num_person = batch["img"].shape[0]
-    for key in [
-        "img",
-        "img_size",
-        "ori_img_size",
-        "bbox_center",
-        "bbox_scale",
-        "bbox",
-        "affine_trans",
-        "mask",
-        "mask_score",
-    ]:
+    for key in PERSON_KEYS:
         if key in batch:
             batch[key] = batch[key].unsqueeze(0).float()
     if "mask" in batch:
@@ -76,3 +80,64 @@ def prepare_batch(
 
     batch["img_ori"] = [NoCollate(img)]
     return batch
+
+
+def prepare_batch_multi(
+    imgs,
+    transform,
+    boxes_list,
+    masks_list=None,
+    masks_score_list=None,
+    cam_int=None,
+):
+    """
+    Prepare a [batch_size, num_person] batch from several images.
+
+    Each image is processed with `prepare_batch`, then the person dimension is
+    padded to the largest person count by repeating the last crop. Padded
+    entries are marked with ``person_valid == 0``.
+
+    Args:
+        imgs: list of RGB images (may have different sizes)
+        boxes_list: list of (num_person_i, 4) xyxy boxes, one per image
+        masks_list / masks_score_list: optional per-image masks and scores
+        cam_int: optional intrinsics of shape (batch_size, 3, 3)
+    """
+    frame_batches = []
+    for i, img in enumerate(imgs):
+        frame_batches.append(
+            prepare_batch(
+                img,
+                transform,
+                boxes_list[i],
+                masks_list[i] if masks_list is not None else None,
+                masks_score_list[i] if masks_score_list is not None else None,
+                cam_int=cam_int[i : i + 1] if cam_int is not None else None,
+            )
+        )
+    if len(frame_batches) == 1:
+        return frame_batches[0]
+
+    max_num_person = max(b["img"].shape[1] for b in frame_batches)
+    batch = {}
+    for key in PERSON_KEYS + ["person_valid"]:
+        if key not in frame_batches[0]:
+            continue
+        padded = []
+        for frame_batch in frame_batches:
+            x = frame_batch[key]
+            num_pad = max_num_person - x.shape[1]
+            if num_pad > 0:
+                if key == "person_valid":
+                    pad = torch.zeros_like(x[:, :1]).repeat(1, num_pad)
+                else:
+                    pad = x[:, -1:].repeat(
+                        1, num_pad, *([1] * (x.dim() - 2))
+                    )
+                x = torch.cat([x, pad], dim=1)
+            padded.append(x)
+        batch[key] = torch.cat(padded, dim=0)
+
+    batch["cam_int"] = torch.cat([b["cam_int"] for b in frame_batches], dim=0)
+    batch["img_ori"] = sum([b["img_ori"] for b in frame_batches], [])
+    return batch
@@ -0,0 +1,297 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+"""Export the body pose branch to TorchScript / ONNX and run the exported graphs."""
+
+import json
+import os
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+# Per-crop inputs of the exported graphs, all with a leading person dimension
+EXPORT_INPUTS = [
+    "img",  # P x 3 x H x W crops in [0, 1]
+    "affine_trans",  # P x 2 x 3 full-image to crop transforms
+    "cam_int",  # P x 3 x 3 intrinsics of the full image
+    "bbox_center",  # P x 2
+    "bbox_scale",  # P x 2
+    "ori_img_size",  # P x 2 full image (width, height)
+    "img_size",  # P x 2 crop (width, height)
+    "mask",  # P x 1 x H x W crop masks (zeros without masks)
+    "mask_score",  # P
+]
+# Outputs, named after the `mhr` entries of `SAM3DBody.forward_step`
+EXPORT_OUTPUTS = [
+    "pred_vertices",
+    "pred_keypoints_3d",
+    "pred_keypoints_2d",
+    "pred_cam_t",
+    "focal_length",
+    "pred_pose_raw",
+    "global_rot",
+    "body_pose",
+    "hand",
+    "scale",
+    "shape",
+    "face",
+    "pred_joint_coords",
+    "joint_global_rots",
+]
+EXPORT_FORMATS = ["torchscript", "onnx"]
+MANIFEST_NAME = "manifest.json"
+
+
+class BodyPipeline(nn.Module):
+    """
+    The body branch of `SAM3DBody.forward_step` (backbone, body decoder with
+    keypoint token updates, MHR and camera heads) with flat tensor inputs and
+    outputs, for tracing.
+
+    The crops are laid out as [P, 1] (one person per row, with per-row
+    intrinsics) as in the compiled pose branch; config-dependent branches
+    (backbone type, condition type, mask conditioning) are resolved when the
+    module is traced.
+    """
+
+    def __init__(self, model: nn.Module):
+        super().__init__()
+        self.model = model
+
+    def forward(
+        self,
+        img: torch.Tensor,
+        affine_trans: torch.Tensor,
+        cam_int: torch.Tensor,
+        bbox_center: torch.Tensor,
+        bbox_scale: torch.Tensor,
+        ori_img_size: torch.Tensor,
+        img_size: torch.Tensor,
+        mask: torch.Tensor,
+        mask_score: torch.Tensor,
+    ) -> Tuple[torch.Tensor, ...]:
+        model = self.model
+        num = img.shape[0]
+        batch = dict(
+            img=img[:, None],
+            affine_trans=affine_trans[:, None],
+            bbox_center=bbox_center[:, None],
+            bbox_scale=bbox_scale[:, None],
+            ori_img_size=ori_img_size[:, None],
+            img_size=img_size[:, None],
+            mask=mask[:, None],
+            mask_score=mask_score[:, None],
+            person_valid=torch.ones_like(mask_score)[:, None],
+            cam_int=cam_int,
+        )
+        model._initialize_batch(batch)
+        model.body_batch_idx = list(range(num))
+        model.hand_batch_idx = []
+        output = model.forward_pose_branch(batch)["mhr"]
+        return tuple(output[key] for key in EXPORT_OUTPUTS)
+
+
+def flatten_batch(batch: Dict) -> Dict[str, torch.Tensor]:
+    """
+    `EXPORT_INPUTS` of a [B, N] batch from `BatchCropper.crop` or
+    `prepare_batch_multi`, one row per crop (padded crops included).
+    """
+    num_person = batch["img"].shape[1]
+    inputs = {
+        key: batch[key].flatten(0, 1)
+        for key in EXPORT_INPUTS
+        if key not in ("cam_int", "mask", "mask_score")
+    }
+    inputs["cam_int"] = batch["cam_int"].repeat_interleave(num_person, dim=0)
+    inputs["mask"] = batch["mask"].flatten(0, 1)
+    if inputs["mask"].dim() == 3:
+        inputs["mask"] = inputs["mask"][:, None]
+    inputs["mask_score"] = batch["mask_score"].flatten(0, 1)
+    return {key: inputs[key].float() for key in EXPORT_INPUTS}
+
+
+@torch.no_grad()
+def export_body_pipeline(
+    model: nn.Module,
+    output_dir: str,
+    person_buckets: Sequence[int] = (1, 2, 4, 8),
+    export_format: str = "torchscript",
+    opset: int = 17,
+) -> str:
+    """
+    Trace the body pipeline of a loaded `SAM3DBody` for every person bucket
+    and save a self-contained artifact: one graph per bucket, the mesh faces
+    and a manifest. Loading it needs neither the model config, the MHR asset
+    nor `SAM3DBody` itself (see `ExportedBodyModel`).
+
+    Args:
+        model: a loaded `SAM3DBody`; it is moved to CPU and fp32
+        output_dir: artifact directory
+        person_buckets: person counts to trace for; inputs are padded to the
+            next bucket at runtime
+        export_format: "torchscript" or "onnx"
+        opset: ONNX opset version
+
+    Returns:
+        The path of the manifest.
+    """
+    from .data.utils.batch_crop import BatchCropper
+
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {export_format}")
+    os.makedirs(output_dir, exist_ok=True)
+
+    model = model.cpu().float().eval()
+    model.backbone_dtype = torch.float32
+    model.backbone_autocast_dtype = None
+    model.decoder_autocast_dtype = None
+    model._compiled_pose_branch = None
+    # Plain forward: no cross-pass cache and a fixed number of decoder layers
+    model.decoder_kv_cache = False
+    model.decoder_early_exit_tol = None
+    pipeline = BodyPipeline(model).eval()
+
+    # Example crops of a blank image, like `SAM3DBody.warmup_pose_branch`
+    cropper = BatchCropper(model.cfg.MODEL.IMAGE_SIZE)
+    w, h = cropper.input_size
+    img = torch.zeros(3, h * 2, w * 2)
+    box = np.array([[w / 2, h / 2, w * 3 / 2, h * 3 / 2]], dtype=np.float32)
+
+    files = {}
+    for bucket in sorted(person_buckets):
+        batch = cropper.crop([img], [box] * bucket, image_index=[0] * bucket)
+        inputs = flatten_batch(batch)
+        example = tuple(inputs[key] for key in EXPORT_INPUTS)
+        if export_format == "torchscript":
+            name = f"body_p{bucket}.pt"
+            traced = torch.jit.trace(pipeline, example, check_trace=False)
+            traced.save(os.path.join(output_dir, name))
+        else:
+            name = f"body_p{bucket}.onnx"
+            torch.onnx.export(
+                pipeline,
+                example,
+                os.path.join(output_dir, name),
+                input_names=EXPORT_INPUTS,
+                output_names=EXPORT_OUTPUTS,
+                opset_version=opset,
+            )
+        files[str(bucket)] = name
+        print(f"Exported person bucket {bucket}: {name}")
+
+    np.save(os.path.join(output_dir, "faces.npy"), model.head_pose.faces.cpu().numpy())
+    manifest = dict(
+        format=export_format,
+        image_size=[w, h],
+        padding=cropper.padding,
+        aspect_ratio=cropper.aspect_ratio,
+        backbone_type=model.cfg.MODEL.BACKBONE.TYPE,
+        person_buckets=sorted(int(b) for b in person_buckets),
+        inputs=EXPORT_INPUTS,
+        outputs=EXPORT_OUTPUTS,
+        files=files,
+    )
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest_path
+
+
+class ExportedBodyModel:
+    """
+    Run a body pipeline exported by `export_body_pipeline` on CPU.
+
+    Crops are padded (by repeating the last crop) to the smallest exported
+    person bucket that fits them; more crops than the largest bucket run in
+    chunks of it.
+
+    Args:
+        path: artifact directory (or its manifest.json)
+        backend: "torchscript" or "onnxruntime"; defaults to the export format
+        num_threads: intra-op threads (0 keeps the runtime default)
+    """
+
+    def __init__(self, path: str, backend: Optional[str] = None, num_threads: int = 0):
+        root = os.path.dirname(path) if path.endswith(".json") else path
+        with open(os.path.join(root, MANIFEST_NAME), "r") as f:
+            self.manifest = json.load(f)
+        self.backend = backend or (
+            "onnxruntime" if self.manifest["format"] == "onnx" else "torchscript"
+        )
+        self.person_buckets = self.manifest["person_buckets"]
+        self.faces = np.load(os.path.join(root, "faces.npy"))
+        if self.backend == "torchscript" and num_threads > 0:
+            torch.set_num_threads(num_threads)
+
+        self.graphs = {}
+        for bucket, name in self.manifest["files"].items():
+            file_path = os.path.join(root, name)
+            if self.backend == "torchscript":
+                graph = torch.jit.load(file_path, map_location="cpu").eval()
+            elif self.backend == "onnxruntime":
+                import onnxruntime as ort
+
+                options = ort.SessionOptions()
+                if num_threads > 0:
+                    options.intra_op_num_threads = num_threads
+                graph = ort.InferenceSession(
+                    file_path, options, providers=["CPUExecutionProvider"]
+                )
+            else:
+                raise ValueError(f"Unknown backend: {self.backend}")
+            self.graphs[int(bucket)] = graph
+
+    def _bucket_size(self, num: int) -> int:
+        for bucket in self.person_buckets:
+            if num <= bucket:
+                return bucket
+        return self.person_buckets[-1]
+
+    def _run_graph(
+        self, bucket: int, inputs: Dict[str, torch.Tensor]
+    ) -> Dict[str, torch.Tensor]:
+        graph = self.graphs[bucket]
+        if self.backend == "torchscript":
+            with torch.no_grad():
+                outputs = graph(*(inputs[key] for key in self.manifest["inputs"]))
+        else:
+            # Inputs the exporter pruned (e.g. masks without mask conditioning)
+            # are not fed
+            names = [i.name for i in graph.get_inputs()]
+            outputs = graph.run(
+                None, {name: inputs[name].numpy() for name in names}
+            )
+            outputs = [torch.from_numpy(x) for x in outputs]
+        return dict(zip(self.manifest["outputs"], outputs))
+
+    def run(self, inputs: Dict[str, torch.Tensor]) -> Dict[str, torch.Tensor]:
+        """
+        Args:
+            inputs: `EXPORT_INPUTS` tensors with one row per crop (see
+                `flatten_batch`)
+
+        Returns:
+            The `EXPORT_OUTPUTS` tensors, one row per crop.
+        """
+        inputs = {key: inputs[key].cpu().float() for key in self.manifest["inputs"]}
+        num = len(inputs["img"])
+        chunk_size = self.person_buckets[-1]
+        results = []
+        for start in range(0, num, chunk_size):
+            chunk = {k: v[start : start + chunk_size] for k, v in inputs.items()}
+            rows = len(chunk["img"])
+            bucket = self._bucket_size(rows)
+            if bucket > rows:
+                chunk = {
+                    k: torch.cat([v, v[-1:].expand(bucket - rows, *v.shape[1:])])
+                    for k, v in chunk.items()
+                }
+            outputs = self._run_graph(bucket, chunk)
+            results.append({k: v[:rows] for k, v in outputs.items()})
+        return {
+            key: torch.cat([r[key] for r in results]) for key in self.manifest["outputs"]
+        }
+
+    def run_batch(self, batch: Dict) -> Dict[str, torch.Tensor]:
+        """Run a [B, N] batch from `BatchCropper.crop` / `prepare_batch_multi`."""
+        return self.run(flatten_batch(batch))
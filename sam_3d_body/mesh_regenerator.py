@@ -0,0 +1,179 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import torch
+
+from .models.heads import MHRHead
+
+# Fields written by `--store params`; everything else is regenerated.
+PARAM_KEYS = [
+    "global_rot",
+    "body_pose_params",
+    "hand_pose_params",
+    "scale_params",
+    "shape_params",
+    "expr_params",
+]
+MESH_KEYS = ["pred_vertices", "pred_keypoints_3d", "pred_keypoints_2d"]
+
+
+def strip_mesh(outputs: List[Dict]) -> List[Dict]:
+    """Return copies of the per-person outputs without the regenerable mesh fields."""
+    return [{k: v for k, v in person.items() if k not in MESH_KEYS} for person in outputs]
+
+
+def project_keypoints(
+    keypoints_3d: torch.Tensor,
+    cam_t: torch.Tensor,
+    focal_length: torch.Tensor,
+    image_size: torch.Tensor,
+) -> torch.Tensor:
+    """
+    Project camera-space keypoints to the original image, the same way as
+    `SAM3DBody.run_inference` (principal point at the image center).
+
+    Args:
+        keypoints_3d: [B, K, 3]
+        cam_t: [B, 3]
+        focal_length: [B]
+        image_size: [B, 2] (width, height)
+    """
+    kp = keypoints_3d + cam_t[:, None, :]
+    kp[:, :, [0, 1]] *= focal_length[:, None, None]
+    kp[:, :, [0, 1]] = kp[:, :, [0, 1]] + (image_size / 2)[:, None, :] * kp[:, :, [2]]
+    return kp[:, :, :2] / kp[:, :, [2]]
+
+
+class MeshRegenerator:
+    """
+    Rebuild vertices and keypoints from stored MHR parameters.
+
+    The mesh is a deterministic function of the MHR parameters, so outputs saved
+    with `--store params` only keep the parameters and camera; this class runs
+    `MHRHead.mhr_forward` on many people at once (in chunks) to recover
+    `pred_vertices`, `pred_keypoints_3d` and `pred_keypoints_2d`.
+
+    Args:
+        head: the body `MHRHead` of a loaded model (`model.head_pose`)
+        device: device to run on (defaults to the head's device)
+    """
+
+    def __init__(self, head: MHRHead, device: Optional[torch.device] = None):
+        self.device = device or head.scale_mean.device
+        self.head = head.to(self.device).eval()
+
+    @classmethod
+    def from_model(cls, model, device: Optional[torch.device] = None):
+        return cls(model.head_pose, device=device)
+
+    @classmethod
+    def from_checkpoint(
+        cls, checkpoint_path: str, mhr_path: str = "", device: str = "cpu"
+    ):
+        """Load only the body MHR head from a SAM 3D Body checkpoint."""
+        from .build_models import load_mhr_head
+
+        return cls(load_mhr_head(checkpoint_path, mhr_path, device), device=device)
+
+    @torch.no_grad()
+    def regenerate(
+        self,
+        params: Dict[str, np.ndarray],
+        cam_t: Optional[np.ndarray] = None,
+        focal_length: Optional[np.ndarray] = None,
+        image_size: Optional[Sequence[float]] = None,
+        chunk_size: int = 1024,
+    ) -> Dict[str, np.ndarray]:
+        """
+        Args:
+            params: dict with the `PARAM_KEYS` arrays, each [N, D]
+            cam_t: [N, 3] camera translation, needed for `pred_keypoints_2d`
+            focal_length: [N] focal length, needed for `pred_keypoints_2d`
+            image_size: (width, height) of the original image
+            chunk_size: number of people per `mhr_forward` call
+
+        Returns:
+            dict with `pred_vertices` [N, V, 3], `pred_keypoints_3d` [N, 70, 3] and,
+            if the camera is given, `pred_keypoints_2d` [N, 70, 2].
+        """
+        num = len(params["global_rot"])
+        do_project = (
+            cam_t is not None and focal_length is not None and image_size is not None
+        )
+        results = {k: [] for k in MESH_KEYS if do_project or k != "pred_keypoints_2d"}
+
+        def to_tensor(x, start, end):
+            return torch.as_tensor(np.asarray(x[start:end]), dtype=torch.float32).to(
+                self.device
+            )
+
+        for start in range(0, num, chunk_size):
+            end = min(start + chunk_size, num)
+            global_rot = to_tensor(params["global_rot"], start, end)
+            expr = params.get("expr_params")
+            verts, j3d = self.head.mhr_forward(
+                global_trans=global_rot * 0,
+                global_rot=global_rot,
+                body_pose_params=to_tensor(params["body_pose_params"], start, end),
+                hand_pose_params=to_tensor(params["hand_pose_params"], start, end),
+                scale_params=to_tensor(params["scale_params"], start, end),
+                shape_params=to_tensor(params["shape_params"], start, end),
+                expr_params=None if expr is None else to_tensor(expr, start, end),
+                return_keypoints=True,
+            )
+            verts[..., [1, 2]] *= -1  # Camera system difference
+            j3d[..., [1, 2]] *= -1  # Camera system difference
+
+            results["pred_vertices"].append(verts.cpu().numpy())
+            results["pred_keypoints_3d"].append(j3d.cpu().numpy())
+            if do_project:
+                size = torch.as_tensor(image_size, dtype=torch.float32).to(self.device)
+                kp2d = project_keypoints(
+                    j3d.clone(),
+                    to_tensor(cam_t, start, end),
+                    to_tensor(np.reshape(focal_length, -1), start, end),
+                    size[None].expand(end - start, 2),
+                )
+                results["pred_keypoints_2d"].append(kp2d.cpu().numpy())
+
+        return {
+            k: np.concatenate(v, axis=0) if v else np.zeros((0,)) for k, v in results.items()
+        }
+
+    def fill_outputs(
+        self,
+        frames: List[List[Dict]],
+        image_size: Optional[Sequence[float]] = None,
+        chunk_size: int = 1024,
+    ) -> List[List[Dict]]:
+        """
+        Fill the mesh fields of estimator-format outputs in place, batching all
+        people of all `frames` together.
+
+        Args:
+            frames: list of per-frame output lists (as from `process_frames`)
+            image_size: (width, height) of the original frames
+        """
+        people = [person for outputs in frames for person in outputs]
+        if not people:
+            return frames
+
+        params = {k: np.stack([np.asarray(p[k]) for p in people]) for k in PARAM_KEYS}
+        has_cam = all(
+            p.get("pred_cam_t") is not None and p.get("focal_length") is not None
+            for p in people
+        )
+        mesh = self.regenerate(
+            params,
+            cam_t=np.stack([p["pred_cam_t"] for p in people]) if has_cam else None,
+            focal_length=(
+                np.array([float(p["focal_length"]) for p in people]) if has_cam else None
+            ),
+            image_size=image_size,
+            chunk_size=chunk_size,
+        )
+        for i, person in enumerate(people):
+            for k, v in mesh.items():
+                person[k] = v[i]
+        return frames
@@ -1,7 +1,7 @@
 # Copyright (c) Meta Platforms, Inc. and affiliates.
 
 import pickle
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 
 import torch
 import torch.nn as nn
@@ -103,11 +103,28 @@ class PromptableDecoder(nn.Module):
         keypoint_token_update_fn=None,
         hand_embeddings=None,
         hand_augment=None,
+        kv_cache: Optional[List[Dict]] = None,
+        early_exit_tol: Optional[float] = None,
+        early_exit_key: str = "pred_keypoints_3d",
     ):
         """
         Args:
             token_embedding: [B, N, C]
             image_embedding: [B, C, H, W]
+            kv_cache: optional list with one dict per layer (see
+                `new_kv_cache`) caching the cross-attention keys/values of the
+                image tokens, for re-running the decoder on the same
+                `image_embedding` / `image_augment` with other prompts
+            early_exit_tol: with `do_interm_preds`, stop refining a sample once
+                `early_exit_key` of two successive intermediate predictions
+                differs by less than this (max over keypoints of the L2
+                distance, or max absolute difference for flat outputs).
+                Finished samples are removed from the batch of later layers,
+                and the callbacks then get an `active` tensor with the batch
+                rows they cover. Only the last pose output covers the whole
+                batch; it gets a `decoder_layers` [B] entry with the number
+                of layers run per sample.
+            early_exit_key: pose output entry compared for the early exit
         """
         if channel_first:
             image_embedding = image_embedding.flatten(2).permute(0, 2, 1)
@@ -125,15 +142,44 @@ class PromptableDecoder(nn.Module):
             assert token_to_pose_output_fn is not None
             all_pose_outputs = []
 
+        num_layers = len(self.layers)
+        batch_size = token_embedding.shape[0]
+        early_exit = (
+            early_exit_tol is not None
+            and self.do_interm_preds
+            and hand_embeddings is None
+        )
+        if early_exit:
+            # Batch rows still refined (None: all of them), final tokens of the
+            # finished ones and the number of layers run per row
+            active, final_out, prev_value = None, None, None
+            decoder_layers = torch.full(
+                (batch_size,), num_layers, device=token_embedding.device
+            )
+        callback_kwargs = {}
+
+        # Image tokens only stay fixed (cacheable) until a two-way layer
+        # updates them
+        use_cache = kv_cache is not None and hand_embeddings is None
         for layer_idx, layer in enumerate(self.layers):
             if hand_embeddings is None:
+                layer_cache = kv_cache[layer_idx] if use_cache else None
+                if layer_cache is not None and early_exit and active is not None:
+                    # The cache holds the whole batch; don't fill it with a subset
+                    layer_cache = (
+                        {"kv": tuple(x[active] for x in layer_cache["kv"])}
+                        if "kv" in layer_cache
+                        else None
+                    )
                 token_embedding, image_embedding = layer(
                     token_embedding,
                     image_embedding,
                     token_augment,
                     image_augment,
                     token_mask,
+                    kv_cache=layer_cache,
                 )
+                use_cache = use_cache and not layer.enable_twoway
             else:
                 token_embedding, image_embedding = layer(
                     token_embedding,
@@ -144,23 +190,81 @@ class PromptableDecoder(nn.Module):
                 )
                 image_embedding = image_embedding[:, : image_augment.shape[1]]
 
-            if self.do_interm_preds and layer_idx < len(self.layers) - 1:
+            if self.do_interm_preds and layer_idx < num_layers - 1:
+                out = self.norm_final(token_embedding)
                 curr_pose_output = token_to_pose_output_fn(
-                    self.norm_final(token_embedding),
+                    out,
                     prev_pose_output=(
                         all_pose_outputs[-1] if len(all_pose_outputs) > 0 else None
                     ),
                     layer_idx=layer_idx,
+                    **callback_kwargs,
                 )
                 all_pose_outputs.append(curr_pose_output)
 
+                if early_exit:
+                    value = curr_pose_output[early_exit_key].float()
+                    done = None
+                    if prev_value is not None:
+                        change = value - prev_value
+                        change = (
+                            change.norm(dim=-1).amax(dim=-1)
+                            if change.dim() == 3
+                            else change.abs().amax(dim=-1)
+                        )
+                        done = change < early_exit_tol
+                        if not done.any():
+                            done = None
+                    prev_value = value
+
+                    if done is not None:
+                        rows = (
+                            torch.arange(batch_size, device=done.device)
+                            if active is None
+                            else active
+                        )
+                        if final_out is None:
+                            final_out = out.new_empty((batch_size, *out.shape[1:]))
+                        final_out[rows[done]] = out[done]
+                        decoder_layers[rows[done]] = layer_idx + 1
+
+                        keep = ~done
+                        active = rows[keep]
+                        callback_kwargs = {"active": active}
+                        token_embedding = token_embedding[keep]
+                        image_embedding = image_embedding[keep]
+                        if token_augment is not None:
+                            token_augment = token_augment[keep]
+                        if token_mask is not None:
+                            token_mask = token_mask[keep]
+                        if image_augment is not None and len(image_augment) > 1:
+                            image_augment = image_augment[keep]
+                        prev_value = prev_value[keep]
+                        curr_pose_output = {
+                            k: (
+                                v[keep]
+                                if torch.is_tensor(v) and v.shape[:1] == done.shape
+                                else v
+                            )
+                            for k, v in curr_pose_output.items()
+                        }
+                        if len(active) == 0:
+                            break
+
                 if self.keypoint_token_update:
                     assert keypoint_token_update_fn is not None
                     token_embedding, token_augment, _, _ = keypoint_token_update_fn(
-                        token_embedding, token_augment, curr_pose_output, layer_idx
+                        token_embedding,
+                        token_augment,
+                        curr_pose_output,
+                        layer_idx,
+                        **callback_kwargs,
                     )
 
         out = self.norm_final(token_embedding)
+        if early_exit and final_out is not None:
+            final_out[active] = out
+            out = final_out
 
         if self.do_interm_preds:
             curr_pose_output = token_to_pose_output_fn(
@@ -168,14 +272,20 @@ class PromptableDecoder(nn.Module):
                 prev_pose_output=(
                     all_pose_outputs[-1] if len(all_pose_outputs) > 0 else None
                 ),
-                layer_idx=layer_idx,
+                layer_idx=num_layers - 1,
             )
+            if early_exit:
+                curr_pose_output["decoder_layers"] = decoder_layers
             all_pose_outputs.append(curr_pose_output)
 
             return out, all_pose_outputs
         else:
             return out
 
+    def new_kv_cache(self) -> List[Dict]:
+        """An empty cross-attention key/value cache for `forward`."""
+        return [{} for _ in self.layers]
+
     def _freeze_stages(self):
         """Freeze parameters."""
         if self.frozen:
@@ -9,6 +9,7 @@ from sam_3d_body.models.modules.geometry_utils import perspective_projection
 
 from ..modules import get_intrinsic_matrix, to_2tuple
 from ..modules.transformer import FFN
+from ..optim.fp16_utils import run_in_fp32
 
 
 class PerspectiveHead(nn.Module):
@@ -42,6 +43,7 @@ class PerspectiveHead(nn.Module):
             add_identity=False,
         )
 
+    @run_in_fp32
     def forward(
         self,
         x: torch.Tensor,
@@ -58,6 +60,7 @@ class PerspectiveHead(nn.Module):
 
         return pred_cam
 
+    @run_in_fp32
     def perspective_projection(
         self,
         points_3d: torch.Tensor,
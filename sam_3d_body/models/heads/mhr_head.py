@@ -17,6 +17,10 @@ from ..modules.mhr_utils import (
 )
 
 from ..modules.transformer import FFN
+from ..optim.fp16_utils import run_in_fp32
+
+# Keypoints used downstream (the first 70 of the 308 sapiens keypoints)
+NUM_KEYPOINTS = 70
 
 MOMENTUM_ENABLED = os.environ.get("MOMENTUM_ENABLED") is None
 try:
@@ -104,21 +108,47 @@ class MHRHead(nn.Module):
             torch.zeros(145).long(), requires_grad=False
         )
 
-        # Load MHR itself
+        # Load MHR itself, on CPU: `model.to(device)` moves it with the rest of
+        # the model, so CPU inference never initializes CUDA
         if MOMENTUM_ENABLED:
-            self.mhr = MHR.from_files(
-                device=torch.device("cuda" if torch.cuda.is_available() else "cpu"),
-                lod=1,
-            )
+            self.mhr = MHR.from_files(device=torch.device("cpu"), lod=1)
         else:
-            self.mhr = torch.jit.load(
-                mhr_model_path,
-                map_location=("cuda" if torch.cuda.is_available() else "cpu"),
-            )
+            self.mhr = torch.jit.load(mhr_model_path, map_location="cpu")
 
         for param in self.mhr.parameters():
             param.requires_grad = False
 
+        # Compact keypoint regressor, built from `keypoint_mapping` on first use
+        self._keypoint_regressor = None
+        self._keypoint_regressor_key = None
+
+    def keypoint_regressor(self, num_keypoints: int = NUM_KEYPOINTS):
+        """
+        Restrict the first `num_keypoints` rows of `keypoint_mapping` to the
+        vertices and joints they actually reference. The mapping is almost
+        entirely zeros, so this gather-and-weight form replaces the dense
+        (308 x num_points) matmul over all vertices.
+
+        Returns:
+            vert_idx: [Kv] referenced vertex indices
+            joint_idx: [Kj] referenced joint indices
+            weights: [num_keypoints, Kv + Kj] mapping over those points
+        """
+        mapping = self.keypoint_mapping
+        key = (num_keypoints, mapping.device, mapping.dtype, mapping._version)
+        if self._keypoint_regressor_key != key:
+            num_joints = self.joint_rotation.shape[0]
+            num_verts = mapping.shape[1] - num_joints
+            rows = mapping[:num_keypoints]
+            point_idx = (rows != 0).any(dim=0).nonzero(as_tuple=True)[0]
+            self._keypoint_regressor = (
+                point_idx[point_idx < num_verts],
+                point_idx[point_idx >= num_verts] - num_verts,
+                rows[:, point_idx].contiguous(),
+            )
+            self._keypoint_regressor_key = key
+        return self._keypoint_regressor
+
     def get_zero_pose_init(self, factor=1.0):
         # Initialize pose token with zero-initialized learnable params
         # Note: bias/initial value should be zero-pose in cont, not all-zeros
@@ -160,6 +190,7 @@ class MHRHead(nn.Module):
 
         return full_pose_params  # B x 207
 
+    @run_in_fp32
     def mhr_forward(
         self,
         global_trans,
@@ -176,7 +207,14 @@ class MHRHead(nn.Module):
         return_joint_rotations=False,
         scale_offsets=None,
         vertex_offsets=None,
+        keypoints_only=False,
+        num_keypoints=NUM_KEYPOINTS,
     ):
+        """
+        Keypoints are the first `num_keypoints` rows of `keypoint_mapping`,
+        computed with the sparse `keypoint_regressor`. With `keypoints_only`,
+        None is returned in place of the vertices.
+        """
 
         if self.enable_hand_model:
             # Transfer wrist-centric predictions to the body.
@@ -235,20 +273,15 @@ class MHRHead(nn.Module):
         curr_joint_rots = roma.unitquat_to_rotmat(curr_joint_quats)
 
         # Prepare returns
-        to_return = [curr_skinned_verts]
+        to_return = [None if keypoints_only else curr_skinned_verts]
         if return_keypoints:
-            # Get sapiens 308 keypoints
-            model_vert_joints = torch.cat(
-                [curr_skinned_verts, curr_joint_coords], dim=1
-            )  # B x (num_verts + 127) x 3
-            model_keypoints_pred = (
-                (
-                    self.keypoint_mapping
-                    @ model_vert_joints.permute(1, 0, 2).flatten(1, 2)
-                )
-                .reshape(-1, model_vert_joints.shape[0], 3)
-                .permute(1, 0, 2)
-            )
+            # Get the first `num_keypoints` sapiens keypoints (of 308) from the
+            # vertices and joints they reference
+            vert_idx, joint_idx, weights = self.keypoint_regressor(num_keypoints)
+            model_keypoints_pred = weights @ torch.cat(
+                [curr_skinned_verts[:, vert_idx], curr_joint_coords[:, joint_idx]],
+                dim=1,
+            )  # B x num_keypoints x 3
 
             if self.enable_hand_model:
                 # Zero out everything except for the right hand
@@ -268,6 +301,7 @@ class MHRHead(nn.Module):
         else:
             return tuple(to_return)
 
+    @run_in_fp32
     def forward(
         self,
         x: torch.Tensor,
@@ -279,6 +313,9 @@ class MHRHead(nn.Module):
         Args:
             x: pose token with shape [B, C], usually C=DECODER.DIM
             init_estimate: [B, self.npose]
+            slim_keypoints: only compute what the keypoint token updates of
+                intermediate decoder layers need (keypoints, joints); the
+                vertices and faces are None
         """
         batch_size = x.shape[0]
         pred = self.proj(x)
@@ -330,11 +367,11 @@ class MHRHead(nn.Module):
             return_joint_coords=True,
             return_model_params=True,
             return_joint_rotations=True,
+            keypoints_only=slim_keypoints,
         )
 
         # Some existing code to get joints and fix camera system
         verts, j3d, jcoords, mhr_model_params, joint_global_rots = output
-        j3d = j3d[:, :70]  # 308 --> 70 keypoints
 
         if verts is not None:
             verts[..., [1, 2]] *= -1  # Camera system difference
@@ -361,7 +398,7 @@ class MHRHead(nn.Module):
             "pred_joint_coords": (
                 jcoords.reshape(batch_size, -1, 3) if jcoords is not None else None
             ),
-            "faces": self.faces.cpu().numpy(),
+            "faces": None if slim_keypoints else self.faces.cpu().numpy(),
             "joint_global_rots": joint_global_rots,
             "mhr_model_params": mhr_model_params,
         }
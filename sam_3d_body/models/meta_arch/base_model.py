@@ -141,15 +141,17 @@ class BaseModel(BaseLightningModule):
         )
         return crop_cam_t
 
-    def convert_to_fp16(self) -> torch.dtype:
+    def convert_to_fp16(self, fp16_type: Optional[torch.dtype] = None) -> torch.dtype:
         """
-        Convert the torso of the model to float16.
+        Convert the torso of the model to float16 (or `fp16_type`, by default
+        TRAIN.FP16_TYPE).
         """
-        fp16_type = (
-            torch.float16
-            if self.cfg.TRAIN.get("FP16_TYPE", "float16") == "float16"
-            else torch.bfloat16
-        )
+        if fp16_type is None:
+            fp16_type = (
+                torch.float16
+                if self.cfg.TRAIN.get("FP16_TYPE", "float16") == "float16"
+                else torch.bfloat16
+            )
 
         if hasattr(self, "backbone"):
             self._set_fp16(self.backbone, fp16_type)
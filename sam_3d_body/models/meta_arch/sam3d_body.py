@@ -1,6 +1,6 @@
 # Copyright (c) Meta Platforms, Inc. and affiliates.
 
-from typing import Any, Dict, Optional, Tuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 import numpy as np
 import roma
@@ -8,7 +8,8 @@ import torch
 import torch.nn as nn
 import torch.nn.functional as F
 
-from sam_3d_body.data.utils.prepare_batch import prepare_batch
+from sam_3d_body.data.utils.batch_crop import BatchCropper
+from sam_3d_body.data.utils.prepare_batch import prepare_batch_multi
 from sam_3d_body.models.decoders.prompt_encoder import PositionEmbeddingRandom
 from sam_3d_body.models.modules.mhr_utils import (
     fix_wrist_euler,
@@ -165,6 +166,28 @@ class SAM3DBody(BaseModel):
                 self.backbone_dtype = torch.bfloat16
         else:
             self.backbone_dtype = torch.float32
+        # Optional autocast around the backbone only (e.g. bf16 on CPU)
+        self.backbone_autocast_dtype = None
+        # Optional autocast around the promptable decoders, see `set_precision`
+        self.decoder_autocast_dtype = None
+        # Skip vertices in the MHR evaluation of intermediate decoder layers,
+        # whose outputs only feed the keypoint token updates
+        self.interm_keypoints_only = True
+        # Keep the body decoder's cross-attention keys/values of the image
+        # tokens for the keypoint prompt pass of `run_inference`
+        self.decoder_kv_cache = True
+        # Stop refining samples in the body decoder once their intermediate
+        # predictions move less than this (None runs every layer), see
+        # `PromptableDecoder.forward`
+        self.decoder_early_exit_tol = None
+        self.decoder_early_exit_key = "pred_keypoints_3d"
+        # Crop pixel grids for the ray conditioning, see `_ray_grid`
+        self._ray_grids = {}
+        # Compiled pose branch, see `compile_pose_branch`
+        self.person_buckets = None
+        self._compiled_pose_branch = None
+        # Hand crop box parameters (same as the estimator's hand transform)
+        self.hand_box_params = BatchCropper(self.cfg.MODEL.IMAGE_SIZE, padding=0.9)
 
         self.ray_cond_emb = CameraEncoder(
             self.backbone.embed_dim,
@@ -286,6 +309,30 @@ class SAM3DBody(BaseModel):
 
         return condition_info.type(batch["img"].dtype)
 
+    def set_precision(self, precision: str = "fp32"):
+        """
+        Run the backbone and the promptable decoders in reduced precision.
+
+        With "bf16" / "fp16", the backbone weights are converted with
+        `convert_to_fp16` and the decoders run under autocast. The MHR and
+        camera heads (rotation conversions, skinning, projection) always run
+        in fp32. Call this on a freshly loaded fp32 model.
+        """
+        dtypes = {"fp32": None, "bf16": torch.bfloat16, "fp16": torch.float16}
+        if precision not in dtypes:
+            raise ValueError(f"Invalid precision: {precision}")
+        dtype = dtypes[precision]
+        if dtype is not None:
+            self.backbone_dtype = self.convert_to_fp16(dtype)
+        self.decoder_autocast_dtype = dtype
+
+    def _decoder_autocast(self, x: torch.Tensor):
+        return torch.autocast(
+            device_type=x.device.type,
+            dtype=self.decoder_autocast_dtype or torch.bfloat16,
+            enabled=self.decoder_autocast_dtype is not None,
+        )
+
     def forward_decoder(
         self,
         image_embeddings: torch.Tensor,
@@ -294,6 +341,7 @@ class SAM3DBody(BaseModel):
         prev_estimate: Optional[torch.Tensor] = None,
         condition_info: Optional[torch.Tensor] = None,
         batch=None,
+        kv_cache: Optional[List[Dict]] = None,
     ):
         """
         Args:
@@ -308,6 +356,9 @@ class SAM3DBody(BaseModel):
                 previous estimate for pose refinement.
             condition_info: optional condition information that is concatenated with
                 the input tokens, shape (B, c)
+            kv_cache: optional `PromptableDecoder.new_kv_cache` list, filled by
+                the first call and reused by later calls on the same
+                `image_embeddings` (and ray conditioning)
         """
         batch_size = image_embeddings.shape[0]
 
@@ -461,25 +512,35 @@ class SAM3DBody(BaseModel):
                 )  # B x 3 + 70 + 70 x 1024
 
         # We're doing intermediate model predictions
-        def token_to_pose_output_fn(tokens, prev_pose_output, layer_idx):
+        def token_to_pose_output_fn(tokens, prev_pose_output, layer_idx, active=None):
             # Get the pose token
             pose_token = tokens[:, 0]
 
             prev_pose = init_pose.view(batch_size, -1)
             prev_camera = init_camera.view(batch_size, -1)
+            batch_idx = self.body_batch_idx
+            if active is not None:
+                # Only the samples still refined by the decoder (early exit)
+                prev_pose, prev_camera = prev_pose[active], prev_camera[active]
+                batch_idx = torch.as_tensor(batch_idx, device=active.device)[active]
 
             # Get pose outputs
-            pose_output = self.head_pose(pose_token, prev_pose)
+            pose_output = self.head_pose(
+                pose_token,
+                prev_pose,
+                slim_keypoints=self.interm_keypoints_only
+                and layer_idx < len(self.decoder.layers) - 1,
+            )
             # Get Camera Translation
             if hasattr(self, "head_camera"):
                 pred_cam = self.head_camera(pose_token, prev_camera)
                 pose_output["pred_cam"] = pred_cam
             # Run camera projection
-            pose_output = self.camera_project(pose_output, batch)
+            pose_output = self.camera_project(pose_output, batch, batch_idx)
 
             # Get 2D KPS in crop
             pose_output["pred_keypoints_2d_cropped"] = self._full_to_crop(
-                batch, pose_output["pred_keypoints_2d"], self.body_batch_idx
+                batch, pose_output["pred_keypoints_2d"], batch_idx
             )
 
             return pose_output
@@ -490,22 +551,31 @@ class SAM3DBody(BaseModel):
         kp3d_token_update_fn = self.keypoint3d_token_update_fn
 
         # Combine the 2D and 3D functionse
-        def keypoint_token_update_fn_comb(*args):
+        def keypoint_token_update_fn_comb(*args, active=None):
             if kp_token_update_fn is not None:
-                args = kp_token_update_fn(kps_emb_start_idx, image_embeddings, *args)
+                args = kp_token_update_fn(
+                    kps_emb_start_idx,
+                    image_embeddings if active is None else image_embeddings[active],
+                    *args,
+                )
             if kp3d_token_update_fn is not None:
                 args = kp3d_token_update_fn(kps3d_emb_start_idx, *args)
             return args
 
-        pose_token, pose_output = self.decoder(
-            token_embeddings,
-            image_embeddings,
-            token_augment,
-            image_augment,
-            token_mask,
-            token_to_pose_output_fn=token_to_pose_output_fn,
-            keypoint_token_update_fn=keypoint_token_update_fn_comb,
-        )
+        with self._decoder_autocast(image_embeddings):
+            pose_token, pose_output = self.decoder(
+                token_embeddings,
+                image_embeddings,
+                token_augment,
+                image_augment,
+                token_mask,
+                token_to_pose_output_fn=token_to_pose_output_fn,
+                keypoint_token_update_fn=keypoint_token_update_fn_comb,
+                kv_cache=kv_cache,
+                early_exit_tol=self.decoder_early_exit_tol,
+                early_exit_key=self.decoder_early_exit_key,
+            )
+        pose_token = pose_token.type(image_embeddings.dtype)
 
         if self.cfg.MODEL.DECODER.get("DO_HAND_DETECT_TOKENS", False):
             return (
@@ -701,7 +771,12 @@ class SAM3DBody(BaseModel):
             prev_camera = init_camera.view(batch_size, -1)
 
             # Get pose outputs
-            pose_output = self.head_pose_hand(pose_token, prev_pose)
+            pose_output = self.head_pose_hand(
+                pose_token,
+                prev_pose,
+                slim_keypoints=self.interm_keypoints_only
+                and layer_idx < len(self.decoder_hand.layers) - 1,
+            )
 
             # Get Camera Translation
             if hasattr(self, "head_camera_hand"):
@@ -730,15 +805,17 @@ class SAM3DBody(BaseModel):
                 args = kp3d_token_update_fn(kps3d_emb_start_idx, *args)
             return args
 
-        pose_token, pose_output = self.decoder_hand(
-            token_embeddings,
-            image_embeddings,
-            token_augment,
-            image_augment,
-            token_mask,
-            token_to_pose_output_fn=token_to_pose_output_fn,
-            keypoint_token_update_fn=keypoint_token_update_fn_comb,
-        )
+        with self._decoder_autocast(image_embeddings):
+            pose_token, pose_output = self.decoder_hand(
+                token_embeddings,
+                image_embeddings,
+                token_augment,
+                image_augment,
+                token_mask,
+                token_to_pose_output_fn=token_to_pose_output_fn,
+                keypoint_token_update_fn=keypoint_token_update_fn_comb,
+            )
+        pose_token = pose_token.type(image_embeddings.dtype)
 
         if self.cfg.MODEL.DECODER.get("DO_HAND_DETECT_TOKENS", False):
             return (
@@ -914,15 +991,21 @@ class SAM3DBody(BaseModel):
 
         return pred_keypoints_2d_cropped
 
-    def camera_project(self, pose_output: Dict, batch: Dict) -> Dict:
+    def camera_project(
+        self, pose_output: Dict, batch: Dict, batch_idx=None
+    ) -> Dict:
         """
         Project 3D keypoints to 2D using the camera parameters.
         Args:
             pose_output (Dict): Dictionary containing the pose output.
             batch (Dict): Dictionary containing the batch data.
+            batch_idx: rows of the flattened batch that `pose_output` covers
+                (defaults to `self.body_batch_idx`)
         Returns:
             Dict: Dictionary containing the projected 2D keypoints.
         """
+        if batch_idx is None:
+            batch_idx = self.body_batch_idx
         if hasattr(self, "head_camera"):
             head_camera = self.head_camera
             pred_cam = pose_output["pred_cam"]
@@ -932,15 +1015,15 @@ class SAM3DBody(BaseModel):
         cam_out = head_camera.perspective_projection(
             pose_output["pred_keypoints_3d"],
             pred_cam,
-            self._flatten_person(batch["bbox_center"])[self.body_batch_idx],
-            self._flatten_person(batch["bbox_scale"])[self.body_batch_idx, 0],
-            self._flatten_person(batch["ori_img_size"])[self.body_batch_idx],
+            self._flatten_person(batch["bbox_center"])[batch_idx],
+            self._flatten_person(batch["bbox_scale"])[batch_idx, 0],
+            self._flatten_person(batch["ori_img_size"])[batch_idx],
             self._flatten_person(
                 batch["cam_int"]
                 .unsqueeze(1)
                 .expand(-1, batch["img"].shape[1], -1, -1)
                 .contiguous()
-            )[self.body_batch_idx],
+            )[batch_idx],
             use_intrin_center=self.cfg.MODEL.DECODER.get("USE_INTRIN_CENTER", False),
         )
 
@@ -948,15 +1031,15 @@ class SAM3DBody(BaseModel):
             cam_out_vertices = head_camera.perspective_projection(
                 pose_output["pred_vertices"],
                 pred_cam,
-                self._flatten_person(batch["bbox_center"])[self.body_batch_idx],
-                self._flatten_person(batch["bbox_scale"])[self.body_batch_idx, 0],
-                self._flatten_person(batch["ori_img_size"])[self.body_batch_idx],
+                self._flatten_person(batch["bbox_center"])[batch_idx],
+                self._flatten_person(batch["bbox_scale"])[batch_idx, 0],
+                self._flatten_person(batch["ori_img_size"])[batch_idx],
                 self._flatten_person(
                     batch["cam_int"]
                     .unsqueeze(1)
                     .expand(-1, batch["img"].shape[1], -1, -1)
                     .contiguous()
-                )[self.body_batch_idx],
+                )[batch_idx],
                 use_intrin_center=self.cfg.MODEL.DECODER.get(
                     "USE_INTRIN_CENTER", False
                 ),
@@ -1024,35 +1107,41 @@ class SAM3DBody(BaseModel):
 
         return pose_output
 
+    def _ray_grid(self, height: int, width: int, device, dtype) -> torch.Tensor:
+        """Pixel (x, y) grid of a crop as 2 x H x W, cached per size/device/dtype."""
+        key = (height, width, device, dtype)
+        grid = self._ray_grids.get(key)
+        if grid is None:
+            grid = torch.stack(
+                torch.meshgrid(
+                    torch.arange(height, device=device, dtype=dtype),
+                    torch.arange(width, device=device, dtype=dtype),
+                    indexing="xy",
+                ),
+                dim=0,
+            )
+            self._ray_grids[key] = grid
+        return grid
+
     def get_ray_condition(self, batch):
         B, N, _, H, W = batch["img"].shape
-        meshgrid_xy = (
-            torch.stack(
-                torch.meshgrid(torch.arange(H), torch.arange(W), indexing="xy"), dim=2
-            )[None, None, :, :, :]
-            .repeat(B, N, 1, 1, 1)
-            .cuda()
-        )  # B x N x H x W x 2
-        meshgrid_xy = (
-            meshgrid_xy / batch["affine_trans"][:, :, None, None, [0, 1], [0, 1]]
-        )
-        meshgrid_xy = (
-            meshgrid_xy
-            - batch["affine_trans"][:, :, None, None, [0, 1], [2, 2]]
-            / batch["affine_trans"][:, :, None, None, [0, 1], [0, 1]]
-        )
-
-        # Subtract out center & normalize to be rays
-        meshgrid_xy = (
-            meshgrid_xy - batch["cam_int"][:, None, None, None, [0, 1], [2, 2]]
-        )
-        meshgrid_xy = (
-            meshgrid_xy / batch["cam_int"][:, None, None, None, [0, 1], [0, 1]]
-        )
-
-        return meshgrid_xy.permute(0, 1, 4, 2, 3).to(
-            batch["img"].dtype
-        )  # This is B x num_person x 2 x H x W
+        affine_trans = batch["affine_trans"]
+        grid = self._ray_grid(H, W, affine_trans.device, affine_trans.dtype)
+
+        # Crop pixel -> original image: (x - t) / a; subtract out center &
+        # normalize to be rays: (x - c) / f. Both are folded into one
+        # per-person scale and offset applied to the shared grid.
+        a = affine_trans[:, :, [0, 1], [0, 1]]  # B x N x 2
+        t = affine_trans[:, :, [0, 1], [2, 2]]
+        f = batch["cam_int"][:, None, [0, 1], [0, 1]]  # B x 1 x 2
+        c = batch["cam_int"][:, None, [0, 1], [2, 2]]
+        scale = 1 / (a * f)
+        offset = -(t / a + c) / f
+        rays = torch.addcmul(
+            offset[..., None, None], grid, scale[..., None, None]
+        )  # B x N x 2 x H x W
+
+        return rays.to(batch["img"].dtype)  # This is B x num_person x 2 x H x W
 
     def forward_pose_branch(self, batch: Dict) -> Dict:
         """Run a forward pass for the crop-image (pose) branch."""
@@ -1094,9 +1183,14 @@ class SAM3DBody(BaseModel):
             batch["ray_cond_hand"] = ray_cond[self.hand_batch_idx].clone()
         ray_cond = None
 
-        image_embeddings = self.backbone(
-            x.type(self.backbone_dtype), extra_embed=ray_cond
-        )  # (B, C, H, W)
+        with torch.autocast(
+            device_type=x.device.type,
+            dtype=self.backbone_autocast_dtype or torch.bfloat16,
+            enabled=self.backbone_autocast_dtype is not None,
+        ):
+            image_embeddings = self.backbone(
+                x.type(self.backbone_dtype), extra_embed=ray_cond
+            )  # (B, C, H, W)
 
         if isinstance(image_embeddings, tuple):
             image_embeddings = image_embeddings[-1]
@@ -1120,7 +1214,10 @@ class SAM3DBody(BaseModel):
 
         # Forward promptable decoder to get updated pose tokens and regression output
         pose_output, pose_output_hand = None, None
+        kv_cache = None
         if len(self.body_batch_idx):
+            if self.decoder_kv_cache:
+                kv_cache = self.decoder.new_kv_cache()
             tokens_output, pose_output = self.forward_decoder(
                 image_embeddings[self.body_batch_idx],
                 init_estimate=None,
@@ -1128,6 +1225,7 @@ class SAM3DBody(BaseModel):
                 prev_estimate=None,
                 condition_info=condition_info[self.body_batch_idx],
                 batch=batch,
+                kv_cache=kv_cache,
             )
             pose_output = pose_output[-1]
         if len(self.hand_batch_idx):
@@ -1148,6 +1246,8 @@ class SAM3DBody(BaseModel):
             "condition_info": condition_info,
             "image_embeddings": image_embeddings,
         }
+        if kv_cache is not None:
+            output["decoder_kv_cache"] = kv_cache
 
         if self.cfg.MODEL.DECODER.get("DO_HAND_DETECT_TOKENS", False):
             if len(self.body_batch_idx):
@@ -1178,6 +1278,9 @@ class SAM3DBody(BaseModel):
     def forward_step(
         self, batch: Dict, decoder_type: str = "body"
     ) -> Tuple[Dict, Dict]:
+        if self._compiled_pose_branch is not None:
+            return self._forward_step_bucketed(batch, decoder_type)
+
         batch_size, num_person = batch["img"].shape[:2]
 
         if decoder_type == "body":
@@ -1194,6 +1297,290 @@ class SAM3DBody(BaseModel):
 
         return pose_output
 
+    def compile_pose_branch(
+        self,
+        person_buckets: Tuple[int, ...] = (1, 2, 4, 8),
+        mode: str = "default",
+        warmup: bool = True,
+        batch_size: int = 1,
+    ):
+        """
+        Run `forward_pose_branch` (backbone, decoder loop, keypoint token updates
+        and MHR head) through `torch.compile`.
+
+        The compiled graphs are specialized on the number of person crops, so
+        every `forward_step` pads its crops to the next bucket size (multiples
+        of the largest bucket beyond it) and the graphs are reused across frames
+        with different person counts.
+
+        A [B, N] batch of `process_frames` has B * N crop rows, and the fused
+        hand pass has up to twice the rows of the body pass, so the warm-up
+        covers every padded size up to `batch_size * max(person_buckets)` rows
+        for the body branch and twice that for the hand branch. Larger row
+        counts (more than `max(person_buckets)` persons per image) still compile
+        on first use, and every compiled size counts against dynamo's cache
+        limit; past it, the pose branch silently falls back to eager mode.
+
+        Args:
+            person_buckets: person counts to pad to
+            mode: `torch.compile` mode; "reduce-overhead" also captures CUDA graphs
+            warmup: compile the body and hand branches for every padded size now
+            batch_size: images per `forward_step` the warm-up should cover
+        """
+        self.person_buckets = tuple(sorted(person_buckets))
+        self._compiled_pose_branch = torch.compile(
+            self.forward_pose_branch, mode=mode, dynamic=False
+        )
+        if warmup:
+            self.warmup_pose_branch(batch_size)
+
+    def _padded_sizes(self, max_rows: int) -> List[int]:
+        """Every size `_bucket_size` pads 1..max_rows crop rows to."""
+        step = self.person_buckets[-1]
+        extra = range(2 * step, self._bucket_size(max_rows) + 1, step)
+        return sorted(set(self.person_buckets) | set(extra))
+
+    @torch.no_grad()
+    def warmup_pose_branch(self, batch_size: int = 1):
+        """
+        Run the compiled body branch once for every padded size of up to
+        `batch_size` images of `max(person_buckets)` persons, and the hand
+        branch for twice as many rows (left and right hands).
+        """
+        max_rows = batch_size * self.person_buckets[-1]
+        sizes = {
+            "body": self._padded_sizes(max_rows),
+            "hand": self._padded_sizes(2 * max_rows),
+        }
+        # Body and hand graphs of every size are separate cache entries
+        num_graphs = len(sizes["body"]) + len(sizes["hand"])
+        dynamo_config = torch._dynamo.config
+        if dynamo_config.cache_size_limit < num_graphs:
+            dynamo_config.cache_size_limit = num_graphs
+
+        cropper = BatchCropper(self.cfg.MODEL.IMAGE_SIZE)
+        w, h = cropper.input_size
+        img = torch.zeros(3, h * 2, w * 2, device=self.device)
+        box = np.array([[w / 2, h / 2, w * 3 / 2, h * 3 / 2]], dtype=np.float32)
+        for decoder_type, decoder_sizes in sizes.items():
+            for size in decoder_sizes:
+                batch = cropper.crop([img], [box] * size, image_index=[0] * size)
+                self._initialize_batch(batch)
+                self.forward_step(batch, decoder_type=decoder_type)
+
+    def _bucket_size(self, num_rows: int) -> int:
+        for bucket in self.person_buckets:
+            if num_rows <= bucket:
+                return bucket
+        step = self.person_buckets[-1]
+        return -(-num_rows // step) * step
+
+    def _forward_step_bucketed(self, batch: Dict, decoder_type: str) -> Dict:
+        """
+        `forward_step` through the compiled pose branch. The [B, N] batch is
+        laid out as [bucket, 1] (one crop per row, padded by repeating the last
+        crop) and the outputs are cut back to B * N rows.
+        """
+        batch_size, num_person = batch["img"].shape[:2]
+        num_rows = batch_size * num_person
+        bucket = self._bucket_size(num_rows)
+
+        def pad(x):
+            x = x[:, None]
+            if bucket > num_rows:
+                x = torch.cat([x, x[-1:].expand(bucket - num_rows, *x.shape[1:])])
+            return x
+
+        padded = {
+            "cam_int": pad(batch["cam_int"].repeat_interleave(num_person, dim=0))[
+                :, 0
+            ]
+        }
+        for key, x in batch.items():
+            if key != "cam_int" and torch.is_tensor(x) and x.shape[:2] == (
+                batch_size,
+                num_person,
+            ):
+                padded[key] = pad(x.flatten(0, 1))
+        padded["person_valid"][num_rows:] = 0
+
+        rows = list(range(bucket))
+        self.body_batch_idx = rows if decoder_type == "body" else []
+        self.hand_batch_idx = rows if decoder_type == "hand" else []
+        self._initialize_batch(padded)
+        try:
+            if hasattr(torch.compiler, "cudagraph_mark_step_begin"):
+                torch.compiler.cudagraph_mark_step_begin()
+            output = self._compiled_pose_branch(padded)
+        finally:
+            self._initialize_batch(batch)
+        rows = list(range(num_rows))
+        self.body_batch_idx = rows if decoder_type == "body" else []
+        self.hand_batch_idx = rows if decoder_type == "hand" else []
+
+        def unpad(x):
+            if isinstance(x, dict):
+                return {k: unpad(v) for k, v in x.items()}
+            if isinstance(x, (list, tuple)):
+                return type(x)(unpad(v) for v in x)
+            if torch.is_tensor(x) and x.shape[:1] == (bucket,):
+                # Clone: CUDA graph outputs are overwritten by the next replay
+                return x[:num_rows].clone()
+            return x
+
+        for key in ("ray_cond", "ray_cond_hand"):
+            if key in padded:
+                batch[key] = unpad(padded[key])
+        return unpad(output)
+
+    def _hand_refine_mask(
+        self,
+        batch: Dict,
+        left_xyxy: np.ndarray,
+        right_xyxy: np.ndarray,
+        size_thresh: float,
+        policy: str = "auto",
+    ) -> np.ndarray:
+        """
+        Decide which hands to run through the hand decoder.
+
+        Args:
+            left_xyxy / right_xyxy: B*N x 4 hand boxes from `_get_hand_box`
+                (full-image coordinates, not flipped)
+            size_thresh: minimum hand crop size in pixels (criteria 2)
+
+        Returns:
+            B*N x 2 boolean mask (left, right)
+        """
+        num = len(left_xyxy)
+        if policy == "always":
+            return np.ones((num, 2), dtype=bool)
+        if policy == "never":
+            return np.zeros((num, 2), dtype=bool)
+        if policy != "auto":
+            raise ValueError(f"Invalid hand_refine policy: {policy}")
+
+        ori_img_size = self._flatten_person(batch["ori_img_size"]).cpu().numpy()
+        width, height = ori_img_size[:, 0], ori_img_size[:, 1]
+        keep = []
+        for xyxy in (left_xyxy, right_xyxy):
+            _, bbox_scale, _ = self.hand_box_params.affine_params(xyxy)
+            large_enough = (bbox_scale > size_thresh).all(axis=1)
+            on_screen = (
+                (xyxy[:, 2] > 0)
+                & (xyxy[:, 3] > 0)
+                & (xyxy[:, 0] < width - 1)
+                & (xyxy[:, 1] < height - 1)
+            )
+            keep.append(large_enough & on_screen)
+        keep = np.stack(keep, axis=1)
+        if self._person_valid is not None:
+            keep &= self._person_valid.cpu().numpy()[:, None]
+        return keep
+
+    def _forward_hand_pair(
+        self,
+        batch: Dict,
+        pose_output: Dict,
+        imgs,
+        left_xyxy: np.ndarray,
+        right_xyxy: np.ndarray,
+        hand_keep: np.ndarray,
+        transform_hand: Any = None,
+        hand_cropper: Optional[Callable] = None,
+    ):
+        """
+        Run the selected left (flipped) and right hands of all persons through a
+        single hand forward.
+
+        The hand batch has one row per (image, side) with at least one selected
+        hand, so both sides share one backbone and decoder call. The outputs are
+        scattered back to B*N rows per side; hands that were not run get the body
+        decoder's values as placeholders (they are masked out by `hand_keep`).
+
+        Returns:
+            lhand_output, rhand_output, batch_lhand, batch_rhand; the hand
+            "batches" only carry the box fields used after the hand forward.
+        """
+        batch_size, num_person = batch["img"].shape[:2]
+        num_rows = batch_size * num_person
+        boxes = (left_xyxy, right_xyxy)
+
+        # Box fields of every hand, identical to what the hand crop produces
+        hand_batches = []
+        for xyxy in boxes:
+            bbox_center, bbox_scale, _ = self.hand_box_params.affine_params(xyxy)
+            hand_batches.append(
+                {
+                    "bbox_center": torch.as_tensor(bbox_center, device=self.device)
+                    .float()
+                    .view(batch_size, num_person, 2),
+                    "bbox_scale": torch.as_tensor(bbox_scale, device=self.device)
+                    .float()
+                    .view(batch_size, num_person, 2),
+                    "ori_img_size": batch["ori_img_size"].clone(),
+                }
+            )
+
+        groups = []
+        for frame_idx in range(batch_size):
+            rows = slice(frame_idx * num_person, (frame_idx + 1) * num_person)
+            for side in (0, 1):
+                persons = np.nonzero(hand_keep[rows, side])[0]
+                if len(persons):
+                    groups.append((frame_idx, side, persons))
+
+        hand_output = {}
+        src, dst = ([], []), ([], [])
+        if groups:
+            boxes_list = [boxes[side][f * num_person + p] for f, side, p in groups]
+            frame_ids = [f for f, _, _ in groups]
+            cam_int = batch["cam_int"][frame_ids].clone()
+            if hand_cropper is not None:
+                batch_hand = hand_cropper(
+                    boxes_list,
+                    cam_int=cam_int,
+                    flip=[side == 0 for _, side, _ in groups],
+                    image_index=frame_ids,
+                )
+            else:
+                batch_hand = prepare_batch_multi(
+                    [imgs[f][:, ::-1] if side == 0 else imgs[f] for f, side, _ in groups],
+                    transform_hand,
+                    boxes_list,
+                    cam_int=cam_int,
+                )
+            batch_hand = recursive_to(batch_hand, self.device)
+
+            self._initialize_batch(batch_hand)
+            try:
+                hand_output = self.forward_step(batch_hand, decoder_type="hand")[
+                    "mhr_hand"
+                ]
+            finally:
+                self._initialize_batch(batch)
+
+            max_hands = batch_hand["img"].shape[1]
+            for row, (f, side, persons) in enumerate(groups):
+                src[side].extend(row * max_hands + np.arange(len(persons)))
+                dst[side].extend(f * num_person + persons)
+
+        def scatter(side):
+            out = {}
+            for key, placeholder in pose_output["mhr"].items():
+                if not torch.is_tensor(placeholder) or placeholder.shape[:1] != (
+                    num_rows,
+                ):
+                    continue
+                out[key] = placeholder.clone()
+                if key in hand_output and len(src[side]):
+                    out[key][dst[side]] = hand_output[key][src[side]].to(
+                        placeholder.dtype
+                    )
+            return {"mhr_hand": out}
+
+        return scatter(0), scatter(1), hand_batches[0], hand_batches[1]
+
     def run_inference(
         self,
         img,
@@ -1201,17 +1588,36 @@ class SAM3DBody(BaseModel):
         inference_type: str = "full",
         transform_hand: Any = None,
         thresh_wrist_angle=1.4,
+        hand_cropper: Optional[Callable] = None,
+        fuse_hands: bool = True,
+        hand_refine: str = "auto",
     ):
         """
         Run 3DB inference (optionally with hand detector).
 
+        img: the RGB image, or a list of RGB images (one per batch element)
+            when `batch` packs crops from several images.
+        hand_cropper: optional `BatchCropper.crop` bound to the device images;
+            used instead of `prepare_batch_multi` + `transform_hand` to build
+            the hand batches.
+        fuse_hands: run the left (flipped) and right hand crops through a single
+            hand forward instead of one forward per hand.
+        hand_refine: which hands go through the hand decoder:
+            - auto: skip hands of padded persons, hands whose box is too small
+              (rejected by the box size criterion anyway) and hands entirely
+              outside the image (their crops are empty)
+            - always: refine every hand
+            - never: keep the body decoder's hands
+            Only the fused path saves the compute of skipped hands; the unfused
+            path still runs every hand crop but discards the skipped ones.
         inference_type:
             - full: full-body inference with both body and hand decoders
             - body: inference with body decoder only (still full-body output)
             - hand: inference with hand decoder only (only hand output)
         """
 
-        height, width = img.shape[:2]
+        imgs = img if isinstance(img, (list, tuple)) else [img]
+        batch_size, num_person = batch["img"].shape[:2]
         cam_int = batch["cam_int"].clone()
 
         if inference_type == "body":
@@ -1233,18 +1639,65 @@ class SAM3DBody(BaseModel):
             ),
         )
 
+        # Original image size (w, h) of every person crop, B*N x 2
+        ori_img_size = self._flatten_person(batch["ori_img_size"])
+        img_width = ori_img_size[:, 0].cpu().numpy()
+
         # Step 2. Re-run with each hand
+        ## Hands that are too small or outside the image are not used below,
+        ## so with hand_refine == "auto" their crops are skipped
+        hand_box_size_thresh = 64
+        hand_keep = self._hand_refine_mask(
+            batch, left_xyxy, right_xyxy, hand_box_size_thresh, hand_refine
+        )
+
         ## Left... Flip image & box
-        flipped_img = img[:, ::-1]
         tmp = left_xyxy.copy()
-        left_xyxy[:, 0] = width - tmp[:, 2] - 1
-        left_xyxy[:, 2] = width - tmp[:, 0] - 1
-
-        batch_lhand = prepare_batch(
-            flipped_img, transform_hand, left_xyxy, cam_int=cam_int.clone()
-        )
-        batch_lhand = recursive_to(batch_lhand, "cuda")
-        lhand_output = self.forward_step(batch_lhand, decoder_type="hand")
+        left_xyxy[:, 0] = img_width - tmp[:, 2] - 1
+        left_xyxy[:, 2] = img_width - tmp[:, 0] - 1
+
+        if fuse_hands:
+            lhand_output, rhand_output, batch_lhand, batch_rhand = (
+                self._forward_hand_pair(
+                    batch,
+                    pose_output,
+                    imgs,
+                    left_xyxy,
+                    right_xyxy,
+                    hand_keep,
+                    transform_hand=transform_hand,
+                    hand_cropper=hand_cropper,
+                )
+            )
+        else:
+            # Reference path: one full forward per hand; hands not selected by
+            # `hand_refine` are still computed but masked out below
+            if hand_cropper is not None:
+                batch_lhand = hand_cropper(
+                    np.split(left_xyxy, batch_size), cam_int=cam_int.clone(), flip=True
+                )
+                batch_rhand = hand_cropper(
+                    np.split(right_xyxy, batch_size), cam_int=cam_int.clone()
+                )
+            else:
+                flipped_imgs = [x[:, ::-1] for x in imgs]
+                batch_lhand = prepare_batch_multi(
+                    flipped_imgs,
+                    transform_hand,
+                    np.split(left_xyxy, batch_size),
+                    cam_int=cam_int.clone(),
+                )
+                batch_rhand = prepare_batch_multi(
+                    imgs,
+                    transform_hand,
+                    np.split(right_xyxy, batch_size),
+                    cam_int=cam_int.clone(),
+                )
+            batch_lhand = recursive_to(batch_lhand, self.device)
+            batch_rhand = recursive_to(batch_rhand, self.device)
+            lhand_output = self.forward_step(batch_lhand, decoder_type="hand")
+            rhand_output = self.forward_step(batch_rhand, decoder_type="hand")
+        hand_keep = torch.as_tensor(hand_keep, device=self.device)
 
         # Unflip output
         ## Flip scale
@@ -1272,24 +1725,21 @@ class SAM3DBody(BaseModel):
         ]
         ### Unflip box
         batch_lhand["bbox_center"][:, :, 0] = (
-            width - batch_lhand["bbox_center"][:, :, 0] - 1
+            batch_lhand["ori_img_size"][:, :, 0] - batch_lhand["bbox_center"][:, :, 0] - 1
         )
 
-        ## Right...
-        batch_rhand = prepare_batch(
-            img, transform_hand, right_xyxy, cam_int=cam_int.clone()
-        )
-        batch_rhand = recursive_to(batch_rhand, "cuda")
-        rhand_output = self.forward_step(batch_rhand, decoder_type="hand")
-
         # Step 3. replace hand pose estimation from the body decoder.
         ## CRITERIA 1: LOCAL WRIST POSE DIFFERENCE
         joint_rotations = pose_output["mhr"]["joint_global_rots"]
         ### Get lowarm
-        lowarm_joint_idxs = torch.LongTensor([76, 40]).cuda()  # left, right
+        lowarm_joint_idxs = torch.tensor(
+            [76, 40], device=joint_rotations.device
+        )  # left, right
         lowarm_joint_rotations = joint_rotations[:, lowarm_joint_idxs]  # B x 2 x 3 x 3
         ### Get zero-wrist pose
-        wrist_twist_joint_idxs = torch.LongTensor([77, 41]).cuda()  # left, right
+        wrist_twist_joint_idxs = torch.tensor(
+            [77, 41], device=joint_rotations.device
+        )  # left, right
         wrist_zero_rot_pose = (
             lowarm_joint_rotations
             @ self.head_pose.joint_rotation[wrist_twist_joint_idxs]
@@ -1314,7 +1764,6 @@ class SAM3DBody(BaseModel):
         angle_difference_valid_mask = angle_difference < thresh_wrist_angle
 
         ## CRITERIA 2: hand box size
-        hand_box_size_thresh = 64
         hand_box_size_valid_mask = torch.stack(
             [
                 (batch_lhand["bbox_scale"].flatten(0, 1) > hand_box_size_thresh).all(
@@ -1353,7 +1802,9 @@ class SAM3DBody(BaseModel):
         left_kps_full = lhand_output["mhr_hand"]["pred_keypoints_2d"][
             :, [kps_right_wrist_idx]
         ].clone()
-        left_kps_full[:, :, 0] = width - left_kps_full[:, :, 0] - 1  # Flip left hand
+        left_kps_full[:, :, 0] = (
+            ori_img_size[:, [0]] - left_kps_full[:, :, 0] - 1
+        )  # Flip left hand
         body_right_kps_full = pose_output["mhr"]["pred_keypoints_2d"][
             :, [kps_right_wrist_idx]
         ].clone()
@@ -1379,12 +1830,12 @@ class SAM3DBody(BaseModel):
             & hand_box_size_valid_mask
             & hand_kps2d_valid_mask
             & hand_wrist_kps2d_valid_mask
+            & hand_keep
         )
 
         # Keypoint prompting with the body decoder.
         # We use the wrist location from the hand decoder and the elbow location
         # from the body decoder as prompts to get an updated body pose estimation.
-        batch_size, num_person = batch["img"].shape[:2]
         self.hand_batch_idx = []
         self.body_batch_idx = list(range(batch_size * num_person))
 
@@ -1397,7 +1848,9 @@ class SAM3DBody(BaseModel):
         left_kps_full = lhand_output["mhr_hand"]["pred_keypoints_2d"][
             :, [kps_right_wrist_idx]
         ].clone()
-        left_kps_full[:, :, 0] = width - left_kps_full[:, :, 0] - 1  # Flip left hand
+        left_kps_full[:, :, 0] = (
+            ori_img_size[:, [0]] - left_kps_full[:, :, 0] - 1
+        )  # Flip left hand
 
         # Next, get them to crop-normalized space.
         right_kps_crop = self._full_to_crop(batch, right_kps_full)
@@ -1460,7 +1913,7 @@ class SAM3DBody(BaseModel):
                 keypoint_prompt[:, :, :2] + 0.5, min=0.0, max=1.0
             )  # [-0.5, 0.5] --> [0, 1]
 
-        if keypoint_prompt.numel() != 0:
+        if keypoint_prompt.numel() != 0 and hand_refine != "never":
             pose_output, _ = self.run_keypoint_prompt(
                 batch, pose_output, keypoint_prompt
             )
@@ -1505,11 +1958,15 @@ class SAM3DBody(BaseModel):
         )[1]
 
         # Get lowarm
-        lowarm_joint_idxs = torch.LongTensor([76, 40]).cuda()  # left, right
+        lowarm_joint_idxs = torch.tensor(
+            [76, 40], device=joint_rotations.device
+        )  # left, right
         lowarm_joint_rotations = joint_rotations[:, lowarm_joint_idxs]  # B x 2 x 3 x 3
 
         # Get zero-wrist pose
-        wrist_twist_joint_idxs = torch.LongTensor([77, 41]).cuda()  # left, right
+        wrist_twist_joint_idxs = torch.tensor(
+            [77, 41], device=joint_rotations.device
+        )  # left, right
         wrist_zero_rot_pose = (
             lowarm_joint_rotations
             @ self.head_pose.joint_rotation[wrist_twist_joint_idxs]
@@ -1611,7 +2068,6 @@ class SAM3DBody(BaseModel):
                     return_joint_rotations=True,
                 )
             )
-            j3d = j3d[:, :70]  # 308 --> 70 keypoints
             verts[..., [1, 2]] *= -1  # Camera system difference
             j3d[..., [1, 2]] *= -1  # Camera system difference
             jcoords[..., [1, 2]] *= -1
@@ -1634,15 +2090,16 @@ class SAM3DBody(BaseModel):
         ]
         pred_keypoints_3d_proj[:, :, [0, 1]] = (
             pred_keypoints_3d_proj[:, :, [0, 1]]
-            + torch.FloatTensor([width / 2, height / 2]).to(pred_keypoints_3d_proj)[
-                None, None, :
-            ]
+            + (ori_img_size / 2).to(pred_keypoints_3d_proj)[:, None, :]
             * pred_keypoints_3d_proj[:, :, [2]]
         )
         pred_keypoints_3d_proj[:, :, :2] = (
             pred_keypoints_3d_proj[:, :, :2] / pred_keypoints_3d_proj[:, :, [2]]
         )
         pose_output["mhr"]["pred_keypoints_2d"] = pred_keypoints_3d_proj[:, :, :2]
+        pose_output["mhr"]["hand_refined"] = hand_keep
+        # Only valid for this batch's image embeddings
+        pose_output.pop("decoder_kv_cache", None)
 
         return pose_output, batch_lhand, batch_rhand, lhand_output, rhand_output
 
@@ -1674,6 +2131,8 @@ class SAM3DBody(BaseModel):
             prev_estimate=prev_estimate,
             condition_info=condition_info,
             batch=batch,
+            # Same image embeddings as the body pass of `forward_pose_branch`
+            kv_cache=output.get("decoder_kv_cache"),
         )
         pose_output = pose_output[-1]
 
@@ -1702,22 +2161,15 @@ class SAM3DBody(BaseModel):
         )
 
         # Crop to full. batch["affine_trans"] is full-to-crop, right application
-        batch["left_scale"] = (
-            batch["left_scale"]
-            / batch["affine_trans"][0, :, 0, 0].cpu().numpy()[:, None]
-        )
-        batch["right_scale"] = (
-            batch["right_scale"]
-            / batch["affine_trans"][0, :, 0, 0].cpu().numpy()[:, None]
-        )
+        affine_trans = self._flatten_person(batch["affine_trans"]).cpu().numpy()
+        batch["left_scale"] = batch["left_scale"] / affine_trans[:, 0, 0][:, None]
+        batch["right_scale"] = batch["right_scale"] / affine_trans[:, 0, 0][:, None]
         batch["left_center"] = (
-            batch["left_center"]
-            - batch["affine_trans"][0, :, [0, 1], [2, 2]].cpu().numpy()
-        ) / batch["affine_trans"][0, :, 0, 0].cpu().numpy()[:, None]
+            batch["left_center"] - affine_trans[:, [0, 1], [2, 2]]
+        ) / affine_trans[:, 0, 0][:, None]
         batch["right_center"] = (
-            batch["right_center"]
-            - batch["affine_trans"][0, :, [0, 1], [2, 2]].cpu().numpy()
-        ) / batch["affine_trans"][0, :, 0, 0].cpu().numpy()[:, None]
+            batch["right_center"] - affine_trans[:, [0, 1], [2, 2]]
+        ) / affine_trans[:, 0, 0][:, None]
 
         left_xyxy = np.concatenate(
             [
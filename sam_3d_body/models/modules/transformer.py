@@ -1,6 +1,6 @@
 # Copyright (c) Meta Platforms, Inc. and affiliates.
 
-from typing import Dict, Optional
+from typing import Dict, Optional, Tuple
 
 import torch
 import torch.nn as nn
@@ -346,17 +346,31 @@ class Attention(nn.Module):
         x = x.reshape(b, n, self.num_heads, self.head_dims)
         return x.transpose(1, 2)  # B x N_heads x N_tokens x C_per_head
 
+    def project_kv(
+        self, k: torch.Tensor, v: torch.Tensor
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Projected keys and values, B x N_heads x N_tokens x C_per_head."""
+        return (
+            self._separate_heads(self.k_proj(k)),
+            self._separate_heads(self.v_proj(v)),
+        )
+
     def forward(
         self,
         q: torch.Tensor,
-        k: torch.Tensor,
-        v: torch.Tensor,
+        k: Optional[torch.Tensor] = None,
+        v: Optional[torch.Tensor] = None,
         attn_mask: Optional[torch.Tensor] = None,
+        kv: Optional[Tuple[torch.Tensor, torch.Tensor]] = None,
     ):
+        """
+        Args:
+            kv: optional keys and values from `project_kv`, used instead of
+                projecting `k` and `v`
+        """
         B, N, _ = q.shape
         q = self._separate_heads(self.q_proj(q))
-        k = self._separate_heads(self.k_proj(k))
-        v = self._separate_heads(self.v_proj(v))
+        k, v = kv if kv is not None else self.project_kv(k, v)
 
         attn_drop = self.attn_drop if self.training else 0.0
         if attn_mask is not None:
@@ -592,12 +606,16 @@ class TransformerDecoderLayer(nn.Module):
         x_pe: Optional[torch.Tensor] = None,
         context_pe: Optional[torch.Tensor] = None,
         x_mask: Optional[torch.Tensor] = None,
+        kv_cache: Optional[Dict] = None,
     ):
         """
         Args:
             x: shape [B, N, C]
             context: shape [B, N, C]
             x_mask: shape [B, N]
+            kv_cache: optional dict holding the cross-attention keys/values of
+                `context`; filled on the first call and reused afterwards, so
+                it must only be shared between calls with the same context
         """
         if self.repeat_pe and context_pe is not None:
             # LaPE: https://openaccess.thecvf.com/content/ICCV2023/papers/Yu_LaPE_Layer-adaptive_Position_Embedding_for_Vision_Transformers_with_Independent_Layer_ICCV_2023_paper.pdf
@@ -620,14 +638,23 @@ class TransformerDecoderLayer(nn.Module):
         x = x + self.self_attn(q=q, k=k, v=v, attn_mask=attn_mask)
 
         # Cross attention block, tokens attending to image embedding
+        kv = kv_cache.get("kv") if kv_cache is not None else None
+        if kv is not None and kv[0].shape[0] != x.shape[0]:
+            kv = None
+        if kv is None:
+            if self.repeat_pe and context_pe is not None:
+                k = self.ln2_2(context) + context_pe
+                v = self.ln2_2(context)
+            else:
+                k = v = self.ln2_2(context)
+            kv = self.cross_attn.project_kv(k, v)
+            if kv_cache is not None:
+                kv_cache["kv"] = kv
         if self.repeat_pe and context_pe is not None:
             q = self.ln2_1(x) + x_pe
-            k = self.ln2_2(context) + context_pe
-            v = self.ln2_2(context)
         else:
             q = self.ln2_1(x)
-            k = v = self.ln2_2(context)
-        x = x + self.cross_attn(q=q, k=k, v=v)
+        x = x + self.cross_attn(q=q, kv=kv)
 
         # MLP block
         x = self.ffn(self.ln3(x), identity=x)
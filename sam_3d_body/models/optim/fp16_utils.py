@@ -1,5 +1,7 @@
 # Copyright (c) Meta Platforms, Inc. and affiliates.
 
+import functools
+
 import torch
 import torch.nn as nn
 
@@ -35,6 +37,31 @@ def convert_module_to_f16(l, dtype=torch.float16):
             p.data = p.data.to(dtype)
 
 
+def run_in_fp32(fn):
+    """
+    Decorator: run `fn` with autocast disabled and its floating-point tensor
+    arguments cast to float32, for numerically sensitive code (rotation
+    conversions, MHR skinning, camera projection) called from a reduced
+    precision region.
+    """
+
+    def to_fp32(x):
+        if torch.is_tensor(x) and x.is_floating_point():
+            return x.float()
+        return x
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        args = [to_fp32(x) for x in args]
+        kwargs = {k: to_fp32(v) for k, v in kwargs.items()}
+        with torch.autocast("cuda", enabled=False), torch.autocast(
+            "cpu", enabled=False
+        ):
+            return fn(*args, **kwargs)
+
+    return wrapper
+
+
 def convert_module_to_f32(l):
     """
     Convert primitive modules to float32, undoing convert_module_to_f16().
@@ -0,0 +1,187 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+from typing import Dict, List
+
+import numpy as np
+import torch
+
+from .data.utils.prepare_batch import PERSON_KEYS
+from .utils import recursive_to
+
+
+def _tensor_bytes(x, seen=None) -> int:
+    """Device memory held by the tensors in `x`, counting shared storages once."""
+    seen = set() if seen is None else seen
+    if isinstance(x, dict):
+        return sum(_tensor_bytes(v, seen) for v in x.values())
+    if isinstance(x, (list, tuple)):
+        return sum(_tensor_bytes(v, seen) for v in x)
+    if torch.is_tensor(x):
+        storage = x.untyped_storage()
+        if storage.data_ptr() in seen:
+            return 0
+        seen.add(storage.data_ptr())
+        return storage.nbytes()
+    return 0
+
+
+class PromptSession:
+    """
+    Interactive keypoint refinement of the persons of one image.
+
+    Detection, segmentation, FOV estimation, the backbone and the first body
+    decoder pass run once when the session is opened (see
+    `SAM3DBodyEstimator.open_session`). The image embeddings, decoder condition,
+    decoder key/value cache and current estimates stay on the model device, so
+    every `refine` call only re-runs the body decoder (with its MHR head) for
+    one person.
+
+    Estimates follow `inference_type="body"`: the hand decoder is not run, the
+    hands come from the body decoder.
+
+    Args:
+        estimator: the `SAM3DBodyEstimator` that opened the session
+        sample: the sample from `prepare_image`
+        batch: the device batch of the sample (one image, N persons)
+        output: the body `forward_step` output for `batch`
+    """
+
+    def __init__(self, estimator, sample: Dict, batch: Dict, output: Dict):
+        self.estimator = estimator
+        self.num_persons = batch["img"].shape[1]
+        self._masks = sample["masks"]
+        self._bbox = batch["bbox"][0].cpu().numpy()
+
+        # The uploaded full image is only needed for cropping
+        self._batch = {k: v for k, v in batch.items() if k != "img_ori"}
+        self._state = {
+            k: output[k]
+            for k in ("image_embeddings", "condition_info", "decoder_kv_cache")
+            if output.get(k) is not None
+        }
+        self._mhr = [
+            {
+                k: (
+                    v[i : i + 1]
+                    if torch.is_tensor(v) and v.shape[:1] == (self.num_persons,)
+                    else v
+                )
+                for k, v in output["mhr"].items()
+            }
+            for i in range(self.num_persons)
+        ]
+        # Accumulated (K, 3) crop-normalized prompts of every person
+        self._prompts = [None] * self.num_persons
+        self.nbytes = _tensor_bytes([self._batch, self._state, self._mhr])
+        self.closed = False
+
+        # Current per-person estimates, in the format of `process_one_image`
+        self.outputs: List[Dict] = [
+            self._person_output(i) for i in range(self.num_persons)
+        ]
+
+    def _person_output(self, person_id: int) -> Dict:
+        out = recursive_to(recursive_to(self._mhr[person_id], "cpu"), "numpy")
+        return self.estimator._person_output(
+            out,
+            0,
+            self._bbox[person_id],
+            self._masks[person_id] if self._masks is not None else None,
+        )
+
+    def _person_batch(self, person_id: int) -> Dict:
+        """[1, 1] batch of a single person, sharing the session tensors."""
+        rows = slice(person_id, person_id + 1)
+        batch = {
+            key: self._batch[key][:, rows] for key in PERSON_KEYS + ["person_valid"]
+        }
+        batch["cam_int"] = self._batch["cam_int"]
+        # Flattened [B * N] like the image embeddings
+        batch["ray_cond"] = self._batch["ray_cond"][rows]
+        return batch
+
+    def _add_prompt(
+        self, person_id: int, keypoints: np.ndarray, batch: Dict
+    ) -> torch.Tensor:
+        model = self.estimator.model
+        keypoints = torch.as_tensor(np.asarray(keypoints).reshape(-1, 3)).to(
+            batch["img"]
+        )
+        prompt = torch.cat(
+            [
+                torch.clamp(
+                    model._full_to_crop(batch, keypoints[None, :, :2])[0] + 0.5,
+                    min=0.0,
+                    max=1.0,
+                ),  # [-0.5, 0.5] --> [0, 1]
+                keypoints[:, 2:],
+            ],
+            dim=-1,
+        )
+        prev = self._prompts[person_id]
+        if prev is not None:
+            # A new click on a keypoint replaces the previous one
+            replaced = torch.isin(prev[:, 2], prompt[:, 2])
+            prompt = torch.cat([prev[~replaced], prompt], dim=0)
+        self._prompts[person_id] = prompt
+        return prompt
+
+    @torch.no_grad()
+    def refine(self, person_id: int, keypoints: np.ndarray) -> Dict:
+        """
+        Refine one person with keypoint prompts.
+
+        Prompts accumulate over the calls of a person: every call re-runs the
+        body decoder from the current estimate with all clicks given so far.
+
+        Args:
+            person_id: index of the person in `outputs`
+            keypoints: (K, 3) array of (x, y, keypoint index) rows, with (x, y)
+                in original image pixels and the index into the MHR70 keypoints
+
+        Returns:
+            The updated output of the person (also stored in `outputs`).
+        """
+        if self.closed:
+            raise RuntimeError(
+                "Prompt session is closed (possibly evicted by the estimator's "
+                "session_memory_budget)"
+            )
+        if not 0 <= person_id < self.num_persons:
+            raise IndexError(
+                f"person_id {person_id} out of range for {self.num_persons} persons"
+            )
+        self.estimator._touch_session(self)
+
+        model = self.estimator.model
+        batch = self._person_batch(person_id)
+        model._initialize_batch(batch)
+        model.hand_batch_idx = []
+        model.body_batch_idx = [0]
+        prompt = self._add_prompt(person_id, keypoints, batch)
+
+        rows = slice(person_id, person_id + 1)
+        output = {
+            "image_embeddings": self._state["image_embeddings"][rows],
+            "condition_info": self._state["condition_info"][rows],
+            "mhr": self._mhr[person_id],
+        }
+        if "decoder_kv_cache" in self._state:
+            output["decoder_kv_cache"] = [
+                {"kv": tuple(x[rows] for x in layer["kv"])} if "kv" in layer else {}
+                for layer in self._state["decoder_kv_cache"]
+            ]
+        output, _ = model.run_keypoint_prompt(batch, output, prompt[None])
+
+        self._mhr[person_id] = output["mhr"]
+        self.outputs[person_id] = self._person_output(person_id)
+        return self.outputs[person_id]
+
+    def reset(self, person_id: int) -> None:
+        """Forget the clicks of a person (the current estimate is kept)."""
+        self._prompts[person_id] = None
+
+    def close(self) -> None:
+        """Release the device tensors of the session."""
+        self.estimator.sessions.pop(id(self), None)
+        self._batch, self._state, self._mhr = None, None, None
+        self.closed = True
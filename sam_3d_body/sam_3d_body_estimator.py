@@ -1,5 +1,8 @@
 # Copyright (c) Meta Platforms, Inc. and affiliates.
-from typing import Optional, Union
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Dict, Iterator, List, Optional, Tuple, Union
 
 import cv2
 
@@ -13,8 +16,10 @@ from sam_3d_body.data.transforms import (
     VisionTransformWrapper,
 )
 
+from sam_3d_body.data.utils.batch_crop import BatchCropper
 from sam_3d_body.data.utils.io import load_image
-from sam_3d_body.data.utils.prepare_batch import prepare_batch
+from sam_3d_body.data.utils.prepare_batch import prepare_batch_multi
+from sam_3d_body.prompt_session import PromptSession
 from sam_3d_body.utils import recursive_to
 from torchvision.transforms import ToTensor
 
@@ -27,13 +32,30 @@ class SAM3DBodyEstimator:
         human_detector=None,
         human_segmentor=None,
         fov_estimator=None,
+        device_crop: bool = True,
     ):
+        """
+        Args:
+            device_crop: crop person and hand patches with `BatchCropper` on the
+                model device instead of per-person `cv2.warpAffine` on CPU
+        """
         self.device = sam_3d_body_model.device
         self.model, self.cfg = sam_3d_body_model, model_cfg
         self.detector = human_detector
         self.sam = human_segmentor
         self.fov_estimator = fov_estimator
         self.thresh_wrist_angle = 1.4
+        # Run both hands of all persons through a single hand forward
+        self.fuse_hands = True
+        # Which hands go through the hand decoder: "auto" | "always" | "never"
+        self.hand_refine = "auto"
+        # Cumulative hand crop counts (full inference only)
+        self.hand_stats = {"hand_crops": 0, "skipped": 0}
+        # Open prompt sessions, least recently used first (see `open_session`)
+        self.sessions = OrderedDict()
+        # Device memory (bytes) the open sessions may hold before the least
+        # recently used ones are closed
+        self.session_memory_budget = 2 * 1024**3
 
         # For mesh visualization
         self.faces = self.model.head_pose.faces.cpu().numpy()
@@ -59,6 +81,24 @@ class SAM3DBodyEstimator:
                 VisionTransformWrapper(ToTensor()),
             ]
         )
+        self.cropper, self.hand_cropper = None, None
+        if device_crop:
+            self.cropper = BatchCropper(self.cfg.MODEL.IMAGE_SIZE)
+            self.hand_cropper = BatchCropper(self.cfg.MODEL.IMAGE_SIZE, padding=0.9)
+
+    @property
+    def early_exit_tol(self) -> Optional[float]:
+        """
+        Body decoder early-exit tolerance (None runs every layer): a person
+        stops being refined once the intermediate `decoder_early_exit_key`
+        predictions (3D keypoints, in meters, by default) of two successive
+        decoder layers differ by less than this.
+        """
+        return self.model.decoder_early_exit_tol
+
+    @early_exit_tol.setter
+    def early_exit_tol(self, tol: Optional[float]) -> None:
+        self.model.decoder_early_exit_tol = tol
 
     @torch.no_grad()
     def process_one_image(
@@ -94,8 +134,280 @@ class SAM3DBodyEstimator:
         self.image_embeddings = None
         self.output = None
         self.prev_prompt = []
-        torch.cuda.empty_cache()
+        if self.device.type == "cuda":
+            torch.cuda.empty_cache()
+
+        sample = self.prepare_image(
+            img,
+            bboxes=bboxes,
+            masks=masks,
+            cam_int=cam_int,
+            det_cat_id=det_cat_id,
+            bbox_thr=bbox_thr,
+            nms_thr=nms_thr,
+            use_mask=use_mask,
+        )
+
+        # If there are no detected humans, don't run prediction
+        if sample is None:
+            return []
+
+        return self.run_samples([sample], inference_type=inference_type)[0]
+
+    @torch.no_grad()
+    def process_frames(
+        self,
+        frames: List[Union[str, np.ndarray]],
+        bboxes: Optional[List[Optional[np.ndarray]]] = None,
+        cam_int: Optional[Union[np.ndarray, List[Optional[np.ndarray]]]] = None,
+        det_cat_id: int = 0,
+        bbox_thr: float = 0.5,
+        nms_thr: float = 0.3,
+        use_mask: bool = False,
+        inference_type: str = "full",
+    ):
+        """
+        Run model prediction on several images (e.g. video frames) at once.
+
+        Person crops of all frames are packed into a single
+        [num_frames, max_num_person] batch (padded entries are marked invalid
+        in `person_valid`), so the backbone, decoders and MHR head run once per
+        call instead of once per frame.
+
+        Args:
+            frames: list of input images (paths or RGB numpy arrays)
+            bboxes: optional list of per-frame pre-computed bounding boxes
+            cam_int: optional intrinsics shared by all frames, or one per frame
+            Other arguments are the same as in `process_one_image`.
+
+        Returns:
+            A list with one entry per frame, each in the format returned by
+            `process_one_image` (an empty list for frames without humans).
+        """
+        self.batch = None
+        self.image_embeddings = None
+        self.output = None
+        self.prev_prompt = []
+
+        if cam_int is None or not isinstance(cam_int, (list, tuple)):
+            cam_int = [cam_int] * len(frames)
+        if bboxes is None:
+            bboxes = [None] * len(frames)
+
+        samples = [
+            self.prepare_image(
+                frame,
+                bboxes=frame_bboxes,
+                cam_int=frame_cam_int,
+                det_cat_id=det_cat_id,
+                bbox_thr=bbox_thr,
+                nms_thr=nms_thr,
+                use_mask=use_mask,
+            )
+            for frame, frame_bboxes, frame_cam_int in zip(frames, bboxes, cam_int)
+        ]
+
+        all_out = [[] for _ in frames]
+        valid_idx = [i for i, sample in enumerate(samples) if sample is not None]
+        if len(valid_idx) == 0:
+            return all_out
+
+        outputs = self.run_samples(
+            [samples[i] for i in valid_idx], inference_type=inference_type
+        )
+        for i, out in zip(valid_idx, outputs):
+            all_out[i] = out
+        return all_out
+
+    @torch.no_grad()
+    def process_images(
+        self,
+        images: List[Union[str, np.ndarray]],
+        batch_size: int = 8,
+        num_workers: int = 4,
+        cam_int: Optional[Union[np.ndarray, List[Optional[np.ndarray]]]] = None,
+        det_cat_id: int = 0,
+        bbox_thr: float = 0.5,
+        nms_thr: float = 0.3,
+        use_mask: bool = False,
+        inference_type: str = "full",
+        return_images: bool = False,
+    ) -> Iterator[Union[List[Dict], Tuple[np.ndarray, List[Dict]]]]:
+        """
+        Run model prediction on many independent images (e.g. a folder of photos).
+
+        Images are decoded on a thread pool (the next batch is decoded while the
+        current one runs), detection runs once per batch of `batch_size` images,
+        and the person crops of all images of a batch go through a single model
+        forward as in `process_frames`.
+
+        Args:
+            images: list of input images (paths, or RGB numpy arrays)
+            batch_size: number of images per detector / model forward
+            num_workers: number of image decoding threads
+            cam_int: optional intrinsics shared by all images, or one per image
+            return_images: also yield the decoded RGB image, so callers that
+                need it (or its size) do not decode it again
+            Other arguments are the same as in `process_one_image`.
+
+        Yields:
+            The outputs of each image in input order, in the format returned by
+            `process_one_image` (an empty list for images without humans), or
+            (image, outputs) pairs with `return_images`.
+        """
+        self.batch = None
+        self.image_embeddings = None
+        self.output = None
+        self.prev_prompt = []
+
+        if cam_int is None or not isinstance(cam_int, (list, tuple)):
+            cam_int = [cam_int] * len(images)
+        batch_size = max(batch_size, 1)
+
+        def decode(img):
+            if isinstance(img, str):
+                return load_image(img, backend="cv2", image_format="rgb")
+            return img
+
+        starts = list(range(0, len(images), batch_size))
+        with ThreadPoolExecutor(max(num_workers, 1)) as pool:
+
+            def submit(start):
+                return [pool.submit(decode, img) for img in images[start : start + batch_size]]
+
+            pending = submit(starts[0]) if starts else []
+            for n, start in enumerate(starts):
+                imgs = [future.result() for future in pending]
+                if n + 1 < len(starts):
+                    pending = submit(starts[n + 1])
+
+                if self.detector is not None:
+                    all_boxes = self.detector.run_human_detection_batch(
+                        [cv2.cvtColor(img, cv2.COLOR_RGB2BGR) for img in imgs],
+                        det_cat_id=det_cat_id,
+                        bbox_thr=bbox_thr,
+                        nms_thr=nms_thr,
+                        default_to_full_image=False,
+                    )
+                else:
+                    all_boxes = [
+                        np.array([0, 0, img.shape[1], img.shape[0]]).reshape(1, 4)
+                        for img in imgs
+                    ]
+
+                samples = [
+                    (
+                        self._build_sample(
+                            img, boxes, cam_int=img_cam_int, use_mask=use_mask
+                        )
+                        if len(boxes)
+                        else None
+                    )
+                    for img, boxes, img_cam_int in zip(
+                        imgs, all_boxes, cam_int[start : start + batch_size]
+                    )
+                ]
+
+                all_out = [[] for _ in imgs]
+                valid_idx = [i for i, sample in enumerate(samples) if sample is not None]
+                if valid_idx:
+                    outputs = self.run_samples(
+                        [samples[i] for i in valid_idx], inference_type=inference_type
+                    )
+                    for i, out in zip(valid_idx, outputs):
+                        all_out[i] = out
+                if return_images:
+                    yield from zip(imgs, all_out)
+                else:
+                    yield from all_out
+
+    @torch.no_grad()
+    def open_session(
+        self,
+        img: Union[str, np.ndarray],
+        bboxes: Optional[np.ndarray] = None,
+        masks: Optional[np.ndarray] = None,
+        cam_int: Optional[np.ndarray] = None,
+        det_cat_id: int = 0,
+        bbox_thr: float = 0.5,
+        nms_thr: float = 0.3,
+        use_mask: bool = False,
+    ) -> Optional[PromptSession]:
+        """
+        Open an interactive keypoint prompt session on an image.
+
+        Detection, FOV estimation, the backbone and the body decoder run once;
+        `PromptSession.refine` then only re-runs the body decoder for the
+        clicked person. Sessions keep their tensors on the model device until
+        closed; when the open sessions exceed `session_memory_budget`, the
+        least recently used ones are closed. A session that alone exceeds the
+        budget is not opened (RuntimeError).
+
+        Arguments are the same as in `process_one_image`.
+
+        Returns:
+            The session, with the initial body-decoder estimates in
+            `session.outputs`, or None if no human is found.
+        """
+        sample = self.prepare_image(
+            img,
+            bboxes=bboxes,
+            masks=masks,
+            cam_int=cam_int,
+            det_cat_id=det_cat_id,
+            bbox_thr=bbox_thr,
+            nms_thr=nms_thr,
+            use_mask=use_mask,
+        )
+        if sample is None:
+            return None
+
+        batch = self._batch_to_device(self.collate_samples([sample]), [sample])
+        output = self.model.forward_step(batch, decoder_type="body")
+        session = PromptSession(self, sample, batch, output)
+        if session.nbytes > self.session_memory_budget:
+            nbytes = session.nbytes
+            session.close()
+            raise RuntimeError(
+                f"Prompt session needs {nbytes / 1024**2:.0f} MiB, more than "
+                f"session_memory_budget ({self.session_memory_budget / 1024**2:.0f} "
+                "MiB); raise the budget or pass fewer boxes"
+            )
+        self._touch_session(session)
+        return session
+
+    def _touch_session(self, session: PromptSession) -> None:
+        """
+        Mark a session as most recently used and enforce the memory budget.
+        The touched session itself is never closed (`open_session` rejects
+        sessions larger than the budget).
+        """
+        self.sessions[id(session)] = session
+        self.sessions.move_to_end(id(session))
+        total = sum(s.nbytes for s in self.sessions.values())
+        while total > self.session_memory_budget and len(self.sessions) > 1:
+            _, oldest = next(iter(self.sessions.items()))
+            total -= oldest.nbytes
+            oldest.close()
+
+    @torch.no_grad()
+    def prepare_image(
+        self,
+        img: Union[str, np.ndarray],
+        bboxes: Optional[np.ndarray] = None,
+        masks: Optional[np.ndarray] = None,
+        cam_int: Optional[np.ndarray] = None,
+        det_cat_id: int = 0,
+        bbox_thr: float = 0.5,
+        nms_thr: float = 0.3,
+        use_mask: bool = False,
+    ) -> Optional[Dict]:
+        """
+        Run the per-image stages (detection, segmentation, FOV estimation).
 
+        Returns:
+            A sample dict consumed by `run_samples`, or None if no human is found.
+        """
         if type(img) == str:
             img = load_image(img, backend="cv2", image_format="bgr")
             image_format = "bgr"
@@ -127,20 +439,36 @@ class SAM3DBodyEstimator:
 
         # If there are no detected humans, don't run prediction
         if len(boxes) == 0:
-            return []
+            return None
 
         # The following models expect RGB images instead of BGR
         if image_format == "bgr":
             img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
 
+        if masks is not None:
+            assert (
+                bboxes is not None
+            ), "Mask-conditioned inference requires bboxes input!"
+        return self._build_sample(
+            img, boxes, masks=masks, cam_int=cam_int, use_mask=use_mask
+        )
+
+    def _build_sample(
+        self,
+        img: np.ndarray,
+        boxes: np.ndarray,
+        masks: Optional[np.ndarray] = None,
+        cam_int: Optional[np.ndarray] = None,
+        use_mask: bool = False,
+    ) -> Dict:
+        """Segmentation and FOV estimation for an RGB image with known boxes."""
+        height, width = img.shape[:2]
+
         # Handle masks - either provided externally or generated via SAM2
         masks_score = None
         if masks is not None:
             # Use provided masks - ensure they match the number of detected boxes
             print(f"Using provided masks: {masks.shape}")
-            assert (
-                bboxes is not None
-            ), "Mask-conditioned inference requires bboxes input!"
             masks = masks.reshape(-1, height, width, 1).astype(np.uint8)
             masks_score = np.ones(
                 len(masks), dtype=np.float32
@@ -153,107 +481,172 @@ class SAM3DBodyEstimator:
         else:
             masks, masks_score = None, None
 
-        #################### Construct batch data samples ####################
-        batch = prepare_batch(img, self.transform, boxes, masks, masks_score)
-
-        #################### Run model inference on an image ####################
-        batch = recursive_to(batch, "cuda")
-        self.model._initialize_batch(batch)
-
         # Handle camera intrinsics
         # - either provided externally or generated via default FOV estimator
         if cam_int is not None:
             print("Using provided camera intrinsics...")
-            cam_int = cam_int.to(batch["img"])
-            batch["cam_int"] = cam_int.clone()
         elif self.fov_estimator is not None:
             print("Running FOV estimator ...")
-            input_image = batch["img_ori"][0].data
-            cam_int = self.fov_estimator.get_cam_intrinsics(input_image).to(
-                batch["img"]
+            cam_int = self.fov_estimator.get_cam_intrinsics(img)
+
+        return dict(
+            img=img,
+            boxes=boxes,
+            masks=masks,
+            masks_score=masks_score,
+            cam_int=cam_int,
+        )
+
+    @torch.no_grad()
+    def run_samples(self, samples: List[Dict], inference_type: str = "full"):
+        """
+        Run the model on samples produced by `prepare_image` as a single batch.
+
+        Returns:
+            A list of per-image outputs in the format of `process_one_image`.
+        """
+        batch = self.collate_samples(samples)
+        return self.run_batch(batch, samples, inference_type=inference_type)
+
+    def collate_samples(self, samples: List[Dict]) -> Dict:
+        """
+        Crop all persons of the samples into one batch (on CPU, or on the model
+        device with `device_crop`).
+        """
+        #################### Construct batch data samples ####################
+        has_masks = any(sample["masks"] is not None for sample in samples)
+        if self.cropper is not None:
+            return self.cropper.crop(
+                BatchCropper.upload([sample["img"] for sample in samples], self.device),
+                [sample["boxes"] for sample in samples],
+                [sample["masks"] for sample in samples] if has_masks else None,
+                [sample["masks_score"] for sample in samples] if has_masks else None,
             )
-            batch["cam_int"] = cam_int.clone()
-        else:
-            cam_int = batch["cam_int"].clone()
+        return prepare_batch_multi(
+            [sample["img"] for sample in samples],
+            self.transform,
+            [sample["boxes"] for sample in samples],
+            [sample["masks"] for sample in samples] if has_masks else None,
+            [sample["masks_score"] for sample in samples] if has_masks else None,
+        )
+
+    @torch.no_grad()
+    def run_batch(
+        self, batch: Dict, samples: List[Dict], inference_type: str = "full"
+    ):
+        """Run the model on a batch built by `collate_samples`."""
+        #################### Run model inference on an image ####################
+        batch = self._batch_to_device(batch, samples)
 
+        imgs = [sample["img"] for sample in samples]
+        hand_cropper = None
+        if self.hand_cropper is not None:
+            # Reuse the images uploaded by `collate_samples` for the hand crops
+            hand_cropper = partial(
+                self.hand_cropper.crop, [img.data for img in batch["img_ori"]]
+            )
         outputs = self.model.run_inference(
-            img,
+            imgs if len(imgs) > 1 else imgs[0],
             batch,
             inference_type=inference_type,
             transform_hand=self.transform_hand,
             thresh_wrist_angle=self.thresh_wrist_angle,
+            hand_cropper=hand_cropper,
+            fuse_hands=self.fuse_hands,
+            hand_refine=self.hand_refine,
         )
         if inference_type == "full":
             pose_output, batch_lhand, batch_rhand, _, _ = outputs
+            hand_refined = pose_output["mhr"]["hand_refined"][
+                batch["person_valid"].flatten(0, 1) > 0
+            ]
+            self.hand_stats["hand_crops"] += hand_refined.numel()
+            self.hand_stats["skipped"] += int((~hand_refined).sum())
         else:
-            pose_output = outputs
+            pose_output, batch_lhand, batch_rhand = outputs, None, None
 
         out = pose_output["mhr"]
         out = recursive_to(out, "cpu")
         out = recursive_to(out, "numpy")
-        all_out = []
-        for idx in range(batch["img"].shape[1]):
-            all_out.append(
-                {
-                    "bbox": batch["bbox"][0, idx].cpu().numpy(),
-                    "focal_length": out["focal_length"][idx],
-                    "pred_keypoints_3d": out["pred_keypoints_3d"][idx],
-                    "pred_keypoints_2d": out["pred_keypoints_2d"][idx],
-                    "pred_vertices": out["pred_vertices"][idx],
-                    "pred_cam_t": out["pred_cam_t"][idx],
-                    "pred_pose_raw": out["pred_pose_raw"][idx],
-                    "global_rot": out["global_rot"][idx],
-                    "body_pose_params": out["body_pose"][idx],
-                    "hand_pose_params": out["hand"][idx],
-                    "scale_params": out["scale"][idx],
-                    "shape_params": out["shape"][idx],
-                    "expr_params": out["face"][idx],
-                    "mask": masks[idx] if masks is not None else None,
-                    "pred_joint_coords": out["pred_joint_coords"][idx],
-                    "pred_global_rots": out["joint_global_rots"][idx],
-                }
-            )
 
-            if inference_type == "full":
-                all_out[-1]["lhand_bbox"] = np.array(
-                    [
-                        (
-                            batch_lhand["bbox_center"].flatten(0, 1)[idx][0]
-                            - batch_lhand["bbox_scale"].flatten(0, 1)[idx][0] / 2
-                        ).item(),
-                        (
-                            batch_lhand["bbox_center"].flatten(0, 1)[idx][1]
-                            - batch_lhand["bbox_scale"].flatten(0, 1)[idx][1] / 2
-                        ).item(),
-                        (
-                            batch_lhand["bbox_center"].flatten(0, 1)[idx][0]
-                            + batch_lhand["bbox_scale"].flatten(0, 1)[idx][0] / 2
-                        ).item(),
-                        (
-                            batch_lhand["bbox_center"].flatten(0, 1)[idx][1]
-                            + batch_lhand["bbox_scale"].flatten(0, 1)[idx][1] / 2
-                        ).item(),
-                    ]
-                )
-                all_out[-1]["rhand_bbox"] = np.array(
-                    [
-                        (
-                            batch_rhand["bbox_center"].flatten(0, 1)[idx][0]
-                            - batch_rhand["bbox_scale"].flatten(0, 1)[idx][0] / 2
-                        ).item(),
-                        (
-                            batch_rhand["bbox_center"].flatten(0, 1)[idx][1]
-                            - batch_rhand["bbox_scale"].flatten(0, 1)[idx][1] / 2
-                        ).item(),
-                        (
-                            batch_rhand["bbox_center"].flatten(0, 1)[idx][0]
-                            + batch_rhand["bbox_scale"].flatten(0, 1)[idx][0] / 2
-                        ).item(),
+        num_person = batch["img"].shape[1]
+        bbox = batch["bbox"].flatten(0, 1).cpu().numpy()
+        all_out = []
+        for frame_idx, sample in enumerate(samples):
+            frame_out = []
+            for person_idx in range(len(sample["boxes"])):
+                idx = frame_idx * num_person + person_idx
+                frame_out.append(
+                    self._person_output(
+                        out,
+                        idx,
+                        bbox[idx],
                         (
-                            batch_rhand["bbox_center"].flatten(0, 1)[idx][1]
-                            + batch_rhand["bbox_scale"].flatten(0, 1)[idx][1] / 2
-                        ).item(),
-                    ]
+                            sample["masks"][person_idx]
+                            if sample["masks"] is not None
+                            else None
+                        ),
+                    )
                 )
 
+                if inference_type == "full":
+                    frame_out[-1]["lhand_bbox"] = self._hand_bbox_xyxy(
+                        batch_lhand, idx
+                    )
+                    frame_out[-1]["rhand_bbox"] = self._hand_bbox_xyxy(
+                        batch_rhand, idx
+                    )
+                    # (left, right): whether the hand decoder ran for this hand
+                    frame_out[-1]["hand_refined"] = out["hand_refined"][idx]
+            all_out.append(frame_out)
+
         return all_out
+
+    def _batch_to_device(self, batch: Dict, samples: List[Dict]) -> Dict:
+        """Move a `collate_samples` batch to the model device with the samples' intrinsics."""
+        batch = recursive_to(batch, self.device)
+        self.model._initialize_batch(batch)
+
+        for i, sample in enumerate(samples):
+            if sample["cam_int"] is not None:
+                batch["cam_int"][i] = (
+                    torch.as_tensor(sample["cam_int"]).to(batch["img"]).view(3, 3)
+                )
+        return batch
+
+    @staticmethod
+    def _person_output(
+        out: Dict, idx: int, bbox: np.ndarray, mask: Optional[np.ndarray] = None
+    ) -> Dict:
+        """Per-person output dict from the numpy `mhr` output of the model."""
+        return {
+            "bbox": bbox,
+            "focal_length": out["focal_length"][idx],
+            "pred_keypoints_3d": out["pred_keypoints_3d"][idx],
+            "pred_keypoints_2d": out["pred_keypoints_2d"][idx],
+            "pred_vertices": out["pred_vertices"][idx],
+            "pred_cam_t": out["pred_cam_t"][idx],
+            "pred_pose_raw": out["pred_pose_raw"][idx],
+            "global_rot": out["global_rot"][idx],
+            "body_pose_params": out["body_pose"][idx],
+            "hand_pose_params": out["hand"][idx],
+            "scale_params": out["scale"][idx],
+            "shape_params": out["shape"][idx],
+            "expr_params": out["face"][idx],
+            "mask": mask,
+            "pred_joint_coords": out["pred_joint_coords"][idx],
+            "pred_global_rots": out["joint_global_rots"][idx],
+        }
+
+    @staticmethod
+    def _hand_bbox_xyxy(batch_hand: Dict, idx: int) -> np.ndarray:
+        center = batch_hand["bbox_center"].flatten(0, 1)[idx]
+        scale = batch_hand["bbox_scale"].flatten(0, 1)[idx]
+        return np.array(
+            [
+                (center[0] - scale[0] / 2).item(),
+                (center[1] - scale[1] / 2).item(),
+                (center[0] + scale[0] / 2).item(),
+                (center[1] + scale[1] / 2).item(),
+            ]
+        )
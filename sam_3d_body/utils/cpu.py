@@ -0,0 +1,69 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+"""Helpers for running inference on CPU-only hosts."""
+
+import os
+from typing import Optional
+
+import torch
+import torch.nn as nn
+
+
+def cpu_supports_bf16() -> bool:
+    """Return True if the CPU has native bf16 instructions (AVX512-BF16 or AMX)."""
+    try:
+        with open("/proc/cpuinfo", "r") as f:
+            for line in f:
+                if line.startswith("flags"):
+                    flags = set(line.split(":", 1)[1].split())
+                    return bool({"avx512_bf16", "amx_bf16"} & flags)
+    except OSError:
+        pass
+    return False
+
+
+def available_cpus() -> int:
+    """Number of CPUs this process may run on (respects affinity / cgroup pinning)."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def configure_cpu_inference(
+    model: Optional[nn.Module] = None,
+    num_threads: int = 0,
+    channels_last: bool = True,
+    bf16: bool = False,
+) -> int:
+    """
+    Tune torch for CPU inference.
+
+    Args:
+        model: optional `SAM3DBody` model to adjust in place
+        num_threads: intra-op threads (0 uses all CPUs available to the process)
+        channels_last: store conv weights (patch embedding, ray encoders) in
+            channels-last layout, which oneDNN convolutions run faster with
+        bf16: run the backbone under bf16 autocast; ignored with a warning if
+            the CPU has no native bf16 support
+
+    Returns:
+        The number of intra-op threads in use.
+    """
+    num_threads = num_threads if num_threads > 0 else available_cpus()
+    torch.set_num_threads(num_threads)
+    try:
+        # Only allowed before any inter-op parallel work has started
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass
+
+    if model is not None:
+        if channels_last:
+            for name in ("backbone", "ray_cond_emb", "ray_cond_emb_hand"):
+                if hasattr(model, name):
+                    getattr(model, name).to(memory_format=torch.channels_last)
+        if bf16:
+            if cpu_supports_bf16():
+                model.backbone_autocast_dtype = torch.bfloat16
+            else:
+                print("CPU has no native bf16 support, keeping fp32 backbone")
+    return torch.get_num_threads()
@@ -15,6 +15,7 @@ class HumanDetector:
             print("########### Using human detector: ViTDet...")
             self.detector = load_detectron2_vitdet(**kwargs)
             self.detector_func = run_detectron2_vitdet
+            self.detector_func_batch = run_detectron2_vitdet_batch
 
             self.detector = self.detector.to(self.device)
             self.detector.eval()
@@ -24,6 +25,10 @@ class HumanDetector:
     def run_human_detection(self, img, **kwargs):
         return self.detector_func(self.detector, img, **kwargs)
 
+    def run_human_detection_batch(self, imgs, **kwargs):
+        """多张图片一次前向检测，返回每张图片的检测框列表"""
+        return self.detector_func_batch(self.detector, imgs, **kwargs)
+
 
 def load_detectron2_vitdet(path=""):
     """
@@ -112,14 +117,7 @@ def load_detectron2_vitdet(path=""):
     return detector
 
 
-def run_detectron2_vitdet(
-    detector,
-    img,
-    det_cat_id: int = 0,
-    bbox_thr: float = 0.5,
-    nms_thr: float = 0.3,
-    default_to_full_image: bool = True,
-):
+def _vitdet_inputs(img):
     import detectron2.data.transforms as T
 
     height, width = img.shape[:2]
@@ -130,12 +128,17 @@ def run_detectron2_vitdet(
     img_transformed = torch.as_tensor(
         img_transformed.astype("float32").transpose(2, 0, 1)
     )
-    inputs = {"image": img_transformed, "height": height, "width": width}
+    return {"image": img_transformed, "height": height, "width": width}
 
-    with torch.no_grad():
-        det_out = detector([inputs])
 
-    det_instances = det_out[0]["instances"]
+def _vitdet_boxes(
+    det_instances,
+    height: int,
+    width: int,
+    det_cat_id: int = 0,
+    bbox_thr: float = 0.5,
+    default_to_full_image: bool = True,
+):
     valid_idx = (det_instances.pred_classes == det_cat_id) & (
         det_instances.scores > bbox_thr
     )
@@ -150,3 +153,47 @@ def run_detectron2_vitdet(
     )  # shape: [len(boxes),]
     boxes = boxes[sorted_indices]
     return boxes
+
+
+def run_detectron2_vitdet(
+    detector,
+    img,
+    det_cat_id: int = 0,
+    bbox_thr: float = 0.5,
+    nms_thr: float = 0.3,
+    default_to_full_image: bool = True,
+):
+    return run_detectron2_vitdet_batch(
+        detector,
+        [img],
+        det_cat_id=det_cat_id,
+        bbox_thr=bbox_thr,
+        nms_thr=nms_thr,
+        default_to_full_image=default_to_full_image,
+    )[0]
+
+
+def run_detectron2_vitdet_batch(
+    detector,
+    imgs,
+    det_cat_id: int = 0,
+    bbox_thr: float = 0.5,
+    nms_thr: float = 0.3,
+    default_to_full_image: bool = True,
+):
+    inputs = [_vitdet_inputs(img) for img in imgs]
+
+    with torch.no_grad():
+        det_out = detector(inputs)
+
+    return [
+        _vitdet_boxes(
+            out["instances"],
+            x["height"],
+            x["width"],
+            det_cat_id=det_cat_id,
+            bbox_thr=bbox_thr,
+            default_to_full_image=default_to_full_image,
+        )
+        for out, x in zip(det_out, inputs)
+    ]
@@ -36,7 +36,7 @@ def load_sam2(device, path):
 
 
 def run_sam2(sam_predictor, img, boxes):
-    with torch.autocast("cuda", dtype=torch.bfloat16):
+    with torch.autocast(sam_predictor.device.type, dtype=torch.bfloat16):
         sam_predictor.set_image(img)
         all_masks, all_scores = [], []
         for i in range(boxes.shape[0]):
@@ -0,0 +1,162 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+"""
+视频级相机内参策略
+静态相机拍摄的视频内参不变，无需对每一帧运行 FOV 估计器 (MoGe-2)
+
+模式:
+    per_frame  每帧估计 (与单张图片处理相同)
+    once       只用第一帧估计
+    median     用前 N 帧的估计结果取中位数
+    scene_cut  检测到镜头切换时重新估计
+"""
+
+import json
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Union
+
+import cv2
+import numpy as np
+
+INTRINSICS_MODES = ["per_frame", "once", "median", "scene_cut"]
+
+
+def _to_numpy_intrinsics(cam_int) -> np.ndarray:
+    """FOV估计器返回 [1, 3, 3] 的tensor，统一转为 [3, 3] numpy"""
+    if hasattr(cam_int, "cpu"):
+        cam_int = cam_int.cpu().numpy()
+    return np.asarray(cam_int, dtype=np.float32).reshape(3, 3)
+
+
+def _frame_histogram(frame_rgb: np.ndarray, size: int = 64) -> np.ndarray:
+    """缩小后的HSV颜色直方图，用于镜头切换检测"""
+    small = cv2.resize(frame_rgb, (size, size), interpolation=cv2.INTER_AREA)
+    hsv = cv2.cvtColor(small, cv2.COLOR_RGB2HSV)
+    hist = cv2.calcHist([hsv], [0, 1], None, [16, 16], [0, 180, 0, 256])
+    return cv2.normalize(hist, hist).flatten()
+
+
+class VideoIntrinsics:
+    """
+    按策略为视频帧提供相机内参
+
+    内参以分段形式记录: [{"start_frame": 帧号, "cam_int": 3x3}]，帧使用起始帧号不大于它
+    的最后一段。分段可以写入 video_info.json，重新处理同一视频时直接读取而不运行估计器。
+
+    Args:
+        fov_estimator: FOVEstimator 实例 (使用缓存的分段时可以为 None)
+        mode: 见 INTRINSICS_MODES
+        num_frames: median 模式下参与估计的帧数
+        scene_cut_threshold: 相邻帧直方图相关系数低于该值视为镜头切换
+        segments: 已有的内参分段 (例如从 video_info.json 读取)
+    """
+
+    def __init__(
+        self,
+        fov_estimator=None,
+        mode: str = "once",
+        num_frames: int = 5,
+        scene_cut_threshold: float = 0.5,
+        segments: Optional[List[Dict]] = None,
+    ):
+        if mode not in INTRINSICS_MODES:
+            raise ValueError(f"未知的内参模式: {mode}, 可选: {INTRINSICS_MODES}")
+        self.fov_estimator = fov_estimator
+        self.mode = mode
+        self.num_frames = max(num_frames, 1)
+        self.scene_cut_threshold = scene_cut_threshold
+
+        self.cached = segments is not None
+        self.segments = [
+            {"start_frame": int(s["start_frame"]), "cam_int": np.asarray(s["cam_int"])}
+            for s in (segments or [])
+        ]
+        self.num_estimated = 0
+        self._prev_hist = None
+
+    def estimate(self, frame_rgb: np.ndarray) -> np.ndarray:
+        self.num_estimated += 1
+        return _to_numpy_intrinsics(self.fov_estimator.get_cam_intrinsics(frame_rgb))
+
+    def initialize(self, frames: Iterable) -> None:
+        """
+        在处理开始前估计内参 (once / median 模式)
+
+        Args:
+            frames: (frame_idx, rgb_frame) 迭代器，once 模式只使用第一帧，
+                median 模式使用前 num_frames 帧
+        """
+        if self.cached or self.mode not in ("once", "median"):
+            return
+
+        num_frames = 1 if self.mode == "once" else self.num_frames
+        start_frame, estimates = None, []
+        for frame_idx, frame_rgb in frames:
+            if start_frame is None:
+                start_frame = frame_idx
+            estimates.append(self.estimate(frame_rgb))
+            if len(estimates) >= num_frames:
+                break
+
+        if estimates:
+            self.segments = [
+                {
+                    "start_frame": start_frame,
+                    "cam_int": np.median(np.stack(estimates), axis=0),
+                }
+            ]
+
+    def get(self, frame_idx: int, frame_rgb: np.ndarray) -> Optional[np.ndarray]:
+        """
+        返回该帧使用的内参
+
+        帧需按顺序传入 (scene_cut 模式依赖相邻帧比较)。返回 None 表示由估计器按帧处理。
+        """
+        if self.mode == "per_frame" and not self.cached:
+            return None
+
+        if self.mode == "scene_cut" and not self.cached:
+            hist = _frame_histogram(frame_rgb)
+            is_cut = (
+                self._prev_hist is None
+                or cv2.compareHist(self._prev_hist, hist, cv2.HISTCMP_CORREL)
+                < self.scene_cut_threshold
+            )
+            self._prev_hist = hist
+            if is_cut:
+                self.segments.append(
+                    {"start_frame": frame_idx, "cam_int": self.estimate(frame_rgb)}
+                )
+
+        cam_int = None
+        for segment in self.segments:
+            if segment["start_frame"] <= frame_idx or cam_int is None:
+                cam_int = segment["cam_int"]
+        return cam_int
+
+    def to_dict(self) -> Dict:
+        """写入 video_info.json 的记录"""
+        return {
+            "mode": self.mode,
+            "segments": [
+                {"start_frame": s["start_frame"], "cam_int": s["cam_int"].tolist()}
+                for s in self.segments
+            ],
+        }
+
+
+def load_cached_intrinsics(
+    video_info_path: Union[str, Path], mode: str
+) -> Optional[List[Dict]]:
+    """
+    从之前生成的 video_info.json 中读取内参分段
+
+    只有记录的模式与当前模式一致时才复用。
+    """
+    video_info_path = Path(video_info_path)
+    if not video_info_path.exists():
+        return None
+    with open(video_info_path, "r") as f:
+        record = json.load(f).get("cam_int")
+    if not record or record.get("mode") != mode or not record.get("segments"):
+        return None
+    return record["segments"]
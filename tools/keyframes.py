@@ -0,0 +1,160 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+"""
+基于运动量的自适应关键帧选择
+用缩小后的灰度帧差估计每帧的运动量，把处理帧数预算分配到运动剧烈的片段
+"""
+
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+import cv2
+import numpy as np
+
+from tools.video_io import VideoFrameReader
+
+
+def motion_scores(
+    video_path: Union[str, Path], frame_indices: List[int], size: int = 64
+) -> np.ndarray:
+    """
+    计算候选帧的运动量
+
+    每帧缩小到 size x size 的灰度图，运动量为与上一候选帧的平均绝对差 (0-255)。
+    第一帧的运动量记为 0。
+
+    Returns:
+        [len(frame_indices)] 运动量
+    """
+    scores = np.zeros(len(frame_indices), dtype=np.float32)
+    position = {frame_idx: i for i, frame_idx in enumerate(frame_indices)}
+    prev = None
+    with VideoFrameReader(video_path) as reader:
+        for frame_idx, frame_rgb in reader.read_frames(frame_indices):
+            small = cv2.resize(frame_rgb, (size, size), interpolation=cv2.INTER_AREA)
+            gray = cv2.cvtColor(small, cv2.COLOR_RGB2GRAY).astype(np.float32)
+            if prev is not None:
+                scores[position[frame_idx]] = np.abs(gray - prev).mean()
+            prev = gray
+    return scores
+
+
+def _select_by_threshold(scores: np.ndarray, threshold: float) -> List[int]:
+    """累计运动量每超过 threshold 选一帧"""
+    selected = [0]
+    accumulated = 0.0
+    for i in range(1, len(scores)):
+        accumulated += scores[i]
+        if accumulated >= threshold:
+            selected.append(i)
+            accumulated = 0.0
+    return selected
+
+
+def _select_by_budget(scores: np.ndarray, budget: int) -> List[int]:
+    """按累计运动量等间隔选 budget 帧，运动越剧烈的片段选得越密"""
+    if budget >= len(scores):
+        return list(range(len(scores)))
+
+    # 加上一个很小的底数，完全静止时退化为均匀采样
+    weights = scores + max(float(scores.mean()), 1.0) * 1e-3
+    weights[0] = 0.0
+    cumulative = np.cumsum(weights)
+    targets = np.linspace(0.0, cumulative[-1], budget)
+    selected = set(np.searchsorted(cumulative, targets, side="left").tolist())
+    # 运动剧烈处多个目标会落到同一帧，每帧只选一次，
+    # 剩余的名额按运动量从高到低补给未选中的帧，保证正好选 budget 帧
+    for i in np.argsort(-weights, kind="stable").tolist():
+        if len(selected) >= budget:
+            break
+        selected.add(i)
+    result = sorted(selected)
+    assert len(result) == budget, (len(result), budget)
+    return result
+
+
+def select_keyframes(
+    frame_indices: List[int],
+    scores: np.ndarray,
+    frame_budget: int = 0,
+    motion_threshold: float = 0.0,
+) -> List[int]:
+    """
+    根据运动量选择需要处理的帧
+
+    Args:
+        frame_indices: 候选帧号
+        scores: motion_scores 的结果
+        frame_budget: 最多处理的帧数 (0 表示不限制)，同时设置 motion_threshold 时
+            在阈值选出的帧中挑选
+        motion_threshold: 累计运动量阈值 (0 表示不使用)
+
+    Returns:
+        选中的帧号 (升序)
+    """
+    if len(frame_indices) == 0:
+        return []
+
+    selected = list(range(len(frame_indices)))
+    if motion_threshold > 0:
+        selected = _select_by_threshold(scores, motion_threshold)
+    if frame_budget > 0 and len(selected) > frame_budget:
+        # 在阈值选出的帧中再按预算挑选，每帧的运动量为它与上一选中帧之间的累计运动量
+        cumulative = np.cumsum(scores)[selected]
+        segment_scores = np.diff(cumulative, prepend=cumulative[0])
+        picked = _select_by_budget(segment_scores, frame_budget)
+        selected = [selected[i] for i in picked]
+    return [frame_indices[i] for i in selected]
+
+
+def selection_report(
+    frame_indices: List[int],
+    scores: np.ndarray,
+    selected: List[int],
+    num_bins: int = 10,
+) -> Dict:
+    """
+    生成关键帧选择报告
+
+    Returns:
+        包含候选/选中帧数和每个区段运动量、选中帧数的字典
+    """
+    selected_set = set(selected)
+    bins = []
+    for part in np.array_split(np.arange(len(frame_indices)), num_bins):
+        if len(part) == 0:
+            continue
+        bins.append(
+            {
+                "start_frame": int(frame_indices[part[0]]),
+                "end_frame": int(frame_indices[part[-1]]),
+                "mean_motion": float(scores[part].mean()),
+                "num_selected": sum(frame_indices[i] in selected_set for i in part),
+            }
+        )
+    return {
+        "num_candidates": len(frame_indices),
+        "num_selected": len(selected),
+        "bins": bins,
+        "frames": [
+            {
+                "frame_idx": int(frame_idx),
+                "motion": float(score),
+                "selected": frame_idx in selected_set,
+            }
+            for frame_idx, score in zip(frame_indices, scores)
+        ],
+    }
+
+
+def format_report(report: Dict, frame_budget: Optional[int] = None) -> str:
+    """把报告格式化为便于阅读的文本"""
+    lines = [
+        f"候选帧: {report['num_candidates']}, 选中: {report['num_selected']}"
+        + (f" (预算: {frame_budget})" if frame_budget else "")
+    ]
+    for b in report["bins"]:
+        lines.append(
+            f"  帧 {b['start_frame']:6d}-{b['end_frame']:6d}  "
+            f"运动量 {b['mean_motion']:6.2f}  选中 {b['num_selected']:5d}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,182 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+"""
+帧处理清单 (manifest.jsonl)
+每处理完一帧追加一行记录 (帧号、输出文件、校验和)，用于断点续跑和查看未完成任务的部分结果
+
+分片处理时每个分片写自己的清单和元信息 (manifest.<i>-of-<N>.jsonl, video_info.<i>-of-<N>.json)，
+全部完成后由 merge_shards 合并为一个 video_info.json
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Union
+
+MANIFEST_NAME = "manifest.jsonl"
+VIDEO_INFO_NAME = "video_info.json"
+
+
+def _shard_suffix(shard_id: int, num_shards: int) -> str:
+    return "" if num_shards <= 1 else f".{shard_id}-of-{num_shards}"
+
+
+def manifest_name(shard_id: int = 0, num_shards: int = 1) -> str:
+    """分片的清单文件名，不分片时为 manifest.jsonl"""
+    return f"manifest{_shard_suffix(shard_id, num_shards)}.jsonl"
+
+
+def video_info_name(shard_id: int = 0, num_shards: int = 1) -> str:
+    """分片的元信息文件名，不分片时为 video_info.json"""
+    return f"video_info{_shard_suffix(shard_id, num_shards)}.json"
+
+
+def file_checksum(path: Union[str, Path], chunk_size: int = 1 << 20) -> str:
+    """计算文件的 sha256"""
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def read_manifest(path: Union[str, Path]) -> Dict[int, Dict]:
+    """
+    读取清单，返回 {frame_idx: 记录}
+
+    同一帧出现多次时以最后一条为准；进程崩溃时可能写了一半的最后一行会被忽略。
+    """
+    path = Path(path)
+    records = {}
+    if not path.exists():
+        return records
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            records[int(record["frame_idx"])] = record
+    return records
+
+
+def verify_records(output_folder: Union[str, Path], records: Dict[int, Dict]) -> Dict[int, Dict]:
+    """只保留输出文件存在且校验和一致的记录"""
+    output_folder = Path(output_folder)
+    valid = {}
+    for frame_idx, record in records.items():
+        path = output_folder / record["file"]
+        if path.exists() and file_checksum(path) == record.get("sha256"):
+            valid[frame_idx] = record
+    return valid
+
+
+class FrameManifest:
+    """
+    追加写入的帧清单
+
+    Args:
+        path: 清单文件路径
+        fsync_every: 每追加多少条记录调用一次 fsync
+        resume: True 时在已有清单后追加，否则清空重写
+    """
+
+    def __init__(self, path: Union[str, Path], fsync_every: int = 50, resume: bool = False):
+        self.path = Path(path)
+        self.fsync_every = max(fsync_every, 1)
+        self._file = open(self.path, "a+" if resume else "w")
+        self._unsynced = 0
+
+        # 上次崩溃时可能留下没有换行的半行记录，先补上换行避免与新记录粘连
+        if resume and self._file.tell() > 0:
+            self._file.seek(self._file.tell() - 1)
+            if self._file.read(1) != "\n":
+                self._file.write("\n")
+
+    def append(self, record: Dict):
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_every:
+            self.sync()
+
+    def sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+
+    def close(self):
+        if not self._file.closed:
+            self.sync()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def write_json_atomic(path: Union[str, Path], data, **kwargs):
+    """先写临时文件再重命名，避免读取方看到写了一半的文件"""
+    path = Path(path)
+    # 临时文件名带上进程号，多个分片同时写同一个文件时互不干扰
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, **kwargs)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def merge_processed_frames(video_info: Dict, records: List[Dict]) -> Dict:
+    """用清单记录补全 video_info 的 processed_frames (按帧号排序)"""
+    frames = {int(f["frame_idx"]): f for f in video_info.get("processed_frames", [])}
+    for record in records:
+        frames.setdefault(
+            int(record["frame_idx"]),
+            {k: record[k] for k in ("frame_idx", "file", "num_people") if k in record},
+        )
+    video_info["processed_frames"] = [frames[k] for k in sorted(frames)]
+    return video_info
+
+
+def merge_shards(output_folder: Union[str, Path], num_shards: int) -> Dict:
+    """
+    合并各分片的元信息和清单，写出单个 video_info.json
+
+    分片中途崩溃时，其元信息中还没有的帧从分片清单中补全；只有所有分片都完成时
+    合并结果的 status 才为 complete。
+
+    Returns:
+        合并后的 video_info
+    """
+    output_folder = Path(output_folder)
+    shard_infos = []
+    for shard_id in range(num_shards):
+        info_path = output_folder / video_info_name(shard_id, num_shards)
+        if not info_path.exists():
+            print(f"警告: 分片 {shard_id} 的元信息不存在: {info_path}")
+            continue
+        with open(info_path, "r") as f:
+            shard_info = json.load(f)
+        records = read_manifest(output_folder / manifest_name(shard_id, num_shards))
+        shard_infos.append(merge_processed_frames(shard_info, records.values()))
+
+    if not shard_infos:
+        raise ValueError(f"未找到任何分片结果: {output_folder}")
+
+    video_info = {k: v for k, v in shard_infos[0].items() if k != "shard"}
+    video_info["processed_frames"] = []
+    for shard_info in shard_infos:
+        merge_processed_frames(video_info, shard_info["processed_frames"])
+
+    all_complete = len(shard_infos) == num_shards and all(
+        info.get("status") == "complete" for info in shard_infos
+    )
+    video_info["status"] = "complete" if all_complete else "running"
+    if not (output_folder / "faces.json").exists():
+        print(f"警告: {output_folder / 'faces.json'} 不存在")
+
+    write_json_atomic(output_folder / VIDEO_INFO_NAME, video_info, indent=2)
+    return video_info
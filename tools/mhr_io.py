@@ -2,11 +2,20 @@
 """
 MHR文件读写工具
 支持将3D人体模型数据保存为MHR格式(.mhr.json)，并可在网页查看器中加载
+
+视频序列可以保存为单个二进制容器 (.mhrseq)，布局:
+    8字节 magic (MHRSEQ01) | 8字节 header 长度 (小端 uint64) | JSON header | 按64字节对齐的数据区
+header 记录每帧在人物维度上的起始位置 (索引) 和每个数组在数据区中的偏移、dtype、shape。
+各字段按列连续存放，第一维为所有帧的人物拼接 (按帧、人物顺序)，可以用内存映射零解析读取任意帧。
+顶点可选 delta 编码: 每K帧一个关键帧，其余帧存相对关键帧的 int16 量化增量 (可选 zstd 压缩)。
 """
 
 import json
+import os
+import shutil
+import tempfile
 import numpy as np
-from typing import Dict, List, Optional, Union
+from typing import Dict, Iterable, List, Optional, Tuple, Union
 from pathlib import Path
 
 
@@ -143,3 +152,542 @@ def export_obj(
 
     print(f"OBJ文件已保存到: {filepath}")
     return filepath
+
+
+SEQUENCE_MAGIC = b"MHRSEQ01"
+SEQUENCE_SUFFIX = ".mhrseq"
+_SEQUENCE_ALIGN = 64
+
+# (容器中的字段名, estimator 输出中的键)
+SEQUENCE_FIELDS = [
+    ("vertices", "pred_vertices"),
+    ("keypoints_3d", "pred_keypoints_3d"),
+    ("keypoints_2d", "pred_keypoints_2d"),
+    ("cam_t", "pred_cam_t"),
+    ("bbox", "bbox"),
+    ("focal_length", "focal_length"),
+    ("global_rot", "global_rot"),
+    ("body_pose", "body_pose_params"),
+    ("shape", "shape_params"),
+    ("scale", "scale_params"),
+    ("hand", "hand_pose_params"),
+    ("expression", "expr_params"),
+]
+
+# 使用 dtype 参数 (可为float16) 存储的大数组，其余字段固定为float32
+_SEQUENCE_LOW_PRECISION_FIELDS = ("vertices", "keypoints_3d")
+
+VERTEX_ENCODINGS = ["raw", "delta"]
+
+
+def _align(offset: int) -> int:
+    return (offset + _SEQUENCE_ALIGN - 1) // _SEQUENCE_ALIGN * _SEQUENCE_ALIGN
+
+
+class _DeltaVertexEncoder:
+    """
+    顶点的关键帧 + 量化增量编码
+
+    每 keyframe_interval 帧存一次完整顶点 (关键帧)，其余帧存相对最近关键帧的 int16 量化增量
+    (量化步长 = 2 * max_error，重建误差不超过 max_error)。增量总是相对关键帧而不是上一帧，
+    因此误差不会累积，任意帧只需读取一个关键帧即可重建。人数变化或增量超出 int16 范围时
+    强制插入关键帧。可选对每条增量记录做 zstd 压缩。
+    """
+
+    def __init__(
+        self,
+        tmpdir: str,
+        dtype: np.dtype,
+        keyframe_interval: int = 10,
+        max_error: float = 5e-4,
+        compression: Optional[str] = None,
+    ):
+        self.dtype = dtype
+        self.keyframe_interval = max(keyframe_interval, 1)
+        self.step = 2.0 * max_error
+        self.compression = compression
+        self._compressor = None
+        if compression == "zstd":
+            try:
+                import zstandard
+            except ImportError:
+                raise ImportError("zstd 压缩需要安装 zstandard: pip install zstandard")
+            self._compressor = zstandard.ZstdCompressor(level=3)
+        elif compression is not None:
+            raise ValueError(f"不支持的压缩方式: {compression}")
+
+        self.key_path = os.path.join(tmpdir, "vertices_key")
+        self.delta_path = os.path.join(tmpdir, "vertices_delta")
+        self._key_file = open(self.key_path, "wb")
+        self._delta_file = open(self.delta_path, "wb")
+
+        self.ref, self.slot, self.delta_offsets = [], [], [0]
+        self.num_key, self.num_delta = 0, 0
+        self._key = None  # 当前关键帧 (按存储精度还原后的float32)
+        self._key_start = 0
+        self._since_key = 0
+
+    def add(self, vertices: np.ndarray):
+        """追加一帧所有人的顶点 [N, V, 3]"""
+        num_people = len(vertices)
+        delta = None
+        if (
+            self._key is not None
+            and self._since_key < self.keyframe_interval
+            and len(self._key) == num_people
+        ):
+            delta = np.round((vertices - self._key) / self.step)
+            if not np.isfinite(delta).all() or np.abs(delta).max(initial=0) > 32767:
+                delta = None
+
+        if delta is None:
+            stored = vertices.astype(self.dtype)
+            self._key_file.write(stored.tobytes())
+            self._key = stored.astype(np.float32)
+            self._key_start = self.num_key
+            self._since_key = 0
+            self.ref.extend(range(self.num_key, self.num_key + num_people))
+            self.slot.extend([-1] * num_people)
+            self.num_key += num_people
+        else:
+            delta = delta.astype(np.int16)
+            for p in range(num_people):
+                data = delta[p].tobytes()
+                if self._compressor is not None:
+                    data = self._compressor.compress(data)
+                self._delta_file.write(data)
+                self.delta_offsets.append(self.delta_offsets[-1] + len(data))
+                self.ref.append(self._key_start + p)
+                self.slot.append(self.num_delta + p)
+            self.num_delta += num_people
+        self._since_key += 1
+
+    def close(self, shape: Tuple[int, ...]) -> List[Tuple]:
+        """返回需要写入容器的数组块 (name, dtype, shape, 来源)"""
+        self._key_file.close()
+        self._delta_file.close()
+        if self.compression is None:
+            delta_block = (
+                "vertices_delta",
+                np.dtype(np.int16),
+                [self.num_delta] + list(shape),
+                self.delta_path,
+            )
+        else:
+            delta_block = (
+                "vertices_delta",
+                np.dtype(np.uint8),
+                [self.delta_offsets[-1]],
+                self.delta_path,
+            )
+        blocks = [
+            ("vertices_key", self.dtype, [self.num_key] + list(shape), self.key_path),
+            delta_block,
+            ("vertices_ref", np.dtype(np.int32), [len(self.ref)], np.array(self.ref, dtype=np.int32)),
+            ("vertices_slot", np.dtype(np.int32), [len(self.slot)], np.array(self.slot, dtype=np.int32)),
+        ]
+        if self.compression is not None:
+            offsets = np.array(self.delta_offsets, dtype=np.int64)
+            blocks.append(("vertices_delta_offsets", offsets.dtype, [len(offsets)], offsets))
+        return blocks
+
+    def header(self) -> Dict:
+        return {
+            "type": "delta",
+            "step": self.step,
+            "keyframe_interval": self.keyframe_interval,
+            "compression": self.compression,
+        }
+
+
+class MHRSequenceWriter:
+    """
+    流式写入 .mhrseq 容器
+
+    每个字段先追加写入各自的临时文件，close() 时再拼接为 header + 连续数组，
+    因此写入过程中内存占用与帧数无关。
+
+    Args:
+        filepath: 输出文件路径 (建议使用.mhrseq后缀)
+        faces: 网格面片索引 (来自estimator.faces)
+        dtype: 顶点和3D关键点的存储精度 (float32 或 float16)
+        metadata: 写入 header 的附加信息 (例如视频元信息)
+        vertex_encoding: 顶点编码方式，raw=逐帧完整存储，delta=关键帧 + 量化增量
+        keyframe_interval: delta 编码的关键帧间隔 (帧数)
+        max_error: delta 编码允许的最大顶点误差 (米)
+        compression: delta 编码的增量压缩方式 (None 或 "zstd")
+    """
+
+    def __init__(
+        self,
+        filepath: Union[str, Path],
+        faces: Optional[np.ndarray] = None,
+        dtype: str = "float32",
+        metadata: Optional[Dict] = None,
+        vertex_encoding: str = "raw",
+        keyframe_interval: int = 10,
+        max_error: float = 5e-4,
+        compression: Optional[str] = None,
+    ):
+        if vertex_encoding not in VERTEX_ENCODINGS:
+            raise ValueError(f"未知的顶点编码: {vertex_encoding}, 可选: {VERTEX_ENCODINGS}")
+        self.filepath = Path(filepath)
+        self.faces = None if faces is None else np.asarray(faces, dtype=np.int32)
+        self.dtype = np.dtype(dtype)
+        self.metadata = metadata or {}
+
+        self.frames = []
+        self.num_records = 0
+        # 字段名 -> (dtype, 单人shape)，由第一个人的数据确定
+        self.fields: Optional[Dict[str, Tuple[np.dtype, Tuple[int, ...]]]] = None
+
+        self.filepath.parent.mkdir(parents=True, exist_ok=True)
+        self._tmpdir = tempfile.mkdtemp(prefix=".mhrseq_", dir=self.filepath.parent)
+        self._files = {}
+
+        self._vertex_encoder = None
+        if vertex_encoding == "delta":
+            self._vertex_encoder = _DeltaVertexEncoder(
+                self._tmpdir,
+                self.dtype,
+                keyframe_interval=keyframe_interval,
+                max_error=max_error,
+                compression=compression,
+            )
+
+    def _init_fields(self, person: Dict):
+        self.fields = {}
+        for name, key in SEQUENCE_FIELDS:
+            value = person.get(key)
+            if value is None:
+                continue
+            dtype = (
+                self.dtype
+                if name in _SEQUENCE_LOW_PRECISION_FIELDS
+                else np.dtype(np.float32)
+            )
+            self.fields[name] = (dtype, np.shape(value))
+            if name == "vertices" and self._vertex_encoder is not None:
+                continue
+            self._files[name] = open(os.path.join(self._tmpdir, name), "wb")
+
+    def add_frame(self, frame_idx: int, outputs: List[Dict]):
+        """
+        追加一帧 (帧需按顺序添加)
+
+        Args:
+            frame_idx: 帧号
+            outputs: estimator.process_one_image()的输出列表
+        """
+        if self.fields is None and outputs:
+            self._init_fields(outputs[0])
+
+        for name, key in SEQUENCE_FIELDS:
+            if self.fields is None or name not in self.fields:
+                continue
+            dtype, shape = self.fields[name]
+            if name in self._files:
+                data = np.full((len(outputs),) + shape, np.nan, dtype=dtype)
+            else:
+                # 交给编码器，先保持float32
+                data = np.full((len(outputs),) + shape, np.nan, dtype=np.float32)
+            for i, person in enumerate(outputs):
+                if person.get(key) is not None:
+                    data[i] = np.asarray(person[key]).reshape(shape)
+            if name in self._files:
+                self._files[name].write(data.tobytes())
+            else:
+                self._vertex_encoder.add(data)
+
+        self.frames.append(
+            {
+                "frame_idx": int(frame_idx),
+                "start": self.num_records,
+                "num_people": len(outputs),
+            }
+        )
+        self.num_records += len(outputs)
+
+    def close(self):
+        """拼接 header 和各字段数据，写出最终文件"""
+        # (name, dtype, shape, 来源: 临时文件路径或numpy数组)
+        blocks = []
+        if self.faces is not None:
+            blocks.append(("faces", self.faces.dtype, list(self.faces.shape), self.faces))
+        encoding = {}
+        fields = self.fields or {}
+        if self._vertex_encoder is not None and "vertices" not in fields:
+            # 没有顶点数据 (例如只保存参数)，编码器不产生任何数组
+            self._vertex_encoder.close(())
+        for name, (dtype, shape) in fields.items():
+            if name not in self._files:
+                blocks.extend(self._vertex_encoder.close(shape))
+                encoding[name] = self._vertex_encoder.header()
+                continue
+            self._files[name].close()
+            blocks.append(
+                (
+                    name,
+                    dtype,
+                    [self.num_records] + list(shape),
+                    os.path.join(self._tmpdir, name),
+                )
+            )
+
+        arrays, offset = {}, 0
+        for name, dtype, shape, source in blocks:
+            size = source.nbytes if isinstance(source, np.ndarray) else os.path.getsize(source)
+            arrays[name] = {"dtype": dtype.str, "shape": shape, "offset": offset}
+            offset = _align(offset + size)
+
+        header = json.dumps(
+            {
+                "version": "1.0",
+                "num_frames": len(self.frames),
+                "num_records": self.num_records,
+                "frames": self.frames,
+                "arrays": arrays,
+                "encoding": encoding,
+                "metadata": numpy_to_list(self.metadata),
+            }
+        ).encode("utf-8")
+        data_start = _align(len(SEQUENCE_MAGIC) + 8 + len(header))
+
+        tmp_path = self.filepath.with_name(f"{self.filepath.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(SEQUENCE_MAGIC)
+            f.write(len(header).to_bytes(8, "little"))
+            f.write(header)
+            for name, _, _, source in blocks:
+                f.seek(data_start + arrays[name]["offset"])
+                if isinstance(source, np.ndarray):
+                    f.write(source.tobytes())
+                else:
+                    with open(source, "rb") as src:
+                        shutil.copyfileobj(src, f)
+            f.truncate()
+        os.replace(tmp_path, self.filepath)
+        shutil.rmtree(self._tmpdir, ignore_errors=True)
+
+        print(f"MHR序列已保存到: {self.filepath} ({len(self.frames)} 帧)")
+        return self.filepath
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            for f in self._files.values():
+                f.close()
+            if self._vertex_encoder is not None:
+                self._vertex_encoder.close(())
+            shutil.rmtree(self._tmpdir, ignore_errors=True)
+
+
+class MHRSequence:
+    """
+    内存映射方式读取的 .mhrseq 容器
+
+    所有数组都是指向文件映射的只读视图，读取任意帧不需要解析。
+    delta 编码的顶点按需从最近的关键帧重建。
+
+    Args:
+        filepath: .mhrseq 文件路径
+    """
+
+    def __init__(self, filepath: Union[str, Path]):
+        self.filepath = Path(filepath)
+        with open(self.filepath, "rb") as f:
+            magic = f.read(len(SEQUENCE_MAGIC))
+            if magic != SEQUENCE_MAGIC:
+                raise ValueError(f"不是有效的MHR序列文件: {filepath}")
+            header_len = int.from_bytes(f.read(8), "little")
+            self.header = json.loads(f.read(header_len).decode("utf-8"))
+        data_start = _align(len(SEQUENCE_MAGIC) + 8 + header_len)
+
+        self._mm = np.memmap(self.filepath, dtype=np.uint8, mode="r")
+        self.arrays = {}
+        for name, spec in self.header["arrays"].items():
+            count = int(np.prod(spec["shape"]))
+            self.arrays[name] = np.frombuffer(
+                self._mm,
+                dtype=np.dtype(spec["dtype"]),
+                count=count,
+                offset=data_start + spec["offset"],
+            ).reshape(spec["shape"])
+
+        self.faces = self.arrays.pop("faces", None)
+        self.frames = self.header["frames"]
+        self.metadata = self.header.get("metadata", {})
+        self._frame_lookup = {f["frame_idx"]: i for i, f in enumerate(self.frames)}
+
+        # delta 编码的顶点: 内部数组不作为普通字段暴露
+        self.vertex_encoding = self.header.get("encoding", {}).get("vertices")
+        self._vertex_arrays = {}
+        if self.vertex_encoding is not None:
+            for name in list(self.arrays):
+                if name.startswith("vertices_"):
+                    self._vertex_arrays[name] = self.arrays.pop(name)
+            self._decompressor = None
+            if self.vertex_encoding.get("compression") == "zstd":
+                import zstandard
+
+                self._decompressor = zstandard.ZstdDecompressor()
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    @property
+    def frame_indices(self) -> List[int]:
+        return [f["frame_idx"] for f in self.frames]
+
+    def index_of(self, frame_idx: int) -> int:
+        """帧号对应的序号"""
+        return self._frame_lookup[frame_idx]
+
+    def _decode_vertices(self, start: int, end: int) -> np.ndarray:
+        """重建第 start:end 条记录的顶点"""
+        key = self._vertex_arrays["vertices_key"]
+        delta = self._vertex_arrays["vertices_delta"]
+        ref = self._vertex_arrays["vertices_ref"]
+        slot = self._vertex_arrays["vertices_slot"]
+        step = self.vertex_encoding["step"]
+
+        vertices = key[ref[start:end]].astype(np.float32)
+        for i, s in enumerate(slot[start:end]):
+            if s < 0:
+                continue
+            if self._decompressor is None:
+                d = delta[s]
+            else:
+                offsets = self._vertex_arrays["vertices_delta_offsets"]
+                raw = self._decompressor.decompress(
+                    delta[offsets[s] : offsets[s + 1]].tobytes()
+                )
+                d = np.frombuffer(raw, dtype=np.int16).reshape(key.shape[1:])
+            vertices[i] += d.astype(np.float32) * step
+        return vertices
+
+    def frame_arrays(self, i: int) -> Dict[str, np.ndarray]:
+        """第 i 帧所有人物的各字段 ([num_people, ...] 视图)"""
+        frame = self.frames[i]
+        start, end = frame["start"], frame["start"] + frame["num_people"]
+        arrays = {name: array[start:end] for name, array in self.arrays.items()}
+        if self.vertex_encoding is not None:
+            arrays["vertices"] = self._decode_vertices(start, end)
+        return arrays
+
+    def get_frame(self, i: int) -> List[Dict]:
+        """第 i 帧，格式与 estimator.process_one_image() 的输出一致"""
+        arrays = self.frame_arrays(i)
+        keys = dict(SEQUENCE_FIELDS)
+        return [
+            {keys[name]: array[p] for name, array in arrays.items()}
+            for p in range(self.frames[i]["num_people"])
+        ]
+
+    def to_mhr_dict(self, i: int, include_faces: bool = False) -> Dict:
+        """第 i 帧转换为与 .mhr.json 相同结构的字典 (供网页查看器使用)"""
+        people = self.get_frame(i)
+        image_size = self.metadata.get("image_size")
+        mhr_data = {
+            "version": "1.0",
+            "image_path": f"frame_{self.frames[i]['frame_idx']}",
+            "image_size": list(image_size) if image_size else None,
+            "num_people": len(people),
+            "faces": numpy_to_list(self.faces) if include_faces else None,
+            "people": [],
+        }
+        for p, person in enumerate(people):
+            mhr_data["people"].append(
+                {
+                    "id": p,
+                    "bbox": numpy_to_list(person.get("bbox")),
+                    "focal_length": float(person.get("focal_length", 500.0)),
+                    "camera": {
+                        "translation": numpy_to_list(person.get("pred_cam_t")),
+                    },
+                    "mesh": {
+                        "vertices": numpy_to_list(person.get("pred_vertices")),
+                        "keypoints_3d": numpy_to_list(person.get("pred_keypoints_3d")),
+                        "keypoints_2d": numpy_to_list(person.get("pred_keypoints_2d")),
+                    },
+                    "params": {
+                        "global_rot": numpy_to_list(person.get("global_rot")),
+                        "body_pose": numpy_to_list(person.get("body_pose_params")),
+                        "shape": numpy_to_list(person.get("shape_params")),
+                        "scale": numpy_to_list(person.get("scale_params")),
+                        "hand": numpy_to_list(person.get("hand_pose_params")),
+                        "expression": numpy_to_list(person.get("expr_params")),
+                    },
+                }
+            )
+        return mhr_data
+
+
+def save_sequence(
+    filepath: Union[str, Path],
+    frames: Iterable[Tuple[int, List[Dict]]],
+    faces: Optional[np.ndarray] = None,
+    dtype: str = "float32",
+    metadata: Optional[Dict] = None,
+    **encoding_kwargs,
+):
+    """
+    保存整段视频的结果为 .mhrseq 容器
+
+    Args:
+        filepath: 输出文件路径
+        frames: (frame_idx, outputs) 迭代器，outputs 为 estimator 的输出列表
+        faces: 网格面片索引
+        dtype: 顶点和3D关键点的存储精度
+        metadata: 附加信息
+        encoding_kwargs: 顶点编码参数 (vertex_encoding, keyframe_interval,
+            max_error, compression)，见 MHRSequenceWriter
+    """
+    with MHRSequenceWriter(
+        filepath, faces, dtype=dtype, metadata=metadata, **encoding_kwargs
+    ) as writer:
+        for frame_idx, outputs in frames:
+            writer.add_frame(frame_idx, outputs)
+    return Path(filepath)
+
+
+def load_sequence(filepath: Union[str, Path]) -> MHRSequence:
+    """
+    以内存映射方式加载 .mhrseq 容器
+
+    Args:
+        filepath: .mhrseq 文件路径
+
+    Returns:
+        MHRSequence 对象
+    """
+    return MHRSequence(filepath)
+
+
+def mhr_json_to_outputs(mhr_data: Dict) -> List[Dict]:
+    """把 .mhr.json 的数据转换回 estimator 输出格式 (用于转换已有的输出目录)"""
+    outputs = []
+    for person in mhr_data["people"]:
+        mesh, params = person.get("mesh", {}), person.get("params", {})
+        fields = {
+            "bbox": person.get("bbox"),
+            "focal_length": person.get("focal_length"),
+            "pred_cam_t": person.get("camera", {}).get("translation"),
+            "pred_vertices": mesh.get("vertices"),
+            "pred_keypoints_3d": mesh.get("keypoints_3d"),
+            "pred_keypoints_2d": mesh.get("keypoints_2d"),
+            "global_rot": params.get("global_rot"),
+            "body_pose_params": params.get("body_pose"),
+            "shape_params": params.get("shape"),
+            "scale_params": params.get("scale"),
+            "hand_pose_params": params.get("hand"),
+            "expr_params": params.get("expression"),
+        }
+        outputs.append(
+            {k: None if v is None else np.asarray(v) for k, v in fields.items()}
+        )
+    return outputs
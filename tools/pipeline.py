@@ -0,0 +1,110 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+"""
+流水线工具
+用有界队列把解码、预处理、推理、写文件等阶段放到不同线程中重叠执行
+"""
+
+import queue
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Iterable, Iterator, TypeVar
+
+T = TypeVar("T")
+
+_END = object()
+
+
+class StageTimer:
+    """
+    线程安全的分阶段计时器
+
+    记录每个阶段的累计耗时和处理的条目数，用于在结束时打印各阶段占用。
+    """
+
+    def __init__(self):
+        self.totals = defaultdict(float)
+        self.counts = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def add(self, name: str, seconds: float, count: int = 1):
+        with self._lock:
+            self.totals[name] += seconds
+            self.counts[name] += count
+
+    @contextmanager
+    def measure(self, name: str, count: int = 1):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start, count)
+
+    def wrap_iter(self, iterable: Iterable[T], name: str) -> Iterator[T]:
+        """对迭代器的每次取值计时 (用于解码这类生成器形式的阶段)"""
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            self.add(name, time.perf_counter() - start)
+            yield item
+
+    def summary(self, wall_time: float) -> str:
+        lines = [f"总耗时: {wall_time:.2f}s"]
+        for name, total in self.totals.items():
+            count = max(self.counts[name], 1)
+            lines.append(
+                f"  {name:<10s} {total:8.2f}s  {count:6d}次  "
+                f"{total / count * 1000:8.1f}ms/次  "
+                f"占用 {total / max(wall_time, 1e-6) * 100:5.1f}%"
+            )
+        return "\n".join(lines)
+
+
+class _StageError:
+    def __init__(self, exc: BaseException):
+        self.exc = exc
+
+
+def background_iter(iterable: Iterable[T], depth: int) -> Iterator[T]:
+    """
+    在后台线程中消费 iterable，通过容量为 depth 的有界队列产出结果
+
+    生产者领先消费者最多 depth 个条目；depth <= 0 时退化为在当前线程中直接迭代。
+    后台线程中抛出的异常会在消费端重新抛出。
+
+    Args:
+        iterable: 上游阶段 (可以是另一个 background_iter)
+        depth: 队列容量
+    """
+    if depth <= 0:
+        yield from iterable
+        return
+
+    q = queue.Queue(maxsize=depth)
+
+    def produce():
+        try:
+            for item in iterable:
+                q.put(item)
+        except BaseException as e:  # 交给消费端处理
+            q.put(_StageError(e))
+        else:
+            q.put(_END)
+
+    # daemon线程: 消费端提前退出时不会阻塞进程结束
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+
+    while True:
+        item = q.get()
+        if item is _END:
+            break
+        if isinstance(item, _StageError):
+            raise item.exc
+        yield item
+    thread.join()
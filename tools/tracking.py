@@ -0,0 +1,151 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+"""
+视频人体框跟踪工具
+只在关键帧运行人体检测器，其余帧使用上一帧预测的2D关键点外扩得到的框
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+def keypoints_to_bbox(
+    keypoints_2d: np.ndarray,
+    padding: float = 1.2,
+    image_size: Optional[Tuple[int, int]] = None,
+) -> np.ndarray:
+    """
+    根据2D关键点计算外扩后的人体框
+
+    Args:
+        keypoints_2d: [K, 2] 图像坐标系下的关键点
+        padding: 以关键点包围盒中心为基准的外扩倍数
+        image_size: (width, height)，提供时将框裁剪到图像范围内
+
+    Returns:
+        [4] xyxy 格式的框
+    """
+    keypoints_2d = np.asarray(keypoints_2d)[:, :2]
+    x1, y1 = keypoints_2d.min(axis=0)
+    x2, y2 = keypoints_2d.max(axis=0)
+    cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
+    w, h = (x2 - x1) * padding, (y2 - y1) * padding
+    bbox = np.array([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2])
+
+    if image_size is not None:
+        width, height = image_size
+        bbox[[0, 2]] = bbox[[0, 2]].clip(0, width)
+        bbox[[1, 3]] = bbox[[1, 3]].clip(0, height)
+    return bbox
+
+
+def bbox_iou(box_a: np.ndarray, box_b: np.ndarray) -> float:
+    """两个 xyxy 框的IoU"""
+    x1 = max(box_a[0], box_b[0])
+    y1 = max(box_a[1], box_b[1])
+    x2 = min(box_a[2], box_b[2])
+    y2 = min(box_a[3], box_b[3])
+    inter = max(x2 - x1, 0) * max(y2 - y1, 0)
+    area_a = (box_a[2] - box_a[0]) * (box_a[3] - box_a[1])
+    area_b = (box_b[2] - box_b[0]) * (box_b[3] - box_b[1])
+    union = area_a + area_b - inter
+    return float(inter / union) if union > 0 else 0.0
+
+
+class BoxTracker:
+    """
+    检测器关键帧 + 关键点框传播
+
+    每 detect_every 帧运行一次检测器；中间帧使用上一帧 pred_keypoints_2d 外扩得到的框。
+    当传播框与新预测关键点得到的框的IoU低于 redetect_iou (说明人移出了传播框或
+    预测不可靠)，或上一帧没有人时，下一帧强制重新检测。
+
+    Args:
+        detect_every: 检测器运行间隔 (帧数)，1 表示每帧都检测
+        redetect_iou: 触发重新检测的IoU阈值
+        padding: 关键点框的外扩倍数
+    """
+
+    def __init__(
+        self, detect_every: int, redetect_iou: float = 0.5, padding: float = 1.2
+    ):
+        self.detect_every = max(detect_every, 1)
+        self.redetect_iou = redetect_iou
+        self.padding = padding
+
+        self.tracks: Optional[np.ndarray] = None
+        self.frames_since_detection = 0
+        self.num_detected = 0
+        self.num_tracked = 0
+        self.num_redetect = 0
+
+    def reset(self):
+        """丢弃当前轨迹，下一帧重新检测"""
+        self.tracks = None
+
+    def boxes(self) -> Optional[np.ndarray]:
+        """
+        返回当前帧应使用的框
+
+        Returns:
+            [N, 4] 传播得到的框；需要运行检测器时返回 None
+        """
+        if self.tracks is None or self.frames_since_detection >= self.detect_every:
+            self.frames_since_detection = 1
+            self.num_detected += 1
+            return None
+
+        self.frames_since_detection += 1
+        self.num_tracked += 1
+        return self.tracks.copy()
+
+    def update(self, outputs: List[Dict], image_size: Tuple[int, int]):
+        """
+        用当前帧的预测结果更新轨迹
+
+        Args:
+            outputs: process_one_image 的输出 (每人一个dict)
+            image_size: (width, height)
+        """
+        if not outputs:
+            self.reset()
+            return
+
+        tracks = []
+        drifted = False
+        for person in outputs:
+            bbox = keypoints_to_bbox(
+                person["pred_keypoints_2d"], self.padding, image_size
+            )
+            if bbox_iou(bbox, person["bbox"]) < self.redetect_iou:
+                drifted = True
+            tracks.append(bbox)
+
+        self.tracks = np.stack(tracks, axis=0)
+        if drifted:
+            # 下一帧重新检测
+            self.frames_since_detection = self.detect_every
+            self.num_redetect += 1
+
+    def summary(self, detect_time: Sequence[float], track_time: Sequence[float]) -> str:
+        """
+        统计检测器节省的时间
+
+        Args:
+            detect_time: (总耗时, 帧数) 运行检测器的帧的预处理耗时
+            track_time: (总耗时, 帧数) 使用传播框的帧的预处理耗时
+        """
+        lines = [
+            f"检测帧: {self.num_detected}, 跟踪帧: {self.num_tracked}, "
+            f"因漂移重新检测: {self.num_redetect}"
+        ]
+        if detect_time[1] > 0 and track_time[1] > 0:
+            per_detect = detect_time[0] / detect_time[1]
+            per_track = track_time[0] / track_time[1]
+            saved = max(per_detect - per_track, 0.0) * track_time[1]
+            lines.append(
+                f"检测帧预处理 {per_detect * 1000:.1f}ms/帧, "
+                f"跟踪帧预处理 {per_track * 1000:.1f}ms/帧, "
+                f"约节省检测器耗时 {saved:.2f}s"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,131 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+"""
+视频读取工具
+按顺序流式解码视频帧，避免逐帧 seek 带来的重复解码开销
+"""
+
+from pathlib import Path
+from typing import Iterable, Iterator, List, Tuple, TypeVar, Union
+
+import cv2
+import numpy as np
+
+T = TypeVar("T")
+
+
+class VideoFrameReader:
+    """
+    顺序解码的视频帧源
+
+    只在起始帧做一次 seek，之后按顺序解码；不需要处理的帧只调用 grab()
+    (只解复用/解码、不做颜色转换和拷贝)，需要处理的帧才 retrieve() 并转为RGB。
+
+    Args:
+        video_path: 视频文件路径
+    """
+
+    def __init__(self, video_path: Union[str, Path]):
+        self.video_path = str(video_path)
+        self.cap = cv2.VideoCapture(self.video_path)
+        if not self.cap.isOpened():
+            raise ValueError(f"无法打开视频: {video_path}")
+
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.total_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+        # 当前解码位置 (下一次 grab() 将得到的帧号)
+        self._position = 0
+
+    def frame_range(
+        self, start_frame: int = 0, end_frame: int = -1, frame_skip: int = 0
+    ) -> List[int]:
+        """根据起止帧和跳帧数计算需要处理的帧号列表"""
+        end_frame = end_frame if end_frame > 0 else self.total_frames
+        return list(
+            range(start_frame, min(end_frame, self.total_frames), frame_skip + 1)
+        )
+
+    def read_frames(
+        self, frame_indices: Iterable[int]
+    ) -> Iterator[Tuple[int, np.ndarray]]:
+        """
+        按顺序解码并产出 (frame_idx, rgb_frame)
+
+        Args:
+            frame_indices: 需要的帧号 (升序)
+
+        Yields:
+            (frame_idx, rgb_frame) 元组，rgb_frame 为 HxWx3 的 uint8 RGB 图像
+        """
+        frame_indices = sorted(set(int(i) for i in frame_indices))
+        if not frame_indices:
+            return
+
+        # 只在开始时 seek 一次
+        if frame_indices[0] != self._position:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_indices[0])
+            self._position = frame_indices[0]
+
+        for frame_idx in frame_indices:
+            # 跳过中间不需要的帧
+            while self._position < frame_idx:
+                if not self.cap.grab():
+                    print(f"警告: 视频在第 {self._position} 帧提前结束")
+                    return
+                self._position += 1
+
+            ret, frame = self.cap.read()
+            if not ret:
+                print(f"警告: 无法读取帧 {frame_idx}，视频提前结束")
+                return
+            self._position += 1
+
+            yield frame_idx, cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+    def release(self):
+        self.cap.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+def iter_batches(items: Iterable[T], batch_size: int) -> Iterator[List[T]]:
+    """将帧流按 batch_size 分组，最后一组可能不足 batch_size"""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= max(batch_size, 1):
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def shard_frames(frame_indices: List[int], num_shards: int, shard_id: int) -> List[int]:
+    """把帧号列表切成 num_shards 段连续的区间，返回第 shard_id 段"""
+    if not 0 <= shard_id < num_shards:
+        raise ValueError(f"shard_id 必须在 [0, {num_shards}) 范围内, 当前为 {shard_id}")
+    start = len(frame_indices) * shard_id // num_shards
+    end = len(frame_indices) * (shard_id + 1) // num_shards
+    return frame_indices[start:end]
+
+
+def read_frames_with_seek(
+    video_path: Union[str, Path], frame_indices: Iterable[int]
+) -> Iterator[Tuple[int, np.ndarray]]:
+    """逐帧 seek 的旧读取方式，仅用于基准测试对比"""
+    cap = cv2.VideoCapture(str(video_path))
+    try:
+        for frame_idx in frame_indices:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
+            ret, frame = cap.read()
+            if not ret:
+                continue
+            yield frame_idx, cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    finally:
+        cap.release()
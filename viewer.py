@@ -6,6 +6,7 @@ MHR网页查看器 - 在浏览器中查看3D人体模型
     python viewer.py --mhr output/image.mhr.json
     python viewer.py --mhr_folder output/
     python viewer.py --mhr_folder output/video_name/  # 视频帧播放
+    python viewer.py --mhr_folder output/video_name/ --checkpoint_path model.ckpt  # 重建只保存参数的网格
 
 功能:
     - 支持鼠标旋转、缩放、平移
@@ -1909,6 +1910,8 @@ class MHRViewerHandler(http.server.SimpleHTTPRequestHandler):
     mhr_data = None
     video_info = None
     base_folder = None
+    sequence = None
+    regenerator = None
 
     def do_GET(self):
         parsed = urlparse(self.path)
@@ -1920,7 +1923,7 @@ class MHRViewerHandler(http.server.SimpleHTTPRequestHandler):
                 for f in self.mhr_files:
                     if Path(f).name == file_name:
                         self.__class__.current_file = f
-                        self.__class__.mhr_data = self._load_mhr_file(f)
+                        self.__class__.mhr_data = self._fill_mesh(self._load_mhr_file(f))
                         break
 
             self.send_response(200)
@@ -1945,6 +1948,9 @@ class MHRViewerHandler(http.server.SimpleHTTPRequestHandler):
             self.wfile.write(json.dumps(files).encode('utf-8'))
 
         elif parsed.path == '/api/video_info':
+            # 每次请求重新读取，处理中的视频刷新页面即可看到新完成的帧
+            if self.video_info and self.base_folder:
+                self.__class__.video_info = load_video_info(self.base_folder)
             self.send_response(200)
             self.send_header('Content-type', 'application/json')
             self.end_headers()
@@ -1971,11 +1977,23 @@ class MHRViewerHandler(http.server.SimpleHTTPRequestHandler):
                 self.send_response(200)
                 self.send_header('Content-type', 'application/json')
                 self.end_headers()
-                with open(frame_path, 'r') as f:
-                    self.wfile.write(f.read().encode('utf-8'))
+                if self.regenerator is not None:
+                    frame_data = self._fill_mesh(self._load_mhr_file(frame_path))
+                    self.wfile.write(json.dumps(frame_data).encode('utf-8'))
+                else:
+                    with open(frame_path, 'r') as f:
+                        self.wfile.write(f.read().encode('utf-8'))
             else:
-                self.send_response(404)
-                self.end_headers()
+                # 没有逐帧文件时尝试从序列文件读取
+                sequence_frame = self._load_sequence_frame(frame_file)
+                if sequence_frame is not None:
+                    self.send_response(200)
+                    self.send_header('Content-type', 'application/json')
+                    self.end_headers()
+                    self.wfile.write(json.dumps(sequence_frame).encode('utf-8'))
+                else:
+                    self.send_response(404)
+                    self.end_headers()
 
         elif parsed.path.startswith('/mediapipe/'):
             # 提供本地MediaPipe库文件
@@ -2024,6 +2042,41 @@ class MHRViewerHandler(http.server.SimpleHTTPRequestHandler):
     def log_message(self, format, *args):
         print(f"[HTTP] {args[0]}")
 
+    @classmethod
+    def _load_sequence_frame(cls, frame_file):
+        """从 .mhrseq 序列文件中读取一帧 (process_video.py --output_format mhrseq)"""
+        if not cls.video_info or not cls.video_info.get('sequence_file'):
+            return None
+        sequence_path = Path(cls.base_folder) / cls.video_info['sequence_file']
+        if not sequence_path.exists():
+            return None
+        if cls.sequence is None or cls.sequence.filepath != sequence_path:
+            from tools.mhr_io import load_sequence
+            cls.sequence = load_sequence(sequence_path)
+        for frame in cls.video_info.get('processed_frames', []):
+            if frame['file'] == frame_file:
+                return cls._fill_mesh(
+                    cls.sequence.to_mhr_dict(cls.sequence.index_of(frame['frame_idx']))
+                )
+        return None
+
+    @classmethod
+    def _fill_mesh(cls, mhr_data):
+        """只保存了参数 (--store params) 的帧，用 MeshRegenerator 重建网格和关键点"""
+        people = mhr_data.get('people', [])
+        if cls.regenerator is None or all(p['mesh']['vertices'] for p in people):
+            return mhr_data
+        from tools.mhr_io import mhr_json_to_outputs, numpy_to_list
+        outputs = mhr_json_to_outputs(mhr_data)
+        cls.regenerator.fill_outputs([outputs], image_size=mhr_data.get('image_size'))
+        for person, out in zip(people, outputs):
+            person['mesh'] = {
+                'vertices': numpy_to_list(out['pred_vertices']),
+                'keypoints_3d': numpy_to_list(out['pred_keypoints_3d']),
+                'keypoints_2d': numpy_to_list(out.get('pred_keypoints_2d')),
+            }
+        return mhr_data
+
     @staticmethod
     def _load_mhr_file(filepath):
         print(f"正在加载: {filepath}")
@@ -2051,7 +2104,24 @@ def load_video_info(path):
         info_file = path / 'video_info.json'
         if info_file.exists():
             with open(info_file, 'r') as f:
-                return json.load(f)
+                video_info = json.load(f)
+            # 处理仍在进行时，用清单中已完成的帧补全，以便查看部分结果
+            manifest_file = path / 'manifest.jsonl'
+            if video_info.get('status') == 'running' and manifest_file.exists():
+                frames = {f['frame_idx']: f for f in video_info.get('processed_frames', [])}
+                with open(manifest_file, 'r') as f:
+                    for line in f:
+                        try:
+                            record = json.loads(line)
+                        except json.JSONDecodeError:
+                            continue
+                        frames.setdefault(record['frame_idx'], {
+                            'frame_idx': record['frame_idx'],
+                            'file': record['file'],
+                            'num_people': record['num_people'],
+                        })
+                video_info['processed_frames'] = [frames[k] for k in sorted(frames)]
+            return video_info
     return None
 
 
@@ -2171,7 +2241,10 @@ def start_server(mhr_path, port=8080, use_ssl=False, cert_path=None, key_path=No
     # 设置处理器
     MHRViewerHandler.mhr_files = mhr_files
     MHRViewerHandler.current_file = mhr_files[0] if mhr_files else None
-    MHRViewerHandler.mhr_data = MHRViewerHandler._load_mhr_file(mhr_files[0]) if mhr_files else None
+    MHRViewerHandler.mhr_data = (
+        MHRViewerHandler._fill_mesh(MHRViewerHandler._load_mhr_file(mhr_files[0]))
+        if mhr_files else None
+    )
     MHRViewerHandler.video_info = video_info
     MHRViewerHandler.base_folder = str(mhr_path) if mhr_path.is_dir() else str(mhr_path.parent)
 
@@ -2268,6 +2341,18 @@ def main():
         action="store_true",
         help="自动生成自签名证书 (需要cryptography库)",
     )
+    parser.add_argument(
+        "--checkpoint_path",
+        default="",
+        type=str,
+        help="SAM 3D Body模型检查点路径, 用于重建只保存了参数 (--store params) 的网格",
+    )
+    parser.add_argument(
+        "--mhr_path",
+        default="./checkpoints/sam-3d-body-dinov3/assets/mhr_model.pt",
+        type=str,
+        help="MHR资源路径",
+    )
 
     args = parser.parse_args()
 
@@ -2302,6 +2387,13 @@ def main():
             print(f"错误: 私钥文件不存在: {key_path}")
             return
 
+    if args.checkpoint_path:
+        from sam_3d_body import MeshRegenerator
+        print("正在加载MHR模型用于网格重建...")
+        MHRViewerHandler.regenerator = MeshRegenerator.from_checkpoint(
+            args.checkpoint_path, args.mhr_path
+        )
+
     start_server(mhr_path, args.port, use_ssl, str(cert_path) if cert_path else None, str(key_path) if key_path else None)
 
 